@@ -2,7 +2,9 @@ from persistence.driver_base_new import PersistenceDriverBase
 from loguru import logger
 import asyncio
 
-from habitica.habitica_service import HabiticaService, HabiticaUser
+from habitica.habitica_service import HabiticaService, HabiticaUserSummary
+from habitica.request_scheduler import Priority, with_priority
+from habitica.analytics import UserHistories, UserStats, compute_stats, WEEKDAYS
 from app.bank_service import BankService
 from app.app_user_service import AppUserService, AppUserNotFoundException
 import habitica.habitica_api
@@ -28,6 +30,7 @@ class AppService:
     ###############
     ## App Users ##
     ###############
+    @with_priority(Priority.INTERACTIVE)
     async def register_habitica_account(self, app_user_id, app_user_name, discord_channel, api_user, api_token):
         """
         Create a new AppUser if it doesnt exist. Register and link the Habitica user to the Discord channel id.
@@ -41,20 +44,21 @@ class AppService:
             app_user = self.app_user_service.create_app_user(app_user_id, app_user_name) 
 
         # Call Habitica for the User so we have a name to create the habitica user link with.
-        habitica_user = await self.habitica_service.get_user(api_user, api_token)
+        habitica_user = await self.habitica_service.get_user_summary(api_user, api_token)
         user_name = habitica_user.profile.name
         group_id = habitica_user.party._id
 
         # Register the Habitica User Link to the App User
         self.app_user_service.add_habitica_user_link(app_user.id, api_user, api_token, user_name, group_id)
     
+    @with_priority(Priority.INTERACTIVE)
     async def get_status_message(self, app_user_id):
         app_user_id = str(app_user_id)
         message = ""
         user_links = self.app_user_service.get_habitica_user_links(app_user_id=app_user_id)
-        habitica_users: list[HabiticaUser] = []
+        habitica_users: list[HabiticaUserSummary] = []
         for link in user_links:
-            habitica_users.append(await self.habitica_service.get_user(link.api_user, link.api_token))
+            habitica_users.append(await self.habitica_service.get_user_summary(link.api_user, link.api_token))
         
         message += f"Habitica Users\n"
         for user in habitica_users:
@@ -66,4 +70,33 @@ class AppService:
             message += f"    {owner}: {account.name} {account.account_type}: {account.balance}\n"
         return message
 
+    @with_priority(Priority.INTERACTIVE)
+    async def get_stats_message(self, app_user_id):
+        app_user_id = str(app_user_id)
+        user_links = self.app_user_service.get_habitica_user_links(app_user_id=app_user_id)
+        if not user_links:
+            return "No Habitica users registered."
+
+        async def load_histories(link):
+            user, tasks = await asyncio.gather(
+                self.habitica_service.get_user(link.api_user, link.api_token),
+                self.habitica_service.get_tasks(link.api_user, link.api_token),
+            )
+            return UserHistories.from_models(tasks, user)
+        histories = await asyncio.gather(*[load_histories(link) for link in user_links])
+        stats: list[UserStats] = compute_stats(histories)
 
+        def percent(value):
+            return "-" if value != value else f"{value:.0%}"
+
+        message = "Habitica Stats\n"
+        for link, user_stats in zip(user_links, stats):
+            message += f"    {link.name}: Dailies {percent(user_stats.completion_rate)} (30 days {percent(user_stats.recent_completion_rate)}, last 7 due {percent(user_stats.rolling_completion)})"
+            message += f" 🔥{user_stats.current_streak} (best {user_stats.longest_streak})"
+            message += f" Habits +{percent(user_stats.habit_up_ratio)}"
+            if user_stats.exp_per_day == user_stats.exp_per_day:
+                message += f" ⭐{user_stats.exp_per_day:.0f}/day"
+            message += "\n"
+            weekdays = [f"{day} {percent(rate)}" for day, rate in zip(WEEKDAYS, user_stats.weekday_completion)]
+            message += f"        {' '.join(weekdays)}\n"
+        return message
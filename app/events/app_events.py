@@ -6,4 +6,11 @@ class SendAccountStatus:
     discord_user_id: str
     discord_channel: str
     interaction: Interaction 
-    type = "send_account_status"
\ No newline at end of file
+    type = "send_account_status"
+
+@dataclass
+class SendAccountStats:
+    discord_user_id: str
+    discord_channel: str
+    interaction: Interaction
+    type = "send_account_stats"
\ No newline at end of file
@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from uuid import uuid4
 
 from discord import Interaction
 #################
@@ -50,7 +51,12 @@ class DepositGold:
     bank_account_id: str
     description: str
     interaction: Interaction
+    # Journaled with the event, so a replayed event skips the steps it already applied
+    transaction_id: str = field(default_factory=lambda: str(uuid4()))
     type = "deposit_gold"
+    partition_key = "bank_account_id"
+    # Not written to the event journal, replayed events have no interaction to answer
+    journal_exclude = ("interaction",)
 
 @dataclass
 class WithdrawGold:
@@ -59,7 +65,10 @@ class WithdrawGold:
     bank_account_id: str
     description: str
     interaction: Interaction
+    transaction_id: str = field(default_factory=lambda: str(uuid4()))
     type = "withdraw_gold"
+    partition_key = "bank_account_id"
+    journal_exclude = ("interaction",)
 
 @dataclass
 class ChargeBankPayment:
@@ -67,4 +76,5 @@ class ChargeBankPayment:
     bank_id: str
     bank_account_id: str
     transaction_id: str = ""
-    type = "charge_bank_payment"
\ No newline at end of file
+    type = "charge_bank_payment"
+    partition_key = "bank_account_id"
\ No newline at end of file
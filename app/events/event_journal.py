@@ -0,0 +1,202 @@
+import asyncio
+import dataclasses
+import json
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable
+from loguru import logger
+from app.metrics_service import MetricsRegistry, registry, COUNT_BUCKETS
+import config as cfg
+
+class EventJournalException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+        logger.error(args[0])
+
+@dataclasses.dataclass
+class JournalEntry:
+    "An event written to the journal that has not been marked complete yet."
+    seq: int
+    type: str
+    data: dict
+    replays: int = 0
+
+class EventJournal:
+    """
+    Append-only log of events whose handlers must not be lost half way, like bank events and gold changes.
+
+    post_event, or EventBus.publish for a queued event, appends an event of one of `event_classes` before its
+    handlers are called. post_event marks it complete once they have all finished, with the names of any that
+    failed. A failed handler has already dealt with its error, like telling the user a withdrawal was refused, so
+    its event is not run again. Only events whose handlers
+    were cut short, by a crash or a shutdown, are still incomplete when the process starts again. `replay`
+    dispatches those once more, in the order they were posted. Delivery is at least once, so handlers of journaled
+    events check the event's `transaction_id` for what was already done. `on_complete` is called with each event
+    once its complete record is on disk, so what was kept for a replay can be dropped.
+
+    Records are JSON lines, written and fsynced off the event loop. Records that arrive while an fsync is running,
+    or within `flush_window_seconds` of each other, go out together with the next single fsync, and every caller
+    waits for the fsync its record went out in.
+
+    Fields named in an event class's `journal_exclude`, like a Discord interaction, are not written and are
+    None when the event is replayed. An event still incomplete after `max_replays` replays is given up on.
+    """
+    def __init__(self, path: str | Path, event_classes: Iterable[type],
+                 flush_window_seconds: float = cfg.EVENT_JOURNAL_FLUSH_WINDOW_SECONDS,
+                 max_replays: int = cfg.EVENT_JOURNAL_MAX_REPLAYS,
+                 metrics: MetricsRegistry = None,
+                 on_complete: Callable[[object], None] = None) -> None:
+        self.path = Path(path)
+        self.classes: dict[str, type] = {cls.type: cls for cls in event_classes}
+        self.flush_window_seconds = flush_window_seconds
+        self.max_replays = max_replays
+        self.on_complete = on_complete
+        self.file = None
+        self.next_seq = 1
+        self.incomplete: dict[int, JournalEntry] = {}
+        self.buffer: list[tuple[str, asyncio.Future]] = []
+        self.flusher: asyncio.Task = None
+        self.fsyncs = 0
+        metrics = metrics or registry
+        self.fsync_seconds = metrics.histogram("event_journal_fsync_seconds", "Time to write and fsync a batch of journal records")
+        self.batch_size = metrics.histogram(
+            "event_journal_batch_size", "Journal records written with one fsync", buckets=COUNT_BUCKETS)
+
+    def wants(self, event) -> bool:
+        return event.type in self.classes
+
+    def open(self):
+        """
+        Read what an earlier run left, then rewrite the file with only the incomplete events so it doesn't grow
+        forever. A record cut short by a crash is skipped.
+        """
+        if self.file is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            with self.path.open("r") as fh:
+                for line in fh:
+                    try:
+                        self.read_record(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning(f"Skipped unreadable event journal record in {self.path}: {line[:100]!r}")
+        compacted = self.path.with_name(self.path.name + ".tmp")
+        with compacted.open("w") as fh:
+            # Keeps sequence numbers going up across restarts even when nothing is left incomplete
+            fh.write(json.dumps({"op": "open", "seq": self.next_seq - 1}) + "\n")
+            for entry in self.incomplete.values():
+                fh.write(self.append_record(entry.seq, entry.type, entry.data, entry.replays))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(compacted, self.path)
+        self.file = self.path.open("a")
+        if self.incomplete:
+            logger.warning(f"Event journal {self.path} has {len(self.incomplete)} incomplete events to replay")
+
+    def read_record(self, record: dict):
+        seq = record['seq']
+        self.next_seq = max(self.next_seq, seq + 1)
+        if record['op'] == "append":
+            self.incomplete[seq] = JournalEntry(seq, record['type'], record['data'], record.get('replays', 0))
+        elif record['op'] == "replay" and seq in self.incomplete:
+            self.incomplete[seq].replays += 1
+        elif record['op'] == "complete":
+            self.incomplete.pop(seq, None)
+
+    @staticmethod
+    def append_record(seq: int, type: str, data: dict, replays: int = 0) -> str:
+        return json.dumps({"op": "append", "seq": seq, "type": type, "data": data, "replays": replays}) + "\n"
+
+    def encode(self, event) -> dict:
+        exclude = getattr(event, "journal_exclude", ())
+        if dataclasses.is_dataclass(event):
+            return {field.name: getattr(event, field.name) for field in dataclasses.fields(event) if field.name not in exclude}
+        return {name: value for name, value in vars(event).items() if name not in exclude}
+
+    def decode(self, entry: JournalEntry):
+        cls = self.classes.get(entry.type)
+        if cls is None:
+            raise EventJournalException(f"Event journal has event type `{entry.type}` that is no longer journaled.")
+        return cls(**entry.data, **{name: None for name in getattr(cls, "journal_exclude", ())})
+
+    async def append(self, event) -> int:
+        "Write event to the journal and wait until it is on disk. Returns its sequence number."
+        if self.file is None:
+            raise EventJournalException(f"Event journal {self.path} is not open, could not journal `{event.type}`.")
+        seq = self.next_seq
+        self.next_seq += 1
+        await self.write(self.append_record(seq, event.type, self.encode(event)))
+        return seq
+
+    async def complete(self, seq: int, failed: Iterable[str] = (), event=None):
+        "Mark an event as handled, with the handlers that failed on it, so it isn't replayed."
+        await self.write(json.dumps({"op": "complete", "seq": seq, "failed": list(failed)}) + "\n")
+        if event is not None and self.on_complete is not None:
+            self.on_complete(event)
+
+    async def replay(self, dispatch: Callable[[object], Awaitable[list]]):
+        """
+        Dispatch every incomplete event from an earlier run, one at a time in the order they were first posted.
+        `dispatch` calls the handlers and returns dead letters for the ones that failed, like event_service.dispatch.
+        """
+        entries, self.incomplete = sorted(self.incomplete.values(), key=lambda entry: entry.seq), {}
+        for entry in entries:
+            try:
+                event = self.decode(entry)
+            except (TypeError, EventJournalException) as e:
+                logger.error(f"Could not rebuild journaled event `{entry.type}` #{entry.seq}: {e}")
+                await self.complete(entry.seq)
+                continue
+            if entry.replays >= self.max_replays:
+                logger.error(f"Giving up on journaled event `{entry.type}` #{entry.seq} after {entry.replays} replays: {entry.data}")
+                await self.complete(entry.seq, event=event)
+                continue
+            await self.write(json.dumps({"op": "replay", "seq": entry.seq}) + "\n")
+            logger.info(f"Replaying journaled event `{entry.type}` #{entry.seq}")
+            failed = await dispatch(event)
+            await self.complete(entry.seq, [dead_letter.handler for dead_letter in failed], event)
+
+    async def write(self, line: str):
+        future = asyncio.get_running_loop().create_future()
+        self.buffer.append((line, future))
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.run())
+        await future
+
+    async def run(self):
+        "Write out buffered records until none are left. Records that arrive during a write go out in the next one."
+        try:
+            while self.buffer:
+                await asyncio.sleep(self.flush_window_seconds)
+                batch, self.buffer = self.buffer, []
+                self.batch_size.observe(len(batch))
+                start = time.monotonic()
+                try:
+                    await asyncio.to_thread(self.sync, "".join(line for line, _ in batch))
+                except Exception as e:
+                    exception = EventJournalException(f"Could not write event journal {self.path}: {e}")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(exception)
+                    continue
+                self.fsync_seconds.observe(time.monotonic() - start)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            self.flusher = None
+
+    def sync(self, data: str):
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.fsyncs += 1
+
+    async def close(self):
+        "Wait for buffered records to be written, then close the file."
+        if self.flusher is not None:
+            await asyncio.gather(self.flusher, return_exceptions=True)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
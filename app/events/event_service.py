@@ -1,7 +1,17 @@
 import asyncio
-from asyncio.coroutines import iscoroutine
+import contextvars
+import math
+import zlib
+import inspect
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
 from loguru import logger
 from enum import Enum
+from app.metrics_service import registry
+from app.events.event_journal import EventJournal
+import config as cfg
 
 # TODO: Separate out the rest of the events into their own module
 
@@ -12,32 +22,375 @@ from enum import Enum
 class ReceiveHabiticaWebhookEvent:
     'Provides raw payload for a webhook'
     type = "receive_habitca_webhook_event"
+    partition_key = "api_user"
     def __init__(self, payload) -> None:
         self.payload = payload
+
+    @property
+    def api_user(self):
+        "Id of the Habitica user the webhook is about, so webhooks for one user are handled in order."
+        user = self.payload.get('user') if isinstance(self.payload, dict) else None
+        return user.get('_id') if isinstance(user, dict) else None
     
 
 ##################
 ### Event Logic ##
 ##################
 
-subscribers = {}
+handler_seconds = registry.histogram(
+    "event_handler_seconds", "Time spent in each event handler", ("event_type", "handler"))
+handler_calls = registry.counter(
+    "event_handler_calls_total", "Event handler calls by outcome: success, failure or timeout", ("event_type", "handler", "outcome"))
+
+class Handler:
+    "A subscribed function with its name and metric series, looked up once when it is subscribed."
+    def __init__(self, event_type: str, fcn: Callable) -> None:
+        self.fcn = fcn
+        self.name = getattr(fcn, "__qualname__", repr(fcn))
+        self.seconds = handler_seconds.labels(event_type=event_type, handler=self.name)
+        self.success = handler_calls.labels(event_type=event_type, handler=self.name, outcome="success")
+        self.failure = handler_calls.labels(event_type=event_type, handler=self.name, outcome="failure")
+        self.timeout = handler_calls.labels(event_type=event_type, handler=self.name, outcome="timeout")
+
+class Handlers:
+    """
+    The functions subscribed to one event type, in subscription order, split into sync functions and coroutine
+    functions when they are subscribed so posting an event doesn't have to inspect them.
+    """
+    def __init__(self, event_type: str) -> None:
+        self.event_type = event_type
+        # Insertion ordered, so this is an ordered set
+        self.functions: dict[Callable, Handler] = {}
+        self.sync: tuple[Handler, ...] = ()
+        self.coroutines: tuple[Handler, ...] = ()
+
+    def __contains__(self, fcn) -> bool:
+        return fcn in self.functions
+
+    def __len__(self) -> int:
+        return len(self.functions)
+
+    def __iter__(self):
+        return iter(self.functions)
+
+    def add(self, fcn):
+        self.functions[fcn] = Handler(self.event_type, fcn)
+        self.split()
+
+    def remove(self, fcn):
+        del self.functions[fcn]
+        self.split()
+
+    def split(self):
+        self.sync = tuple(handler for handler in self.functions.values() if not inspect.iscoroutinefunction(handler.fcn))
+        self.coroutines = tuple(handler for handler in self.functions.values() if inspect.iscoroutinefunction(handler.fcn))
+
+    def names(self) -> list[str]:
+        return [fcn.__name__ for fcn in self.functions]
+
+subscribers: dict[str, Handlers] = {}
 
 def subscribe(event_type: str, fcn):
-    if not event_type in subscribers:
-        subscribers[event_type] = []
-    if fcn not in subscribers[event_type]:
-        subscribers[event_type].append(fcn)
+    """
+    Call fcn with every event of event_type. Coroutine functions are told apart from sync functions here, so
+    handlers must be `async def` for their result to be awaited.
+    """
+    handlers = subscribers.get(event_type)
+    if handlers is None:
+        handlers = subscribers[event_type] = Handlers(event_type)
+    if fcn not in handlers:
+        handlers.add(fcn)
         logger.info(f"Registered `{event_type}` to function `{fcn.__name__}`")
 
-async def post_event(event):
-    if not event.type in subscribers:
-        logger.warning(f"Posted event type {event.type} but no subscribers")
+def unsubscribe(event_type: str, fcn):
+    "Stop calling fcn for event_type. Does nothing if it wasn't subscribed."
+    handlers = subscribers.get(event_type)
+    if handlers is None or fcn not in handlers:
         return
-    logger.info(f"Posted event type `{event.type}`, calling functions: `{[fcn.__name__ for fcn in subscribers[event.type]]}`")
-    # Can't gather non-coroutines, so call sync functions first, then gather async functions.
-    coroutines = []
-    for fcn in subscribers[event.type]:
-        return_val = fcn(event)
-        if iscoroutine(return_val):
-            coroutines.append(return_val)
-    await asyncio.gather(*coroutines)
\ No newline at end of file
+    handlers.remove(fcn)
+    if not handlers:
+        del subscribers[event_type]
+    logger.info(f"Unregistered `{event_type}` from function `{fcn.__name__}`")
+
+@dataclass
+class DeadLetter:
+    "An event one handler failed on or timed out handling. The other handlers still ran."
+    event: object
+    handler: str
+    outcome: str
+    exception: BaseException
+    at: float = field(default_factory=time.time)
+
+# The latest dead letters, newest last
+dead_letters: deque[DeadLetter] = deque(maxlen=cfg.EVENT_DEAD_LETTER_SIZE)
+
+def record_call(event, handler: Handler, start: float, exception: Exception = None) -> DeadLetter | None:
+    handler.seconds.observe(time.perf_counter() - start)
+    if exception is None:
+        handler.success.inc()
+        return None
+    if isinstance(exception, asyncio.TimeoutError):
+        outcome = "timeout"
+        handler.timeout.inc()
+    else:
+        outcome = "failure"
+        handler.failure.inc()
+    dead_letter = DeadLetter(event, handler.name, outcome, exception)
+    dead_letters.append(dead_letter)
+    logger.opt(exception=exception).error(f"Handler `{handler.name}` {outcome} on event `{event.type}`: {exception!r}")
+    return dead_letter
+
+def call_sync(handler: Handler, event) -> DeadLetter | None:
+    start = time.perf_counter()
+    try:
+        handler.fcn(event)
+    except Exception as e:
+        return record_call(event, handler, start, e)
+    return record_call(event, handler, start)
+
+async def call_async(handler: Handler, event, timeout: float) -> DeadLetter | None:
+    start = time.perf_counter()
+    try:
+        if hasattr(asyncio, "timeout"):
+            # Cancels the handler where it runs, wait_for would wrap every call in another task
+            async with asyncio.timeout(timeout):
+                await handler.fcn(event)
+        else:
+            await asyncio.wait_for(handler.fcn(event), timeout)
+    except Exception as e:
+        return record_call(event, handler, start, e)
+    return record_call(event, handler, start)
+
+async def call_unlimited(handler: Handler, event) -> DeadLetter | None:
+    "call_async without a timeout, which saves setting one up on every call when none is configured."
+    start = time.perf_counter()
+    try:
+        await handler.fcn(event)
+    except Exception as e:
+        return record_call(event, handler, start, e)
+    return record_call(event, handler, start)
+
+# Set to an open EventJournal to journal the event types it was given
+journal: EventJournal = None
+
+async def post_event(event, timeout: float = cfg.EVENT_HANDLER_TIMEOUT_SECONDS, seq: int = None) -> list[DeadLetter]:
+    """
+    Call every function subscribed to the event's type. A handler that raises, or takes longer than `timeout`
+    seconds, doesn't stop the others. It is recorded in dead_letters instead, and the dead letters for this event
+    are returned. Every call is timed and counted in the metrics registry, per event type and handler.
+
+    Events the journal wants are written to it first, and marked complete once every handler has finished, failed
+    or not. Only events whose handlers never finished are replayed. `seq` is for an event that was already
+    appended, like one queued on the event bus.
+    """
+    if seq is None and (journal is None or not journal.wants(event)):
+        return await dispatch(event, timeout)
+    if seq is None:
+        seq = await journal.append(event)
+    failed = await dispatch(event, timeout)
+    await journal.complete(seq, [dead_letter.handler for dead_letter in failed], event)
+    return failed
+
+async def dispatch(event, timeout: float = cfg.EVENT_HANDLER_TIMEOUT_SECONDS) -> list[DeadLetter]:
+    "post_event without the journal."
+    handlers = subscribers.get(event.type)
+    if handlers is None:
+        logger.warning(f"Posted event type {event.type} but no subscribers")
+        return []
+    logger.opt(lazy=True).debug("Posted event type `{}`, calling functions: `{}`", lambda: event.type, handlers.names)
+    # Sync functions are called first, then the coroutine functions are gathered.
+    results = [call_sync(handler, event) for handler in handlers.sync]
+    if timeout:
+        calls = [call_async(handler, event, timeout) for handler in handlers.coroutines]
+    else:
+        calls = [call_unlimited(handler, event) for handler in handlers.coroutines]
+    if len(calls) == 1:
+        results.append(await calls[0])
+    elif calls:
+        results.extend(await asyncio.gather(*calls))
+    return [result for result in results if result is not None]
+
+@dataclass
+class HandlerStats:
+    event_type: str
+    handler: str
+    success: int = 0
+    failure: int = 0
+    timeout: int = 0
+    seconds: float = 0
+    p95_seconds: float = None
+
+    @property
+    def calls(self) -> int:
+        return self.success + self.failure + self.timeout
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.calls if self.calls else 0
+
+def handler_stats() -> list[HandlerStats]:
+    "Calls, outcomes and time spent per (event type, handler) from the metrics registry, most time spent first."
+    stats: dict[tuple, HandlerStats] = {}
+    for (event_type, handler, outcome), count in handler_calls.snapshot().items():
+        row = stats.get((event_type, handler))
+        if row is None:
+            row = stats[(event_type, handler)] = HandlerStats(event_type, handler)
+        setattr(row, outcome, int(count))
+    for row in stats.values():
+        series = handler_seconds.get(event_type=row.event_type, handler=row.handler)
+        row.seconds = series.sum if series else 0
+        row.p95_seconds = handler_seconds.quantile(0.95, event_type=row.event_type, handler=row.handler)
+    return sorted(stats.values(), key=lambda row: row.seconds, reverse=True)
+
+###############
+## Event Bus ##
+###############
+
+class QueueFullException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+        logger.warning(args[0])
+
+class EventBusClosedException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+        logger.warning(args[0])
+
+def partition(event):
+    """
+    The value of the attribute named by the event's `partition_key`, like `bank_account_id` or `api_user`.
+    None for event types without one, or when the event has no value for it.
+    """
+    key = getattr(event, "partition_key", None)
+    return getattr(event, key, None) if key else None
+
+class EventBus:
+    """
+    Bounded queues of events dispatched by a fixed pool of workers, for events coming in from outside like
+    Discord commands and webhooks. A full queue makes publishers wait, or fail fast with `wait=False`, instead
+    of piling up tasks. Events are dispatched in the context they were published in, so contextvars like the
+    request priority carry over.
+
+    Every worker serves its own lane, one event at a time. Events whose type declares a `partition_key` are
+    hashed onto a lane by its value, so events for the same account or user are handled one after another in the
+    order they were published, while other keys run in parallel on the other lanes. Events without a key go to
+    the lane with the fewest events queued or being handled, taking turns between lanes that tie so an idle
+    worker picks them up. `max_queue_size` is split evenly between the lanes.
+
+    Events the journal wants are appended to it before they are queued, so once publish returns they are on disk
+    and are replayed if the process dies with them still queued. An event that is then rejected is marked complete.
+
+    Handlers should keep using post_event for the events they post, a worker waiting on its own full lane
+    would never get to empty it.
+    """
+    def __init__(self, workers: int = cfg.EVENT_BUS_WORKERS, max_queue_size: int = cfg.EVENT_BUS_QUEUE_SIZE) -> None:
+        self.worker_count = workers
+        self.max_queue_size = max_queue_size
+        self.lane_size = max(1, math.ceil(max_queue_size / workers))
+        self.lanes: list[asyncio.Queue] = []
+        # 1 while a lane's worker is handling an event, which its queue no longer counts
+        self.in_flight: list[int] = []
+        self.next_lane = 0
+        self.workers: list[asyncio.Task] = []
+        self.accepting = False
+        self.published = 0
+        self.rejected = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self.workers)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(lane.qsize() for lane in self.lanes)
+
+    def lane(self, event) -> asyncio.Queue:
+        key = partition(event)
+        if key is None:
+            count = len(self.lanes)
+            # min keeps the first of the lanes that tie, so starting after the last pick takes turns between them
+            order = [(self.next_lane + offset) % count for offset in range(count)]
+            index = min(order, key=lambda i: self.lanes[i].qsize() + self.in_flight[i])
+            self.next_lane = (index + 1) % count
+            return self.lanes[index]
+        return self.lanes[zlib.crc32(str(key).encode()) % len(self.lanes)]
+
+    async def start(self):
+        if self.running:
+            return
+        self.lanes = [asyncio.Queue(self.lane_size) for _ in range(self.worker_count)]
+        self.in_flight = [0] * self.worker_count
+        self.workers = [asyncio.create_task(self.work(i), name=f"event-bus-worker-{i}") for i in range(self.worker_count)]
+        self.accepting = True
+        logger.info(f"Event bus started with {self.worker_count} lanes with room for {self.lane_size} events each")
+
+    async def publish(self, event, wait: bool = True, timeout: float = None):
+        """
+        Queue event on its lane for dispatch. With `wait` a full lane blocks until there is room, or until
+        `timeout` seconds have passed. Without it, or once the timeout passes, QueueFullException is raised.
+        """
+        if not self.accepting:
+            raise EventBusClosedException(f"Event bus is not accepting events, dropped `{event.type}`")
+        lane = self.lane(event)
+        seq = None
+        if journal is not None and journal.wants(event):
+            if not wait and lane.full():
+                self.rejected += 1
+                raise QueueFullException(f"Event queue is full ({self.lane_size}), rejected `{event.type}`")
+            seq = await journal.append(event)
+        item = (event, contextvars.copy_context(), seq)
+        try:
+            if not wait:
+                lane.put_nowait(item)
+            elif timeout is None:
+                await lane.put(item)
+            else:
+                await asyncio.wait_for(lane.put(item), timeout)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.rejected += 1
+            if seq is not None:
+                # The publisher is told it was rejected, so it must not be replayed either
+                await journal.complete(seq, ["EventBus.publish"], event)
+            raise QueueFullException(f"Event queue is full ({self.lane_size}), rejected `{event.type}`")
+        self.published += 1
+
+    async def work(self, index: int):
+        loop = asyncio.get_running_loop()
+        lane = self.lanes[index]
+        while True:
+            event, context, seq = await lane.get()
+            self.in_flight[index] = 1
+            try:
+                if await context.run(loop.create_task, post_event(event, seq=seq)):
+                    self.failed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Handling event `{event.type}` failed")
+            finally:
+                self.in_flight[index] = 0
+                lane.task_done()
+
+    async def drain(self, timeout: float = cfg.EVENT_BUS_DRAIN_TIMEOUT_SECONDS):
+        "Stop accepting events, wait up to `timeout` seconds for queued events to finish, then stop the workers."
+        if not self.running:
+            return
+        self.accepting = False
+        try:
+            await asyncio.wait_for(asyncio.gather(*[lane.join() for lane in self.lanes]), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Event bus drain timed out with {self.queue_depth} events still queued")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        logger.info("Event bus drained")
+
+bus = EventBus()
+
+async def publish(event, wait: bool = True, timeout: float = None):
+    "Queue event on the event bus. If the bus was never started, the event is dispatched right away like post_event."
+    if bus.lanes:
+        await bus.publish(event, wait, timeout)
+    else:
+        await post_event(event)
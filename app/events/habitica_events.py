@@ -53,9 +53,9 @@ class TaskWebhookSubscriptionEvent:
     def __init__(self,
                 api_user,
                 api_token,
-                created: bool = False,
-                updated: bool = False,
-                deleted: bool = False,
+                created: bool = True,
+                updated: bool = True,
+                deleted: bool = True,
                 checklistScored: bool = False,
                 scored: bool = True
             ) -> None:
@@ -4,14 +4,16 @@ from app.app_user_service import AppUserService, UserMapNotFoundException
 from habitica.habitica_service import HabiticaService
 from app.events.event_service import post_event, subscribe
 from app.events.discord_events import SendDiscordMessage
-from app.transaction_service import ledger
+from app.transaction_service import ledger, AppliedTransactions
 
 
 class BankEventHandlers:
-    def __init__(self, bank_service: BankService, app_user_service: AppUserService, habitica_service: HabiticaService) -> None:
+    def __init__(self, bank_service: BankService, app_user_service: AppUserService, habitica_service: HabiticaService,
+                 applied_transactions: AppliedTransactions = None) -> None:
         self.bank_service = bank_service
         self.app_user_service = app_user_service
         self.habitica_service = habitica_service
+        self.applied_transactions = applied_transactions
         subscribe(bank_events.CreateBank.type, self.handle_create_bank_event)
         subscribe(bank_events.WithdrawGold.type, self.handle_bank_withdraw)
 
@@ -30,10 +32,14 @@ class BankEventHandlers:
             bank_account = self.bank_service.get_account(event.bank_id, bank_account_id=event.bank_account_id)
             habitica_user = self.app_user_service.get_habitica_user_link(habitica_user_id=bank_account.habitica_user_id)
 
-            # Create transaction and initiate withdrawal.
-            async with ledger as transaction:
-                self.bank_service.withdraw(event.amount, event.bank_account_id, event.bank_id)
-                await self.habitica_service.add_user_gold(api_user=habitica_user.api_user, api_token=habitica_user.api_token, amount=event.amount)
+            # Create transaction and initiate withdrawal. A replayed event whose transaction already committed is skipped.
+            applied_transactions = self.applied_transactions
+            if not (applied_transactions and applied_transactions.applied(event.transaction_id)):
+                async with ledger as transaction:
+                    self.bank_service.withdraw(event.amount, event.bank_account_id, event.bank_id)
+                    await self.habitica_service.add_user_gold(api_user=habitica_user.api_user, api_token=habitica_user.api_token, amount=event.amount)
+                if applied_transactions:
+                    applied_transactions.mark_applied(event.transaction_id)
             await post_event(SendDiscordMessage(message=f"🪙 Withdrew {abs(event.amount)} GP from account {bank_account.name}. New balance is {bank_account.balance}", interaction=event.interaction, ephemeral=True))
         except Exception as e:
             await post_event(SendDiscordMessage(message=f"⛔ Failed to withdraw '{event.amount}' from bank account '{bank_account.name}'. Error: {e}", interaction=event.interaction, ephemeral=True))
@@ -45,10 +51,14 @@ class BankEventHandlers:
             bank_account = self.bank_service.get_account(event.bank_id, bank_account_id=event.bank_account_id)
             habitica_user = self.app_user_service.get_habitica_user_link(habitica_user_id=bank_account.habitica_user_id)
 
-            # Create transaction and initiate withdrawal.
-            async with ledger:
-                self.bank_service.withdraw(event.amount, event.bank_account_id, event.bank_id)
-                await self.habitica_service.add_user_gold(api_user=habitica_user.api_user, api_token=habitica_user.api_token, amount=event.amount)
+            # Create transaction and initiate withdrawal. A replayed event whose transaction already committed is skipped.
+            applied_transactions = self.applied_transactions
+            if not (applied_transactions and applied_transactions.applied(event.transaction_id)):
+                async with ledger:
+                    self.bank_service.withdraw(event.amount, event.bank_account_id, event.bank_id)
+                    await self.habitica_service.add_user_gold(api_user=habitica_user.api_user, api_token=habitica_user.api_token, amount=event.amount)
+                if applied_transactions:
+                    applied_transactions.mark_applied(event.transaction_id)
             await post_event(SendDiscordMessage(message=f"🪙 Deposited {abs(event.amount)} GP into account {bank_account.name}. New balance is {bank_account.balance}", interaction=event.interaction, ephemeral=True))
         except Exception as e:
             await post_event(SendDiscordMessage(message=f"⛔ Failed to deposit '{event.amount}' from bank account '{bank_account.name}'. Error: {e}", interaction=event.interaction, ephemeral=True))
@@ -0,0 +1,197 @@
+import bisect
+import threading
+from typing import Iterable
+
+# Seconds. Habitica usually answers in 100-500ms, the tail goes up to the client timeout.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bytes. A full user document is around 100KB.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+# Items, for queue depths and batch sizes
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+def format_labels(labelnames: tuple, labels: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    type = "untyped"
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def label_values(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+class Counter(Metric):
+    type = "counter"
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.label_values(labels), 0)
+
+    def labels(self, **labels) -> "BoundCounter":
+        "The series for one label set, for callers that count the same labels over and over."
+        return BoundCounter(self, self.label_values(labels))
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+    def snapshot(self) -> dict:
+        return {labels: value for labels, value in self.values.items()}
+
+class BoundCounter:
+    def __init__(self, counter: Counter, key: tuple) -> None:
+        self.counter = counter
+        self.key = key
+
+    def inc(self, amount: float = 1):
+        counter = self.counter
+        with counter.lock:
+            counter.values[self.key] = counter.values.get(self.key, 0) + amount
+
+class Gauge(Counter):
+    "A value that goes up and down, like a queue depth."
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class HistogramSeries:
+    def __init__(self, bucket_count: int) -> None:
+        self.buckets = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+
+class Histogram(Metric):
+    "Cumulative bucket counts, sum and count per label set, like a Prometheus histogram."
+    type = "histogram"
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self.series: dict[tuple, HistogramSeries] = {}
+
+    def observe(self, value: float, **labels):
+        key = self.label_values(labels)
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = HistogramSeries(len(self.bounds) + 1)
+            series.buckets[index] += 1
+            series.count += 1
+            series.sum += value
+
+    def get(self, **labels) -> HistogramSeries | None:
+        return self.series.get(self.label_values(labels))
+
+    def labels(self, **labels) -> "BoundHistogram":
+        "The series for one label set, for callers that observe the same labels over and over."
+        key = self.label_values(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = HistogramSeries(len(self.bounds) + 1)
+        return BoundHistogram(self, series)
+
+    def quantile(self, q: float, **labels) -> float | None:
+        "Upper bound of the bucket holding the q-th quantile. None if nothing was observed."
+        series = self.get(**labels)
+        if not series or not series.count:
+            return None
+        rank = q * series.count
+        seen = 0
+        for bound, count in zip(self.bounds + (float("inf"),), series.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), series.buckets):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {series.sum}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {series.count}")
+        return lines
+
+    def snapshot(self) -> dict:
+        return {labels: {"count": series.count, "sum": series.sum} for labels, series in self.series.items()}
+
+class BoundHistogram:
+    def __init__(self, histogram: Histogram, series: HistogramSeries) -> None:
+        self.histogram = histogram
+        self.series = series
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.histogram.bounds, value)
+        series = self.series
+        with self.histogram.lock:
+            series.buckets[index] += 1
+            series.count += 1
+            series.sum += value
+
+class MetricsRegistry:
+    """
+    In-process registry of counters, gauges and histograms, rendered in the Prometheus text format by the `/metrics`
+    route on webhook_fastapi_app. Asking for a metric that is already registered returns the existing one.
+    """
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric_class: type, name: str, help: str, labelnames: Iterable[str] = (), **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(name, help, labelnames, **kwargs)
+            elif type(metric) is not metric_class:
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+# Shared registry for the whole process
+registry = MetricsRegistry()
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, asdict, field
-from dacite import from_dict
+from app.model.loader import ModelLoader
 from loguru import logger
 
 # TODO: Create an app_user_service and move all methods to that (from here and app_service)
@@ -40,4 +40,6 @@ class AppUser:
     
     @staticmethod
     def load(model):
-        return from_dict(AppUser, model)
\ No newline at end of file
+        return load_app_user(model)
+
+load_app_user = ModelLoader(AppUser)
\ No newline at end of file
@@ -1,8 +1,8 @@
 # Habitica Bank
 from dataclasses import dataclass, asdict, field
 from datetime import date
-import dacite
 from dacite import Config
+from app.model.loader import ModelLoader
 from app.transaction_service import TransactableAttribute
 @dataclass
 class BankLoanAccount:
@@ -56,10 +56,10 @@ class Bank:
 
     @staticmethod
     def load(model: dict):
-        
-        def transform_balance(value):
-            return TransactableAttribute(value)
-        
-        config = Config(type_hooks={TransactableAttribute: transform_balance})
-        bank: Bank =  dacite.from_dict(Bank, model, config=config)
+        bank: Bank = load_bank(model)
         return bank
+
+def transform_balance(value):
+    return TransactableAttribute(value)
+
+load_bank = ModelLoader(Bank, Config(type_hooks={TransactableAttribute: transform_balance}))
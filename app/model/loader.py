@@ -0,0 +1,263 @@
+"""
+Compiled dataclass loaders with the same results as `dacite.from_dict`.
+
+dacite looks up type hints, fields and union members on every call. ModelLoader does that once per dataclass,
+on first use, and generates a plain Python function for it, so loading is just dict lookups, isinstance checks
+and the dataclass constructor. Errors are raised by dacite itself, so they match dacite's exactly.
+
+The compiler is built on dacite internals, which any dacite release can change. If they can't be imported,
+or compiling a dataclass fails, loaders log a warning and call `dacite.from_dict` instead.
+"""
+from dataclasses import MISSING, is_dataclass
+from typing import Any, Callable, Collection, Generic, Mapping, Type, TypeVar
+from loguru import logger
+import dacite
+from dacite import Config, DaciteError, UnionMatchError
+try:
+    from dacite.core import _build_value
+    from dacite.dataclasses import get_fields, is_frozen
+    from dacite.generics import get_concrete_type_hints, orig
+    from dacite.types import (
+        extract_generic,
+        extract_origin_collection,
+        is_generic_collection,
+        is_instance,
+        is_optional,
+        is_subclass,
+        is_union,
+    )
+    COMPILER_AVAILABLE = True
+except ImportError as e:
+    COMPILER_AVAILABLE = False
+    logger.warning(f"Compiled model loaders are unavailable with this dacite version ({e}), using dacite.from_dict")
+
+T = TypeVar("T")
+
+# Builds a value for a type from raw data. None means the raw data is used as it is.
+Builder = Callable[[Any], Any] | None
+# Checks a built value against a type, like dacite.types.is_instance. None means anything matches.
+Checker = Callable[[Any], bool] | None
+
+class LoaderCompiler:
+    "Compiles builders and checkers for one dacite Config. Compiled dataclasses are shared by every loader using it."
+    def __init__(self, config: Config = None) -> None:
+        self.config = config or Config()
+        self.dataclass_loaders: dict[type, Callable[[Mapping], Any]] = {}
+
+    def checker(self, type_) -> Checker:
+        if type_ is Any:
+            return None
+        if type_ in (float, complex):
+            # The numeric tower, as in PEP 484
+            return lambda value: isinstance(value, (int, float)) or isinstance(value, type_)
+        if isinstance(type_, type) and not is_generic_collection(type_):
+            return lambda value: isinstance(value, type_)
+        if is_union(type_):
+            checkers = [self.checker(member) for member in extract_generic(type_)]
+            if None in checkers:
+                return None
+            return lambda value: any(check(value) for check in checkers)
+        if is_generic_collection(type_) and not is_subclass(type_, tuple):
+            origin = extract_origin_collection(type_)
+            if not extract_generic(type_):
+                return lambda value: isinstance(value, origin)
+            if is_subclass(type_, Mapping):
+                key_type, value_type = extract_generic(type_, defaults=(Any, Any))
+                check_key = self.checker(key_type) or (lambda key: True)
+                check_value = self.checker(value_type) or (lambda value: True)
+                def check_mapping(value):
+                    if not isinstance(value, origin):
+                        return False
+                    if isinstance(value, Mapping):
+                        return all(check_key(k) and check_value(v) for k, v in value.items())
+                    return all(check_key(item) for item in value)
+                return check_mapping
+            check_item = self.checker(extract_generic(type_, defaults=(Any,))[0])
+            if check_item is None:
+                return lambda value: isinstance(value, origin)
+            return lambda value: isinstance(value, origin) and all(check_item(item) for item in value)
+        # Literals, NewTypes, tuples and the like are rare enough to leave to dacite
+        return lambda value: is_instance(value, type_)
+
+    def builder(self, type_) -> Builder:
+        "Compiled equivalent of dacite.core._build_value for type_."
+        config = self.config
+        if is_union(type_):
+            build = self.union_builder(type_)
+        elif is_generic_collection(type_):
+            build = self.collection_builder(type_)
+        elif is_dataclass(orig(type_)):
+            load = self.dataclass_loader(type_)
+            build = lambda data: load(data) if isinstance(data, Mapping) else data
+        elif isinstance(type_, type) or type_ is Any:
+            build = None
+        else:
+            return lambda data: _build_value(type_, data, config)
+
+        for cast_type in config.cast:
+            if is_subclass(type_, cast_type):
+                cast = extract_origin_collection(type_) if is_generic_collection(type_) else type_
+                build = self.chain(build, cast)
+                break
+        # Same order as dacite: the type hook sees the raw data, then None passes through Optional types
+        if is_optional(type_) and build is not None:
+            build = self.none_passes(build)
+        hook = config.type_hooks.get(type_)
+        if hook:
+            build = self.chain(hook, build)
+        return build
+
+    @staticmethod
+    def chain(first: Builder, second: Builder) -> Builder:
+        if first is None or second is None:
+            return first or second
+        return lambda data: second(first(data))
+
+    @staticmethod
+    def none_passes(build: Callable) -> Callable:
+        return lambda data: None if data is None else build(data)
+
+    def union_builder(self, union) -> Builder:
+        members = extract_generic(union)
+        if is_optional(union) and len(members) == 2:
+            return self.builder(members[0])
+        candidates = [(self.builder(member), self.checker(member)) for member in members]
+        check_types = self.config.check_types
+        def build_union(data):
+            for build, check in candidates:
+                try:
+                    value = build(data) if build else data
+                except Exception:
+                    continue
+                if check is None or check(value):
+                    return value
+            if not check_types:
+                return data
+            raise UnionMatchError(field_type=union, value=data)
+        return build_union
+
+    def collection_builder(self, collection) -> Builder:
+        if is_subclass(collection, tuple):
+            config = self.config
+            return lambda data: _build_value(collection, data, config)
+        is_mapping = is_subclass(collection, Mapping)
+        is_collection = is_subclass(collection, Collection)
+        build_value = self.builder(extract_generic(collection, defaults=(Any, Any))[1]) if is_mapping else None
+        build_item = self.builder(extract_generic(collection, defaults=(Any,))[0])
+        def build_collection(data):
+            data_type = data.__class__
+            if is_mapping and isinstance(data, Mapping):
+                if build_value is None:
+                    return data_type(data.items())
+                return data_type((key, build_value(value)) for key, value in data.items())
+            if is_collection and isinstance(data, Collection):
+                if build_item is None:
+                    return data_type(item for item in data)
+                if data_type is list:
+                    return [build_item(item) for item in data]
+                return data_type(build_item(item) for item in data)
+            return data
+        return build_collection
+
+    def dataclass_loader(self, data_class) -> Callable[[Mapping], Any]:
+        if data_class in self.dataclass_loaders:
+            return self.dataclass_loaders[data_class]
+        # Stand in for self references until the real loader is compiled
+        self.dataclass_loaders[data_class] = lambda data: self.dataclass_loaders[data_class](data)
+        load = self.compile_dataclass(data_class)
+        self.dataclass_loaders[data_class] = load
+        return load
+
+    def compile_dataclass(self, data_class) -> Callable[[Mapping], Any]:
+        """
+        Generates the source of a loader for data_class, with one branch per field, and execs it.
+        Fields with plain class types get an inline isinstance check, others call their compiled checker.
+        """
+        config = self.config
+        hints = get_concrete_type_hints(data_class, localns=config.hashable_forward_references)
+        namespace = {
+            "data_class": data_class,
+            "MISSING": MISSING,
+            "MissingValueError": dacite.MissingValueError,
+            "WrongTypeError": dacite.WrongTypeError,
+        }
+        lines = ["def load(data):"]
+        init_args = []
+        post_init = []
+        for i, field in enumerate(get_fields(data_class)):
+            field_type = hints[field.name]
+            key = config.convert_key(field.name)
+            build = self.builder(field_type)
+            check = self.checker(field_type) if config.check_types else None
+            namespace.update({f"key{i}": key, f"type{i}": field_type, f"build{i}": build, f"check{i}": check})
+            lines.append(f"    if key{i} in data:")
+            lines.append(f"        value = data[key{i}]" if build is None else f"        value = build{i}(data[key{i}])")
+            if check is not None:
+                if isinstance(field_type, type) and not is_generic_collection(field_type) and field_type not in (float, complex):
+                    lines.append(f"        if not isinstance(value, type{i}):")
+                else:
+                    lines.append(f"        if not check{i}(value):")
+                lines.append(f"            raise WrongTypeError(field_path={field.name!r}, field_type=type{i}, value=value)")
+            lines.append(f"        field{i} = value")
+            lines.append("    else:")
+            if field.default is not MISSING:
+                namespace[f"default{i}"] = field.default
+                lines.append(f"        field{i} = default{i}")
+            elif field.default_factory is not MISSING:
+                namespace[f"factory{i}"] = field.default_factory
+                lines.append(f"        field{i} = factory{i}()")
+            elif is_optional(field_type):
+                lines.append(f"        field{i} = None")
+            elif field.init:
+                lines.append(f"        raise MissingValueError({field.name!r})")
+            else:
+                lines.append(f"        field{i} = MISSING")
+            if field.init:
+                init_args.append(f"{field.name}=field{i}")
+            elif not is_frozen(data_class):
+                post_init.append((field.name, i))
+        lines.append(f"    instance = data_class({', '.join(init_args)})")
+        for name, i in post_init:
+            lines.append(f"    if field{i} is not MISSING:")
+            lines.append(f"        instance.{name} = field{i}")
+        lines.append("    return instance")
+        exec("\n".join(lines), namespace)
+        return namespace["load"]
+
+default_compiler = LoaderCompiler()
+
+class ModelLoader(Generic[T]):
+    """
+    Drop-in replacement for `dacite.from_dict(data_class, data, config)`.
+
+    The loader is compiled on the first call and reused after. If loading fails, dacite repeats the load
+    so the caller gets dacite's own exception and error path.
+    """
+    def __init__(self, data_class: Type[T], config: Config = None) -> None:
+        self.data_class = data_class
+        self.config = config
+        self.load: Callable[[Mapping], T] = None
+
+    def compile(self) -> Callable[[Mapping], T]:
+        if self.load is None:
+            if not COMPILER_AVAILABLE or (self.config is not None and (self.config.strict or self.config.strict_unions_match)):
+                # Strict modes aren't worth compiling, nothing in this repo uses them
+                self.load = self.from_dict
+                return self.load
+            compiler = default_compiler if self.config is None else LoaderCompiler(self.config)
+            try:
+                self.load = compiler.dataclass_loader(self.data_class)
+            except (AttributeError, TypeError) as e:
+                logger.warning(f"Could not compile a loader for {self.data_class.__name__} ({e!r}), using dacite.from_dict")
+                self.load = self.from_dict
+        return self.load
+
+    def from_dict(self, data: Mapping) -> T:
+        return dacite.from_dict(self.data_class, data, self.config)
+
+    def __call__(self, data: Mapping) -> T:
+        load = self.load or self.compile()
+        try:
+            return load(data)
+        except DaciteError:
+            return self.from_dict(data)
@@ -1,4 +1,4 @@
-from typing import Any, Callable
+from typing import Any, Callable, Iterable
 from typing_extensions import SupportsIndex
 from loguru import logger
 from uuid import uuid4
@@ -6,6 +6,7 @@ from dataclasses import dataclass, field
 from app.utils import match_all_in_list, ensure_one
 from datetime import datetime, timezone
 from contextvars import ContextVar
+from persistence.driver_base_new import PersistenceDriverBase
 
 current_transaction_id = ContextVar('transaction',default=None)
 
@@ -96,6 +97,42 @@ class OperationLedger:
 ledger = OperationLedger()
 
 
+class AppliedTransactions:
+    """
+    Ids of transactions whose journaled event was handled but not marked complete in the event journal yet, kept in
+    the TRANSACTION store. Handlers of journaled events check it, so an event replayed after a crash doesn't move the
+    same gold twice. Only used with the event journal, which calls `forget` once it has completed the event.
+    Events without a transaction id are never skipped.
+    """
+    def __init__(self, persistence_driver: PersistenceDriverBase) -> None:
+        self.driver = persistence_driver
+        self.store = self.driver.stores.TRANSACTION
+        self.ids: set[str] = set(self.driver.list(self.store))
+
+    def applied(self, transaction_id: str) -> bool:
+        return bool(transaction_id) and transaction_id in self.ids
+
+    def mark_applied(self, transaction_id: str):
+        "Call once the transaction committed."
+        if not transaction_id:
+            return
+        self.ids.add(transaction_id)
+        self.driver.update(self.store, {'id': transaction_id, 'applied': datetime.now(tz=timezone.utc).isoformat()})
+
+    def forget(self, event):
+        "Drop the event's transaction, it won't be replayed again."
+        transaction_id = getattr(event, "transaction_id", "")
+        if transaction_id in self.ids:
+            self.ids.discard(transaction_id)
+            self.driver.delete(self.store, transaction_id)
+
+    def prune(self, keep: Iterable[str]):
+        "Drop every transaction not in keep, like the ones a crash left behind after their events completed."
+        for transaction_id in self.ids - set(keep):
+            self.ids.discard(transaction_id)
+            self.driver.delete(self.store, transaction_id)
+
+
 class TransactableAttribute(int):
     def __set_name__(self, owner, name):
         self.public_name = name
@@ -1,12 +1,15 @@
 # Standalone FastAPI server that submits events with webhook payloads.
 
 from fastapi import FastAPI, Response, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.background import BackgroundTasks
 import json
 from pathlib import Path
 import uvicorn
 from loguru import logger
-from app.events.event_service import post_event, ReceiveHabiticaWebhookEvent, subscribe
+from app.events.event_journal import EventJournalException
+from app.events.event_service import publish, bus, ReceiveHabiticaWebhookEvent, QueueFullException, EventBusClosedException, subscribe
+from app.metrics_service import registry
 
 webhook_fastapi_app = FastAPI()
 
@@ -14,13 +17,26 @@ webhook_fastapi_app = FastAPI()
 @webhook_fastapi_app.post('/webhook')
 async def receive_webhook(data: Request, background_tasks: BackgroundTasks):
     data = await data.json()
-    background_tasks.add_task(capture_webhook,data=data)
+    if bus.running:
+        # Queue it right away, so Habitica sees a 503 instead of the bot piling up work it can't keep up with.
+        # With the event journal on, the webhook is on disk before it is acknowledged.
+        try:
+            await capture_webhook(data, wait=False)
+        except (QueueFullException, EventBusClosedException, EventJournalException):
+            return Response(status_code=503)
+    else:
+        background_tasks.add_task(capture_webhook,data=data)
     return Response(status_code=202)
 
+# Expose metrics in the Prometheus text format
+@webhook_fastapi_app.get('/metrics')
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Emit webhook event
-async def capture_webhook(data):
+async def capture_webhook(data, wait: bool = True):
     if "webhookType" in data:
-        await post_event(ReceiveHabiticaWebhookEvent(data))
+        await publish(ReceiveHabiticaWebhookEvent(data), wait=wait)
     else:
         logger.warning("Invalid webhook received")
 
@@ -10,7 +10,39 @@ ENVIRONMENT = os.getenv("ENVIRONMENT") or "DEV"
 HABITICA_API_BASE_URL = os.getenv("HABITICA_BASE_URL") or "https://habitica.com/api/v3"
 SERVER_PORT = os.getenv("SERVER_PORT") or 8952
 STORE_DIR = os.getenv("STORE_DIR") or "store"
-HABITICA_API_CIRCUIT_BREAKER_COUNT = 30 # How many calls can be made in a 5 second period.
+HABITICA_API_USER_RATE_LIMIT = int(os.getenv("HABITICA_API_USER_RATE_LIMIT") or 30) # Calls a single api_user can make per rate limit window.
+HABITICA_API_GLOBAL_RATE_LIMIT = int(os.getenv("HABITICA_API_GLOBAL_RATE_LIMIT") or 120) # Calls all api_users combined can make per rate limit window.
+HABITICA_API_RATE_LIMIT_WINDOW_SECONDS = float(os.getenv("HABITICA_API_RATE_LIMIT_WINDOW_SECONDS") or 60)
+HABITICA_API_RATE_LIMIT_RESERVE = int(os.getenv("HABITICA_API_RATE_LIMIT_RESERVE") or 3) # Start pacing calls when Habitica reports this many calls left.
+HABITICA_API_RATE_LIMIT_MARGIN_SECONDS = float(os.getenv("HABITICA_API_RATE_LIMIT_MARGIN_SECONDS") or 1) # Added to Habitica's reset time, which only has whole seconds.
+HABITICA_API_MAX_CONCURRENCY = int(os.getenv("HABITICA_API_MAX_CONCURRENCY") or 10) # Habitica calls in flight at once, all priority classes combined.
+HABITICA_API_INTERACTIVE_CONCURRENCY = int(os.getenv("HABITICA_API_INTERACTIVE_CONCURRENCY") or 10) # Cap for calls made for Discord commands.
+HABITICA_API_NORMAL_CONCURRENCY = int(os.getenv("HABITICA_API_NORMAL_CONCURRENCY") or 6)
+HABITICA_API_BACKGROUND_CONCURRENCY = int(os.getenv("HABITICA_API_BACKGROUND_CONCURRENCY") or 2) # Cap for bulk work like webhook provisioning.
+HABITICA_API_RETRY_MAX_ATTEMPTS = int(os.getenv("HABITICA_API_RETRY_MAX_ATTEMPTS") or 4) # Attempts for idempotent calls, including the first.
+HABITICA_API_RETRY_BASE_DELAY_SECONDS = float(os.getenv("HABITICA_API_RETRY_BASE_DELAY_SECONDS") or 0.5)
+HABITICA_API_RETRY_MAX_DELAY_SECONDS = float(os.getenv("HABITICA_API_RETRY_MAX_DELAY_SECONDS") or 8)
+HABITICA_API_RETRY_MAX_ELAPSED_SECONDS = float(os.getenv("HABITICA_API_RETRY_MAX_ELAPSED_SECONDS") or 20) # Give up retrying once this much time has passed.
+HABITICA_USER_CACHE_TTL_SECONDS = float(os.getenv("HABITICA_USER_CACHE_TTL_SECONDS") or 30) # How long a fetched Habitica user is reused without revalidating.
+HABITICA_GOLD_FLUSH_WINDOW_SECONDS = float(os.getenv("HABITICA_GOLD_FLUSH_WINDOW_SECONDS") or 0.05) # Gold changes for a user within this window are written to Habitica together.
+HABITICA_GOLD_VERIFY_WITH_GET = (os.getenv("HABITICA_GOLD_VERIFY_WITH_GET") or "false").lower() == "true" # Paranoid mode: fetch the user again after writing gold instead of trusting the PUT response.
+HABITICA_WEBHOOK_RECONCILE_CONCURRENCY = int(os.getenv("HABITICA_WEBHOOK_RECONCILE_CONCURRENCY") or 4) # Webhook create, update and delete calls in flight at once.
+HABITICA_WEBHOOK_SWEEP_CONCURRENCY = int(os.getenv("HABITICA_WEBHOOK_SWEEP_CONCURRENCY") or 4) # Users reconciled at once by the startup sweep.
+HABITICA_WEBHOOK_STARTUP_SWEEP = (os.getenv("HABITICA_WEBHOOK_STARTUP_SWEEP") or "true").lower() == "true" # Reconcile every linked user's webhooks when the bot starts.
+HABITICA_TASK_INDEX_RESYNC_SECONDS = float(os.getenv("HABITICA_TASK_INDEX_RESYNC_SECONDS") or 900) # How long tasks kept up to date by webhooks are trusted before checking with Habitica.
+EVENT_BUS_WORKERS = int(os.getenv("EVENT_BUS_WORKERS") or 8) # Events from Discord and webhooks handled at once.
+EVENT_BUS_QUEUE_SIZE = int(os.getenv("EVENT_BUS_QUEUE_SIZE") or 1000) # Events queued before publishers wait or are turned away.
+EVENT_BUS_DRAIN_TIMEOUT_SECONDS = float(os.getenv("EVENT_BUS_DRAIN_TIMEOUT_SECONDS") or 30) # How long shutdown waits for queued events.
+EVENT_HANDLER_TIMEOUT_SECONDS = float(os.getenv("EVENT_HANDLER_TIMEOUT_SECONDS") or 0) # Longest an async event handler may run before it is counted as timed out. 0 for no limit, which also skips setting up a timeout on every call.
+EVENT_DEAD_LETTER_SIZE = int(os.getenv("EVENT_DEAD_LETTER_SIZE") or 100) # Failed handler calls kept for the event_stats command.
+EVENT_JOURNAL_ENABLED = (os.getenv("EVENT_JOURNAL_ENABLED") or "false").lower() == "true" # Write bank, gold and webhook events to a journal and replay unfinished ones on startup.
+EVENT_JOURNAL_PATH = os.getenv("EVENT_JOURNAL_PATH") or os.path.join(STORE_DIR, "events.journal")
+EVENT_JOURNAL_FLUSH_WINDOW_SECONDS = float(os.getenv("EVENT_JOURNAL_FLUSH_WINDOW_SECONDS") or 0) # Extra wait before a journal write so more records share its fsync. Records that arrive during an fsync always share the next one.
+EVENT_JOURNAL_MAX_REPLAYS = int(os.getenv("EVENT_JOURNAL_MAX_REPLAYS") or 3) # Replays of an event that keeps failing before it is given up on.
+HABITICA_API_POOL_LIMIT = int(os.getenv("HABITICA_API_POOL_LIMIT") or 100) # Max open connections in the Habitica session.
+HABITICA_API_POOL_LIMIT_PER_HOST = int(os.getenv("HABITICA_API_POOL_LIMIT_PER_HOST") or 10) # Max open connections to a single host.
+HABITICA_API_KEEPALIVE_SECONDS = float(os.getenv("HABITICA_API_KEEPALIVE_SECONDS") or 30) # How long idle connections are kept open.
+HABITICA_API_TIMEOUT_SECONDS = float(os.getenv("HABITICA_API_TIMEOUT_SECONDS") or 30) # Total timeout for a single call.
 
 
 TEST_HABITICA_API_USER = os.getenv("TEST_HABITICA_USER_ID")
@@ -11,13 +11,14 @@ from dotenv import load_dotenv
 
 from discord_bot.cogs import app_cog, bank_cog, messaging_cog
 from app.app_service import AppService
+from habitica.habitica_api import HabiticaClient
 
 
 class DiscordHabiticaBot(commands.Bot):
     client: aiohttp.ClientSession
     _uptime: datetime.datetime = datetime.datetime.utcnow()
 
-    def __init__(self, prefix: str, ext_dir: str, app_service: AppService, *args: typing.Any, **kwargs: typing.Any) -> None:
+    def __init__(self, prefix: str, ext_dir: str, app_service: AppService, habitica_client: HabiticaClient, *args: typing.Any, **kwargs: typing.Any) -> None:
         intents = discord.Intents.default()
         intents.members = True
         intents.message_content = True
@@ -25,6 +26,7 @@ class DiscordHabiticaBot(commands.Bot):
         self.logger = logger
         self.ext_dir = ext_dir
         self.app_service = app_service
+        self.habitica_client = habitica_client
 
     async def _load_extensions(self) -> None:
         await self.add_cog(app_cog.AppUserCog(self, self.app_service))
@@ -39,6 +41,7 @@ class DiscordHabiticaBot(commands.Bot):
 
     async def setup_hook(self) -> None:
         self.client = aiohttp.ClientSession()
+        await self.habitica_client.start()
         self.logger.info("Loading Cogs...")
         await self._load_extensions()
         self.logger.info("Syncing command tree...")
@@ -48,6 +51,7 @@ class DiscordHabiticaBot(commands.Bot):
     async def close(self) -> None:
         await super().close()
         await self.client.close()
+        await self.habitica_client.close()
     
     @commands.command()
     @commands.is_owner()
@@ -1,11 +1,29 @@
 import asyncio
 from discord.ext import commands
 from app.app_service import AppService
-from app.events.event_service import post_event
-from app.events.app_events import SendAccountStatus
+from app.events.event_service import publish, QueueFullException, EventBusClosedException, HandlerStats, DeadLetter, handler_stats, dead_letters
+from app.events.app_events import SendAccountStatus, SendAccountStats
 
 from loguru import logger
 
+# Discord rejects messages longer than this
+MESSAGE_LIMIT = 2000
+
+def format_handler_stats(rows: list[HandlerStats], failed: list[DeadLetter]) -> str:
+    "A code block with a line per event handler, busiest first, then the latest dead letters."
+    lines = [f"{'handler':<48} {'calls':>6} {'fail':>5} {'t/o':>4} {'mean':>8} {'p95':>8}"]
+    for row in rows:
+        p95 = "-" if row.p95_seconds is None else f"≤{row.p95_seconds:g}s"
+        name = f"{row.event_type}:{row.handler}"[-48:]
+        lines.append(f"{name:<48} {row.calls:>6} {row.failure:>5} {row.timeout:>4} {row.mean_seconds * 1000:>6.0f}ms {p95:>8}")
+    if failed:
+        lines.append("")
+        lines.append("Latest dead letters:")
+        for dead_letter in reversed(failed):
+            lines.append(f"{dead_letter.outcome} {dead_letter.event.type}:{dead_letter.handler} {dead_letter.exception!r}"[:200])
+    message = "```\n" + "\n".join(lines)
+    return message[:MESSAGE_LIMIT - 4] + "\n```"
+
 class AppUserCog(commands.Cog):
     def __init__(self, bot: commands.Bot, app_service: AppService) -> None:
         self.bot = bot
@@ -29,6 +47,29 @@ class AppUserCog(commands.Cog):
         except Exception as e:
             await ctx.interaction.response.send_message(str(e))
 
+    async def publish(self, ctx: commands.Context[commands.Bot], event):
+        "Hand event to the event bus, telling the user to try again if it is too busy to take it."
+        try:
+            await publish(event, wait=False)
+        except (QueueFullException, EventBusClosedException):
+            await ctx.send("⏳ The bot is busy, try again in a moment.", ephemeral=True)
+
     @app_user_commands.command(name="get_status")
     async def send_account_status(self, ctx: commands.Context[commands.Bot]):
-        asyncio.create_task(post_event(SendAccountStatus(ctx.author.id, ctx.channel.id, ctx.interaction)))
\ No newline at end of file
+        await self.publish(ctx, SendAccountStatus(ctx.author.id, ctx.channel.id, ctx.interaction))
+
+    @commands.hybrid_command(name="stats")
+    async def send_account_stats(self, ctx: commands.Context[commands.Bot]):
+        """Daily completion, streaks, habits and exp for your Habitica users"""
+        await self.publish(ctx, SendAccountStats(ctx.author.id, ctx.channel.id, ctx.interaction))
+
+    @commands.command(name="event_stats")
+    @commands.is_owner()
+    async def send_event_stats(self, ctx: commands.Context[commands.Bot]):
+        """Time spent, failures and timeouts per event handler"""
+        rows = handler_stats()
+        if not rows:
+            await ctx.send("No events handled yet.")
+            return
+        await ctx.send(format_handler_stats(rows, list(dead_letters)[-5:]))
+
@@ -9,8 +9,9 @@ import asyncio
 from app.bank_service import BankService, BankAccount, BankLoanAccount, Bank
 from app.app_user_service import AppUserService, HabiticaUserLink
 from habitica.habitica_service import HabiticaService, InsufficientGoldException, GoldTransactionException
+from habitica.request_scheduler import Priority, request_priority
 
-from app.events.event_service import post_event
+from app.events.event_service import publish, QueueFullException, EventBusClosedException
 from app.events.bank_events import WithdrawGold, DepositGold
 
 from typing import Callable
@@ -109,6 +110,13 @@ class BankCog(commands.Cog):
             raise Exception(message)
         return bank_accounts
 
+    async def publish(self, interaction: discord.Interaction, event):
+        "Hand event to the event bus, telling the user to try again if it is too busy to take it."
+        try:
+            await publish(event, wait=False)
+        except (QueueFullException, EventBusClosedException):
+            await interaction.response.send_message("⏳ The bot is busy, try again in a moment.", ephemeral=True)
+
     ######################
     ###### Commands ######
     ######################
@@ -222,7 +230,9 @@ class BankCog(commands.Cog):
         # Defer interaction if no selection data
         if bank_account or amount:
             event = WithdrawGold(amount=amount, bank_id=bank_account.bank_id, bank_account_id=bank_account.id, description="", interaction=interaction)
-            asyncio.create_task(post_event(event))
+            # The event is handled with this priority, so the Habitica calls it makes jump ahead of background work
+            with request_priority(Priority.INTERACTIVE):
+                await self.publish(interaction, event)
         else:
             # Remove message with view
             await original_interaction.delete_original_response()
@@ -244,7 +254,9 @@ class BankCog(commands.Cog):
         # Defer interaction if no selection data
         if bank_account and amount:
             event = WithdrawGold(amount=amount, bank_id=bank_account.bank_id, bank_account_id=bank_account.id, description="", interaction=interaction)
-            asyncio.create_task(post_event(event))
+            # The event is handled with this priority, so the Habitica calls it makes jump ahead of background work
+            with request_priority(Priority.INTERACTIVE):
+                await self.publish(interaction, event)
         else:
             # Remove message with view
             await original_interaction.delete_original_response()
\ No newline at end of file
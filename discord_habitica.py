@@ -15,14 +15,19 @@ from dataclasses import dataclass
 # App Imports
 import config as cfg
 from app.webhook_service import webhook_fastapi_app
+from app.events import event_service
+from app.events.event_journal import EventJournal
+from app.events.bank_events import DepositGold, WithdrawGold, ChargeBankPayment
+from habitica.events.habitica_events import AddGoldEvent
 from persistence.file_driver_new import PersistenceFileDriver
-import habitica.habitica_api as api
+from habitica.habitica_api import HabiticaClient
 
 # Service Imports
 from habitica.habitica_service import HabiticaService
 from app.app_service import AppService
 from app.bank_service import BankService
 from app.app_user_service import AppUserService
+from app.transaction_service import AppliedTransactions
 
 # Handler Imports
 from habitica.handlers.habitica_service_handlers import HabiticaServiceHandlers
@@ -61,13 +66,19 @@ async def main():
 
     driver = PersistenceFileDriver("store")
 
+    # Shared Habitica API client. Holds the pooled session for all Habitica calls.
+    habitica_client = HabiticaClient()
+    await habitica_client.start()
+
     # TODO: Create a dependency injection class for Service Dependencies.
     # Service Dependencies 
     app_user_service = AppUserService(driver)
     bank_service = BankService(driver)
-    habitica_service = HabiticaService(api)
+    habitica_service = HabiticaService(habitica_client)
+    # Replayed journal events skip transactions that already went through
+    applied_transactions = AppliedTransactions(driver) if cfg.EVENT_JOURNAL_ENABLED else None
     app_service = AppService(
-        api,
+        habitica_client,
         driver,
         app_user_service,
         bank_service,
@@ -76,15 +87,33 @@ async def main():
 
     # Event Handlers
     event_handlers = [
-        HabiticaServiceHandlers(habitica_service),
-        BankEventHandlers(bank_service, app_user_service, habitica_service),
+        HabiticaServiceHandlers(habitica_service, app_user_service, applied_transactions),
+        BankEventHandlers(bank_service, app_user_service, habitica_service, applied_transactions),
         AppServiceHandlers(app_service)
     ]
     for handler in event_handlers:
         logger.info(f"Handler Registered: {handler.__class__}")
 
+    # Money moving events and webhook receipts survive a crash, unfinished ones run again before anything new
+    if cfg.EVENT_JOURNAL_ENABLED:
+        event_service.journal = EventJournal(
+            cfg.EVENT_JOURNAL_PATH,
+            [DepositGold, WithdrawGold, ChargeBankPayment, AddGoldEvent, event_service.ReceiveHabiticaWebhookEvent],
+            on_complete=applied_transactions.forget)
+        event_service.journal.open()
+        applied_transactions.prune(entry.data.get('transaction_id') for entry in event_service.journal.incomplete.values())
+        await event_service.journal.replay(event_service.dispatch)
+
+    # Events from Discord and webhooks are queued and handled by a pool of workers
+    await event_service.bus.start()
+
+    # Fix up every linked user's webhooks in the background, in case the server URL or options changed
+    webhook_sweep = None
+    if cfg.HABITICA_WEBHOOK_STARTUP_SWEEP:
+        webhook_sweep = asyncio.create_task(habitica_service.webhook_reconciler.sweep(app_user_service.get_habitica_user_links()))
+
     # Create bot
-    bot = DiscordHabiticaBot(prefix="!", ext_dir="discord_bot/cogs", app_service=app_service)
+    bot = DiscordHabiticaBot(prefix="!", ext_dir="discord_bot/cogs", app_service=app_service, habitica_client=habitica_client)
 
     # Initialize asyncio loop
     loop = asyncio.new_event_loop()
@@ -94,10 +123,20 @@ async def main():
     webhook_fastapi_app_config = Config(webhook_fastapi_app, host="0.0.0.0", port=12555, loop=loop)
     webhook_fastapi_app_server = Server(webhook_fastapi_app_config)
 
-    await asyncio.gather(
-        bot.start(cfg.DISCORD_TOKEN),
-        webhook_fastapi_app_server.serve()
-    )
+    try:
+        await asyncio.gather(
+            bot.start(cfg.DISCORD_TOKEN),
+            webhook_fastapi_app_server.serve()
+        )
+    finally:
+        # Stop the sweep before the session it calls Habitica with is closed
+        if webhook_sweep is not None:
+            webhook_sweep.cancel()
+            await asyncio.gather(webhook_sweep, return_exceptions=True)
+        await event_service.bus.drain()
+        if event_service.journal is not None:
+            await event_service.journal.close()
+        await habitica_client.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+Batch analytics over task and exp history for many users at once.
+
+Histories are flattened into NumPy arrays (a SeriesBatch), so completion rates, streaks, rolling averages,
+exp velocity and weekday patterns are computed with a handful of array operations for the whole batch
+instead of Python loops over HistoryEntry objects.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import cached_property
+from itertools import chain
+from typing import Sequence
+import numpy as np
+from habitica.model.task import HabiticaTasks, TaskHistory, UNKNOWN
+from habitica.model.user import HabiticaUser
+
+MS_PER_DAY = 86_400_000
+# 1970-01-01 was a Thursday, and weekdays count from Monday = 0 like datetime.weekday()
+EPOCH_WEEKDAY = 3
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+def history_date_ms(date: int | str) -> int:
+    "Habitica history dates are epoch milliseconds, or ISO strings in newer exp history."
+    if isinstance(date, str):
+        return int(datetime.fromisoformat(date.replace("Z", "+00:00")).timestamp() * 1000)
+    return int(date)
+
+@dataclass
+class UserHistories:
+    "The histories analytics needs for one user."
+    dailies: list[TaskHistory] = field(default_factory=list)
+    habits: list[TaskHistory] = field(default_factory=list)
+    # (date ms, exp) at each cron, from user.history.exp
+    exp: list[tuple[int, float]] = field(default_factory=list)
+    # Habitica's preferences.timezoneOffset: minutes behind UTC, like JavaScript's getTimezoneOffset
+    timezone_offset: int = 0
+
+    @staticmethod
+    def from_models(tasks: HabiticaTasks, user: HabiticaUser = None) -> "UserHistories":
+        histories = UserHistories(
+            dailies=[daily.history for daily in tasks.daily],
+            habits=[habit.history for habit in tasks.habit],
+        )
+        if user:
+            histories.exp = [(history_date_ms(entry.date), entry.value) for entry in user.history.exp]
+            histories.timezone_offset = user.preferences.timezoneOffset or 0
+        return histories
+
+@dataclass
+class SeriesBatch:
+    """
+    Many histories in flat arrays. Series i is entries `offsets[i]:offsets[i+1]` and belongs to user `owners[i]`.
+    Extra per-entry columns (scores, due, completed) are in `columns`.
+    """
+    dates: np.ndarray
+    values: np.ndarray
+    offsets: np.ndarray
+    owners: np.ndarray
+    columns: dict[str, np.ndarray] = field(default_factory=dict)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @cached_property
+    def series_index(self) -> np.ndarray:
+        "Series of every entry."
+        return np.repeat(np.arange(len(self.owners)), self.lengths)
+
+    @cached_property
+    def entry_owners(self) -> np.ndarray:
+        "User of every entry."
+        return np.repeat(self.owners, self.lengths)
+
+    @staticmethod
+    def from_task_histories(histories: Sequence[TaskHistory], owners: Sequence[int]) -> "SeriesBatch":
+        "Concatenate task histories. The array columns are read through the buffer protocol, without a Python loop."
+        def concat(column: str, dtype) -> np.ndarray:
+            parts = [np.frombuffer(getattr(history, column), dtype=dtype) for history in histories if len(history)]
+            return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+        lengths = np.fromiter((len(history) for history in histories), dtype=np.int64, count=len(histories))
+        return SeriesBatch(
+            dates=concat("dates", np.int64),
+            values=concat("values", np.float64),
+            offsets=np.concatenate(([0], np.cumsum(lengths))),
+            owners=np.asarray(owners, dtype=np.int64),
+            columns={
+                "score_ups": concat("score_ups", np.int64),
+                "score_downs": concat("score_downs", np.int64),
+                "due": concat("due", np.int8),
+                "completed": concat("completions", np.int8),
+            },
+        )
+
+    @staticmethod
+    def from_pairs(series: Sequence[Sequence[tuple[int, float]]], owners: Sequence[int]) -> "SeriesBatch":
+        "Concatenate (date ms, value) series, like exp history."
+        lengths = np.fromiter((len(pairs) for pairs in series), dtype=np.int64, count=len(series))
+        flat = np.fromiter(chain.from_iterable(chain.from_iterable(series)), dtype=np.float64).reshape(-1, 2)
+        return SeriesBatch(
+            dates=flat[:, 0].astype(np.int64),
+            values=flat[:, 1],
+            offsets=np.concatenate(([0], np.cumsum(lengths))),
+            owners=np.asarray(owners, dtype=np.int64),
+        )
+
+def per_user_sum(values: np.ndarray, owners: np.ndarray, user_count: int) -> np.ndarray:
+    return np.bincount(owners, weights=values, minlength=user_count)
+
+def ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    "numerator / denominator, NaN where the denominator is 0."
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+def counted(dailies: SeriesBatch) -> np.ndarray:
+    "Daily entries that count towards completion: due (or not known to be skipped) with a known outcome."
+    return (dailies.columns["due"] != 0) & (dailies.columns["completed"] != UNKNOWN)
+
+def completion_rates(dailies: SeriesBatch, user_count: int, since_ms: int = None) -> np.ndarray:
+    "Share of due dailies completed, per user. NaN for users without due dailies."
+    mask = counted(dailies)
+    if since_ms is not None:
+        mask &= dailies.dates >= since_ms
+    owners = dailies.entry_owners[mask]
+    completed = (dailies.columns["completed"][mask] == 1).astype(np.float64)
+    return ratio(per_user_sum(completed, owners, user_count), np.bincount(owners, minlength=user_count))
+
+def streaks(dailies: SeriesBatch) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Current and longest run of completed due dailies, per series. Entries the daily was not due are skipped.
+    The run at every entry is its index minus the index of the last miss or series start, found with one
+    running maximum over the whole batch.
+    """
+    mask = counted(dailies)
+    series = dailies.series_index[mask]
+    done = dailies.columns["completed"][mask] == 1
+    index = np.arange(len(done))
+    is_start = series_starts(series)
+    reset = np.where(~done, index, np.where(is_start, index - 1, -1))
+    run = index - np.maximum.accumulate(reset) if len(done) else index
+
+    series_count = len(dailies.owners)
+    current = np.zeros(series_count, dtype=np.int64)
+    longest = np.zeros(series_count, dtype=np.int64)
+    if len(done):
+        starts = np.flatnonzero(is_start)
+        ends = np.append(starts[1:], len(done)) - 1
+        current[series[starts]] = run[ends]
+        longest[series[starts]] = np.maximum.reduceat(run, starts)
+    return current, longest
+
+def rolling_completion(dailies: SeriesBatch, user_count: int, window: int = 7) -> np.ndarray:
+    "Completion over each daily's last `window` due days, averaged over the user's dailies."
+    mask = counted(dailies)
+    series = dailies.series_index[mask]
+    rolling = rolling_mean((dailies.columns["completed"][mask] == 1).astype(np.float64), series, window)
+    if not len(rolling):
+        return np.full(user_count, np.nan)
+    last = np.append(np.flatnonzero(series_starts(series))[1:], len(series)) - 1
+    owners = dailies.owners[series[last]]
+    return ratio(per_user_sum(rolling[last], owners, user_count), np.bincount(owners, minlength=user_count))
+
+def per_user_max(values: np.ndarray, owners: np.ndarray, user_count: int) -> np.ndarray:
+    result = np.zeros(user_count, dtype=values.dtype)
+    np.maximum.at(result, owners, values)
+    return result
+
+def series_starts(series: np.ndarray) -> np.ndarray:
+    "Flags the first entry of each run of equal series ids."
+    is_start = np.ones(len(series), dtype=bool)
+    is_start[1:] = series[1:] != series[:-1]
+    return is_start
+
+def rolling_mean(values: np.ndarray, series: np.ndarray, window: int) -> np.ndarray:
+    "Trailing mean over the last `window` entries of the same series, shorter at the start of a series."
+    index = np.arange(len(values))
+    if not len(values):
+        return values.astype(np.float64)
+    starts = np.maximum.accumulate(np.where(series_starts(series), index, 0))
+    low = np.maximum(starts, index - window + 1)
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return (cumulative[index + 1] - cumulative[low]) / (index - low + 1)
+
+def exp_gains(exp: SeriesBatch) -> np.ndarray:
+    """
+    Exp gained per day between consecutive crons. Drops in exp are level ups or deaths, not negative progress,
+    so they count as NaN. The first entry of each series is NaN.
+    """
+    gains = np.full(len(exp.values), np.nan)
+    if len(gains) > 1:
+        days = np.diff(exp.dates) / MS_PER_DAY
+        with np.errstate(invalid="ignore", divide="ignore"):
+            gain = np.diff(exp.values) / np.maximum(days, 1)
+        gains[1:] = np.where(np.diff(exp.values) >= 0, gain, np.nan)
+        gains[exp.offsets[:-1][exp.lengths > 0]] = np.nan
+    return gains
+
+def exp_velocity(exp: SeriesBatch, user_count: int, window_days: int = 7) -> np.ndarray:
+    "Mean exp gained per day over each user's last `window_days` of exp history. NaN without history."
+    gains = exp_gains(exp)
+    owners = exp.entry_owners
+    latest = np.full(user_count, np.iinfo(np.int64).min)
+    np.maximum.at(latest, owners, exp.dates)
+    recent = (exp.dates >= latest[owners] - window_days * MS_PER_DAY) & ~np.isnan(gains)
+    return ratio(per_user_sum(gains[recent], owners[recent], user_count), np.bincount(owners[recent], minlength=user_count))
+
+def weekday_completion(dailies: SeriesBatch, user_count: int, timezone_offsets: np.ndarray = None) -> np.ndarray:
+    "Completion rate of due dailies by local weekday, as a (users, 7) array starting Monday."
+    mask = counted(dailies)
+    owners = dailies.entry_owners[mask]
+    dates = dailies.dates[mask]
+    if timezone_offsets is not None:
+        dates = dates - np.asarray(timezone_offsets, dtype=np.int64)[owners] * 60_000
+    weekday = (dates // MS_PER_DAY + EPOCH_WEEKDAY) % 7
+    cell = owners * 7 + weekday
+    completed = (dailies.columns["completed"][mask] == 1).astype(np.float64)
+    done = np.bincount(cell, weights=completed, minlength=user_count * 7)
+    due = np.bincount(cell, minlength=user_count * 7)
+    return ratio(done, due).reshape(user_count, 7)
+
+@dataclass
+class UserStats:
+    completion_rate: float
+    recent_completion_rate: float
+    rolling_completion: float
+    current_streak: int
+    longest_streak: int
+    habit_up_ratio: float
+    exp_per_day: float
+    weekday_completion: list[float]
+
+def compute_stats(users: Sequence[UserHistories], now_ms: int = None, recent_days: int = 30, velocity_days: int = 7) -> list[UserStats]:
+    "Stats for every user in one batch."
+    user_count = len(users)
+    dailies = SeriesBatch.from_task_histories(
+        [history for user in users for history in user.dailies],
+        [owner for owner, user in enumerate(users) for _ in user.dailies],
+    )
+    habits = SeriesBatch.from_task_histories(
+        [history for user in users for history in user.habits],
+        [owner for owner, user in enumerate(users) for _ in user.habits],
+    )
+    exp = SeriesBatch.from_pairs([user.exp for user in users], range(user_count))
+    timezone_offsets = np.array([user.timezone_offset for user in users], dtype=np.int64)
+
+    if now_ms is None:
+        now_ms = int(datetime.now().timestamp() * 1000)
+    completion = completion_rates(dailies, user_count)
+    recent = completion_rates(dailies, user_count, since_ms=now_ms - recent_days * MS_PER_DAY)
+    rolling = rolling_completion(dailies, user_count)
+    current, longest = streaks(dailies)
+    current = per_user_max(current, dailies.owners, user_count)
+    longest = per_user_max(longest, dailies.owners, user_count)
+
+    habit_owners = habits.entry_owners
+    ups = per_user_sum(np.clip(habits.columns["score_ups"], 0, None).astype(np.float64), habit_owners, user_count)
+    downs = per_user_sum(np.clip(habits.columns["score_downs"], 0, None).astype(np.float64), habit_owners, user_count)
+    habit_up_ratio = ratio(ups, ups + downs)
+
+    velocity = exp_velocity(exp, user_count, velocity_days)
+    weekdays = weekday_completion(dailies, user_count, timezone_offsets)
+    return [
+        UserStats(
+            completion_rate=float(completion[i]),
+            recent_completion_rate=float(recent[i]),
+            rolling_completion=float(rolling[i]),
+            current_streak=int(current[i]),
+            longest_streak=int(longest[i]),
+            habit_up_ratio=float(habit_up_ratio[i]),
+            exp_per_day=float(velocity[i]),
+            weekday_completion=weekdays[i].tolist(),
+        )
+        for i in range(user_count)
+    ]
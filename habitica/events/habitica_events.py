@@ -1,16 +1,21 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from uuid import uuid4
 
 @dataclass
 class AddGoldEvent:
     api_user: str
     api_token: str
     amount: int
-    transaction_id: str = ""
+    transaction_id: str = field(default_factory=lambda: str(uuid4()))
     type: str =  "add_gold_event"
+    partition_key = "api_user"
+    # Tokens are not written to the event journal, a replayed event looks the token up again
+    journal_exclude = ("api_token",)
 
 @dataclass
 class AddGoldEventConfirmed:
     api_user: str
     amount: int
     transaction_id: str = ""
-    type: str = "add_gold_confirmed_event"
\ No newline at end of file
+    type: str = "add_gold_confirmed_event"
+    partition_key = "api_user"
\ No newline at end of file
@@ -0,0 +1,186 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Callable
+from loguru import logger
+from app.transaction_service import ledger
+from app.metrics_service import MetricsRegistry, registry, COUNT_BUCKETS
+from habitica.keyed_lock import KeyedLock, gold_locks
+from habitica.model.user import HabiticaUserSummary
+import config as cfg
+
+class InsufficientGoldException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+        logger.error(args[0])
+
+class GoldTransactionException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+        logger.error(args[0])
+
+@dataclass
+class GoldWrite:
+    "Outcome of one caller's delta. old_gold and new_gold are the balance before and after it, in flush order."
+    amount: float
+    future: asyncio.Future
+    old_gold: float = None
+    new_gold: float = None
+    exception: Exception = None
+
+@dataclass
+class UserGoldQueue:
+    api_token: str
+    pending: list[GoldWrite] = field(default_factory=list)
+    flusher: asyncio.Task = None
+
+class GoldWriter:
+    """
+    Write-combining gold updates, per api_user.
+
+    Deltas that arrive within `flush_window_seconds` of each other are folded into one read of the user's gold,
+    one absolute PUT of `stats.gp`, verified against the user Habitica returns from the PUT. With
+    `verify_with_get` the user is fetched again instead. `read_user_summary` must go to Habitica every time, not to
+    the user cache or a GET already in flight, which may have been sent before the last PUT. Flushes hold the
+    api_user's lock in `locks`, shared by every writer in the process by default, so reads and PUTs for the same
+    user never interleave and no update is lost, while different users flush in parallel. Deltas are applied in
+    arrival order and a withdrawal that would take the balance below 0 fails on its own without affecting the others.
+
+    Every caller gets its own outcome, and records its own ledger operation in its own context, so operations
+    land in the caller's transaction.
+    """
+    def __init__(self, read_user_summary: Callable, update_user: Callable, rollback_fcn: Callable = None,
+                 flush_window_seconds: float = cfg.HABITICA_GOLD_FLUSH_WINDOW_SECONDS,
+                 verify_with_get: bool = cfg.HABITICA_GOLD_VERIFY_WITH_GET,
+                 locks: KeyedLock = gold_locks, metrics: MetricsRegistry = None) -> None:
+        self.read_user_summary = read_user_summary
+        self.update_user = update_user
+        self.rollback_fcn = rollback_fcn
+        self.flush_window_seconds = flush_window_seconds
+        self.verify_with_get = verify_with_get
+        self.locks = locks
+        self.queues: dict[str, UserGoldQueue] = {}
+        self.flushes = 0
+        self.writes = 0
+        metrics = metrics or registry
+        self.queue_depth = metrics.gauge("habitica_gold_queue_depth", "Gold changes waiting to be written to Habitica")
+        self.batch_size = metrics.histogram(
+            "habitica_gold_batch_size", "Gold changes written to Habitica together", buckets=COUNT_BUCKETS)
+
+    def depth(self, api_user) -> int:
+        "Gold changes queued for api_user and not yet being written."
+        queue = self.queues.get(api_user)
+        return len(queue.pending) if queue else 0
+
+    async def add(self, api_user, api_token, amount) -> float:
+        "Queue `amount` for api_user and wait for the flush it goes out in. Returns the user's gold after it."
+        queue = self.queues.get(api_user)
+        if queue is None:
+            queue = self.queues[api_user] = UserGoldQueue(api_token)
+        queue.api_token = api_token
+        write = GoldWrite(amount, asyncio.get_running_loop().create_future())
+        queue.pending.append(write)
+        self.queue_depth.inc()
+        if queue.flusher is None:
+            queue.flusher = asyncio.create_task(self.run(api_user, queue))
+            queue.flusher.add_done_callback(lambda flusher: self.stopped(api_user, queue, flusher))
+
+        await write.future
+        if write.old_gold is None:
+            raise write.exception
+        operation = ledger.add_operation(
+            {"api_user": api_user, "api_token": api_token}, 'gp', write.old_gold, write.new_gold, self.rollback_fcn)
+        if write.exception:
+            raise write.exception
+        operation.success = True
+        return write.new_gold
+
+    async def run(self, api_user, queue: UserGoldQueue):
+        """
+        Flush api_user's deltas until none are left. Deltas that arrive during a flush go out in the next one.
+        If this is cancelled, like at shutdown, every delta it hadn't finished fails with a GoldTransactionException.
+        """
+        try:
+            while queue.pending:
+                await asyncio.sleep(self.flush_window_seconds)
+                async with self.locks(api_user):
+                    writes, queue.pending = queue.pending, []
+                    self.queue_depth.dec(len(writes))
+                    self.batch_size.observe(len(writes))
+                    try:
+                        await self.flush(api_user, queue.api_token, writes)
+                    except Exception as e:
+                        for write in writes:
+                            if write.exception is None:
+                                write.exception = e
+                    except BaseException:
+                        self.cancel(api_user, writes)
+                        raise
+                    finally:
+                        for write in writes:
+                            if not write.future.done():
+                                write.future.set_result(None)
+        finally:
+            self.stop(api_user, queue)
+
+    def stopped(self, api_user, queue: UserGoldQueue, flusher: asyncio.Task):
+        "A flusher cancelled before it started never ran its cleanup."
+        if flusher.cancelled():
+            self.stop(api_user, queue)
+
+    def stop(self, api_user, queue: UserGoldQueue):
+        if queue.pending:
+            writes, queue.pending = queue.pending, []
+            self.queue_depth.dec(len(writes))
+            self.cancel(api_user, writes)
+        if self.queues.get(api_user) is queue:
+            del self.queues[api_user]
+
+    def cancel(self, api_user, writes: list[GoldWrite]):
+        "Fail the writes that have no outcome yet. Ones already sent to Habitica may or may not have been applied."
+        exception = None
+        for write in writes:
+            if write.exception is None:
+                exception = exception or GoldTransactionException(
+                    f"Gold update for api_user '{api_user}' was cancelled before Habitica confirmed it.")
+                write.exception = exception
+            if not write.future.done():
+                write.future.set_result(None)
+
+    async def flush(self, api_user, api_token, writes: list[GoldWrite]):
+        self.flushes += 1
+        self.writes += len(writes)
+        user = await self.read_user_summary(api_user, api_token)
+        current_gold = user.stats.gp
+        new_gold = current_gold
+        accepted: list[GoldWrite] = []
+        for write in writes:
+            if new_gold + write.amount < 0:
+                write.exception = InsufficientGoldException(
+                    f"Habitica user {user.profile.name} has insufficient GP. Current GP is {new_gold}.")
+                continue
+            write.old_gold = new_gold
+            new_gold += write.amount
+            write.new_gold = new_gold
+            accepted.append(write)
+        if not accepted:
+            return
+        if len(writes) > 1:
+            logger.debug(f"Combined {len(writes)} gold updates for api_user {api_user} into one write")
+
+        try:
+            response = await self.update_user(api_user, api_token, {"stats.gp": new_gold})
+            if self.verify_with_get or not isinstance(response, dict) or not response.get('data'):
+                user = await self.read_user_summary(api_user, api_token)
+            else:
+                # The PUT answers with the whole updated user. Only the summary sections are parsed.
+                user = HabiticaUserSummary.load(response)
+        except Exception as e:
+            for write in accepted:
+                write.exception = e
+            return
+        if new_gold != user.stats.gp:
+            exception = GoldTransactionException(f"Something went wrong updating Habitica User: '{user.profile.name}' gold. API_USER: '{api_user}'.")
+            for write in accepted:
+                write.exception = exception
+            return
+        logger.info(f"Set gold to {new_gold} ({new_gold - current_gold:+}) for name: {user.profile.name}, api_user: {api_user}")
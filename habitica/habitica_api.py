@@ -1,152 +1,349 @@
 
 import json
+import re
+import time
+import asyncio
 import aiohttp
 import config as cfg
-import time
+from dataclasses import dataclass
+from typing import Mapping
+from habitica.rate_limiter import RateLimiter, RateLimitPacer
+from habitica.user_cache import UserCache, FULL_USER
+from habitica.single_flight import SingleFlight, request_key
+from habitica.retry_policy import RetryPolicy
+from habitica.request_scheduler import RequestScheduler
+from app.metrics_service import MetricsRegistry, registry, SIZE_BUCKETS
 from loguru import logger
 
 x_client = '3006b14d-b672-4fc6-ab54-3da40dd1c55e-discord-habitica'
 
-class CircuitBreaker:
-    def __init__(self) -> None:
-        self.current_value = 0
-        self.limit_value = cfg.HABITICA_API_CIRCUIT_BREAKER_COUNT
-        self.interval_ms = 5000
-        self.last_interval = time.time()
-        self.call_history = []
-
-    def is_open(self):
-        '''
-        Track timestamp of each call in a list, and if there's too many entries as defined by HABITICA_API_CIRCUIT_BREAKER_COUNT
-        in the past interval_ms (5s by default), then open the circuit breaker.
-
-        Return true if the circuit breaker is open, indicating we should no longer send API calls
-        '''
-        state = False
-        now = int(time.time())
-        self.call_history.append(now)
-        calls_in_range = [c for c in self.call_history if c < now-self.interval_ms]
-        if len(calls_in_range) > self.limit_value:
-            # Circuit breaker is opened
-            logger.warning(f"Circuit breaker open: {len(calls_in_range)} calls in last {self.interval_ms}")
-            self.call_history = calls_in_range
-            state = True
-        return state 
-
-circuit_breaker = CircuitBreaker()
+# userFields requested for HabiticaUserSummary
+USER_SUMMARY_FIELDS = "profile.name,stats,party._id,webhooks"
+
+# Ids in paths like /user/webhook/<id> would give every call its own metrics series
+ID_SEGMENT = re.compile(r"/[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)")
+
+def rename_class(user: dict) -> dict:
+    "'class' causes deserialization problems, the user's stats have it as 'character_class' instead."
+    stats = user['data'].get('stats', {})
+    if 'class' in stats:
+        stats['character_class'] = stats.pop('class')
+    return user
+
+def endpoint_label(command_path: str) -> str:
+    "command_path with ids replaced, for use as a metrics label."
+    return ID_SEGMENT.sub("/:id", command_path)
+
+class HabiticaAPIException(Exception):
+    def __init__(self, *args: object, status: int = None) -> None:
+        super().__init__(*args)
+        self.status = status
+        logger.error(args[0])
+
+class HabiticaRateLimitException(HabiticaAPIException):
+    "Habitica answered 429 Too Many Requests."
+
+@dataclass
+class HabiticaResponse:
+    status: int
+    headers: Mapping[str, str]
+    data: dict | None
+
+class HabiticaClient:
+    """
+    Habitica API client that holds one long lived aiohttp session, so connections are pooled and kept alive
+    between calls instead of paying DNS, TCP and TLS setup on every request.
+
+    Call `start` on startup and `close` on shutdown. If `start` was not called, the session is created on first use.
+    """
+    def __init__(self,
+                base_url: str = cfg.HABITICA_API_BASE_URL,
+                pool_limit: int = cfg.HABITICA_API_POOL_LIMIT,
+                pool_limit_per_host: int = cfg.HABITICA_API_POOL_LIMIT_PER_HOST,
+                keepalive_seconds: float = cfg.HABITICA_API_KEEPALIVE_SECONDS,
+                timeout_seconds: float = cfg.HABITICA_API_TIMEOUT_SECONDS,
+                rate_limiter: RateLimiter = None,
+                pacer: RateLimitPacer = None,
+                user_cache: UserCache = None,
+                retry_policy: RetryPolicy = None,
+                scheduler: RequestScheduler = None,
+                metrics: MetricsRegistry = None,
+            ) -> None:
+        self.base_url = base_url
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.keepalive_seconds = keepalive_seconds
+        self.timeout_seconds = timeout_seconds
+        self.session: aiohttp.ClientSession = None
+        self.session_loop: asyncio.AbstractEventLoop = None
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.pacer = pacer or RateLimitPacer()
+        self.user_cache = user_cache or UserCache()
+        self.single_flight = SingleFlight()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.scheduler = scheduler or RequestScheduler()
+        self.metrics = metrics or registry
+        self.request_seconds = self.metrics.histogram(
+            "habitica_api_request_seconds", "Habitica call latency, including reading the body", ("method", "endpoint", "status"))
+        self.response_bytes = self.metrics.histogram(
+            "habitica_api_response_bytes", "Habitica response body size", ("method", "endpoint"), buckets=SIZE_BUCKETS)
+        self.responses = self.metrics.counter(
+            "habitica_api_responses_total", "Habitica calls by status. Failures without a response count as status `error`", ("method", "endpoint", "status"))
+        self.retries = self.metrics.counter(
+            "habitica_api_retries_total", "Habitica calls repeated by the retry policy", ("method", "endpoint"))
+        self.queue_wait_seconds = self.metrics.histogram(
+            "habitica_api_queue_wait_seconds", "Time a call waited before being sent, in the rate limiter, the scheduler or the global rate limiter", ("stage",))
+
+    async def start(self):
+        "Open the pooled session. Safe to call more than once."
+        loop = asyncio.get_running_loop()
+        if self.session and not self.session.closed and self.session_loop is loop:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_limit,
+            limit_per_host=self.pool_limit_per_host,
+            keepalive_timeout=self.keepalive_seconds,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"x-client": x_client},
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+        )
+        self.session_loop = loop
+        logger.info(f"Opened Habitica API session to {self.base_url} with pool limit {self.pool_limit}, {self.pool_limit_per_host} per host")
+
+    async def close(self):
+        "Close the pooled session and all of its connections."
+        if self.session and not self.session.closed:
+            await self.session.close()
+            logger.info("Closed Habitica API session")
+        self.session = None
+        self.session_loop = None
+
+    async def send(self, method: str, api_user, api_token, command_path, params = None, payload: dict = None, headers: dict = None) -> HabiticaResponse:
+        """
+        Make a call and return status, headers and decoded body. 304 Not Modified has no body.
+        Identical GETs that are already in flight share that call's response.
+        """
+        if method == "GET":
+            key = request_key(method, command_path, api_user, params, headers)
+            return await self.single_flight.do(
+                key,
+                lambda: self._send(method, api_user, api_token, command_path, params, payload, headers)
+            )
+        return await self._send(method, api_user, api_token, command_path, params, payload, headers)
+
+    async def _send(self, method: str, api_user, api_token, command_path, params = None, payload: dict = None, headers: dict = None) -> HabiticaResponse:
+        attempts = 0
+        async def attempt():
+            nonlocal attempts
+            if attempts:
+                self.retries.inc(method=method, endpoint=endpoint_label(command_path))
+            attempts += 1
+            return await self._attempt(method, api_user, api_token, command_path, params, payload, headers)
+        return await self.retry_policy.run(method, command_path, payload, attempt)
+
+    async def _attempt(self, method: str, api_user, api_token, command_path, params = None, payload: dict = None, headers: dict = None) -> HabiticaResponse:
+        # Priority comes from the caller's context, see request_scheduler.request_priority
+        # The api_user's own budget is waited for before taking a scheduler slot, so a throttled user doesn't sit
+        # on slots other users' calls could use. The global budget holds everyone up alike, so it is waited for
+        # in the slot, right before the call.
+        queued_at = time.monotonic()
+        await self.pacer.wait(api_user)
+        await self.rate_limiter.acquire_user(api_user)
+        self.queue_wait_seconds.observe(time.monotonic() - queued_at, stage="limiter")
+        queued_at = time.monotonic()
+        async with self.scheduler.slot(api_user):
+            self.queue_wait_seconds.observe(time.monotonic() - queued_at, stage="scheduler")
+            return await self._call(method, api_user, api_token, command_path, params, payload, headers)
+
+    async def _call(self, method: str, api_user, api_token, command_path, params = None, payload: dict = None, headers: dict = None) -> HabiticaResponse:
+        queued_at = time.monotonic()
+        await self.rate_limiter.acquire_global()
+        self.queue_wait_seconds.observe(time.monotonic() - queued_at, stage="global_limiter")
+        await self.start()
+        request_headers = {
+            "x-api-user": api_user,
+            "x-api-key": api_token
+        }
+        if headers:
+            request_headers.update(headers)
+
+        endpoint = endpoint_label(command_path)
+        status = "error"
+        started = time.monotonic()
+        try:
+            async with self.session.request(
+                method,
+                self.base_url+command_path,
+                headers=request_headers,
+                params=params,
+                json=payload
+            ) as response:
+                status = response.status
+                self.pacer.update(api_user, response.headers, response.status)
+                body = await response.read()
+            self.response_bytes.observe(len(body), method=method, endpoint=endpoint)
+        finally:
+            self.request_seconds.observe(time.monotonic() - started, method=method, endpoint=endpoint, status=status)
+            self.responses.inc(method=method, endpoint=endpoint, status=status)
+
+        if response.status == 304:
+            return HabiticaResponse(response.status, response.headers, None)
+        if not response.ok:
+            # Error bodies from proxies in front of Habitica are not always JSON
+            body = body.decode(errors="replace")
+            if response.status == 429:
+                raise HabiticaRateLimitException(f"HabiticaAPI: {command_path} {response.status} {body}", status=response.status)
+            raise HabiticaAPIException(f"HabiticaAPI: {command_path} {response.status} {body}", status=response.status)
+        return HabiticaResponse(response.status, response.headers, json.loads(body))
+
+    async def request(self, method: str, api_user, api_token, command_path, params = None, payload: dict = None):
+        response = await self.send(method, api_user, api_token, command_path, params, payload)
+        return response.data
+
+    async def get(self, api_user, api_token, command_path, params = {}):
+        return await self.request("GET", api_user, api_token, command_path, params=params)
+
+    async def post(self, api_user, api_token, command_path, payload: dict):
+        return await self.request("POST", api_user, api_token, command_path, payload=payload)
+
+    async def delete(self, api_user, api_token, command_path, id: dict):
+        return await self.request("DELETE", api_user, api_token, f"{command_path}/{id}")
+
+    async def put(self, api_user, api_token, command_path, payload: dict):
+        return await self.request("PUT", api_user, api_token, command_path, payload=payload)
+
+    async def get_user(self, api_user, api_token):
+        """
+        Returns the user from cache while it is fresh. Otherwise revalidates the cached copy with If-None-Match,
+        or downloads it if nothing is cached.
+        """
+        return await self.get_user_document(api_user, api_token, FULL_USER)
+
+    async def get_user_summary(self, api_user, api_token, user_fields: str = USER_SUMMARY_FIELDS):
+        """
+        Same as get_user, but asks Habitica for only the given comma separated `userFields`.
+        By default that is what HabiticaUserSummary needs.
+        """
+        return await self.get_user_document(api_user, api_token, user_fields, params={"userFields": user_fields})
+
+    async def get_user_document(self, api_user, api_token, view: str, params: dict = None):
+        cached = self.user_cache.get(api_user, view)
+        if cached:
+            return cached.response
+        # Coalesce the whole fetch, so concurrent callers also share the cache update
+        return await self.single_flight.do(
+            ("get_user", api_user, view),
+            lambda: self._fetch_user(api_user, api_token, view, params)
+        )
+
+    async def _fetch_user(self, api_user, api_token, view: str, params: dict = None):
+        # Held on to, a webhook or an update can invalidate the cache while the request is in flight
+        cached = self.user_cache.peek(api_user, view)
+        generation = self.user_cache.generation(api_user)
+        headers = {"If-None-Match": cached.etag} if cached and cached.etag else None
+        response = await self.send("GET", api_user, api_token, "/user", params=params, headers=headers)
+        if response.status == 304:
+            return self.user_cache.revalidate(api_user, cached).response
+
+        user = rename_class(response.data)
+        return self.user_cache.store(api_user, user, response.headers.get("ETag"), view, generation).response
+
+    async def read_user_summary(self, api_user, api_token, user_fields: str = USER_SUMMARY_FIELDS):
+        """
+        get_user_summary straight from Habitica. It skips the user cache and doesn't join an identical GET already in
+        flight, which may have been sent before a write the caller needs to see, like the last gold PUT.
+        """
+        response = await self._send("GET", api_user, api_token, "/user", params={"userFields": user_fields})
+        return rename_class(response.data)
+
+    def invalidate_user(self, api_user):
+        self.user_cache.invalidate(api_user)
+
+    async def get_party(self, api_user, api_token):
+        return await self.get(api_user, api_token, "/groups", params={"type":"party"})
+
+    async def get_tasks(self, api_user, api_token):
+        return await self.get(api_user, api_token, "/tasks/user")
+
+    async def get_webhooks(self, api_user, api_token):
+        return await self.get(api_user, api_token, "/user/webhook")
+
+    async def post_chat(self, api_user, api_token, group_id, message):
+        payload = {'message':message}
+        return await self.post(api_user, api_token, f"/groups/{group_id}/chat", payload)
+
+    # Calls that change the user document drop the cached user once they finish, even if they fail.
+    async def create_webhook(self, api_user, api_token, payload):
+        try:
+            return await self.post(api_user, api_token, "/user/webhook", payload)
+        finally:
+            self.invalidate_user(api_user)
+
+    async def delete_webhook(self, api_user, api_token, id):
+        try:
+            return await self.delete(api_user, api_token, "/user/webhook", id)
+        finally:
+            self.invalidate_user(api_user)
+
+    async def update_webhook(self, api_user, api_token, id, payload):
+        try:
+            return await self.put(api_user, api_token, f"/user/webhook/{id}", payload)
+        finally:
+            self.invalidate_user(api_user)
+
+    async def update_user(self, api_user, api_token, payload):
+        try:
+            return await self.put(api_user, api_token, "/user", payload)
+        finally:
+            self.invalidate_user(api_user)
+
+# Default client used by the module level functions below.
+client = HabiticaClient()
+user_cache = client.user_cache
 
 async def get(api_user, api_token, command_path, params = {}):
-    if circuit_breaker.is_open():
-        raise Exception(f"Circuit breaker open, call stopped: {command_path}")
-    auth_headers = {
-        "x-client": x_client,
-        "x-api-user": api_user,
-        "x-api-key": api_token
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(cfg.HABITICA_API_BASE_URL+command_path, headers=auth_headers, params=params) as response:
-            response_json = json.loads(await response.text())
-            if not response.ok:
-                message = f"HabiticaAPI: {command_path} {response.status} {response_json}"
-                logger.error(message)
-                raise Exception(message)
-
-    return response_json
+    return await client.get(api_user, api_token, command_path, params)
 
 async def post(api_user, api_token, command_path, payload: dict):
-    if circuit_breaker.is_open():
-        raise Exception(f"Circuit breaker open, call stopped: {command_path}")
-    auth_headers = {
-        "x-client": x_client,
-        "x-api-user": api_user,
-        "x-api-key": api_token
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            cfg.HABITICA_API_BASE_URL+command_path,
-            headers=auth_headers,
-            json=payload
-        ) as response:
-            response_json = json.loads(await response.text())
-            if not response.ok:
-                message = f"HabiticaAPI: {command_path} {response.status} {response_json}"
-                logger.error(message)
-                raise Exception(message)
-
-    return response_json
+    return await client.post(api_user, api_token, command_path, payload)
 
 async def delete(api_user, api_token, command_path, id: dict):
-    if circuit_breaker.is_open():
-        raise Exception(f"Circuit breaker open, call stopped: {command_path}")
-    auth_headers = {
-        "x-client": x_client,
-        "x-api-user": api_user,
-        "x-api-key": api_token
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.delete(
-            f"{cfg.HABITICA_API_BASE_URL}{command_path}/{id}",
-            headers=auth_headers,
-        ) as response:
-            response_json = json.loads(await response.text())
-            if not response.ok:
-                message = f"HabiticaAPI: {command_path} {response.status} {response_json}"
-                logger.error(message)
-                raise Exception(message)
-
-    return response_json
+    return await client.delete(api_user, api_token, command_path, id)
 
 async def put(api_user, api_token, command_path, payload: dict):
-    if circuit_breaker.is_open():
-        raise Exception(f"Circuit breaker open, call stopped: {command_path}")
-    auth_headers = {
-        "x-client": x_client,
-        "x-api-user": api_user,
-        "x-api-key": api_token
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.put(
-            cfg.HABITICA_API_BASE_URL+command_path,
-            headers=auth_headers,
-            json=payload
-        ) as response:
-            response_json = json.loads(await response.text())
-            if not response.ok:
-                message = f"HabiticaAPI: {command_path} {response.status} {response_json}"
-                logger.error(message)
-                raise Exception(message)
-
-    return response_json
+    return await client.put(api_user, api_token, command_path, payload)
 
 async def get_user(api_user, api_token):
-    response = await get(api_user, api_token, "/user")
-    # 'class' causes deserialization problems
-    response['data']['stats']['character_class'] = response['data']['stats']['class']
-    del response['data']['stats']['class']
-    return response
+    return await client.get_user(api_user, api_token)
+
+async def get_user_summary(api_user, api_token, user_fields: str = USER_SUMMARY_FIELDS):
+    return await client.get_user_summary(api_user, api_token, user_fields)
+
+async def read_user_summary(api_user, api_token, user_fields: str = USER_SUMMARY_FIELDS):
+    return await client.read_user_summary(api_user, api_token, user_fields)
 
 async def get_party(api_user, api_token):
-    return await get(api_user, api_token, "/groups", params={"type":"party"})
+    return await client.get_party(api_user, api_token)
 
 async def get_tasks(api_user, api_token):
-    return await get(api_user, api_token, "/tasks/user")
+    return await client.get_tasks(api_user, api_token)
 
 async def get_webhooks(api_user, api_token):
-    return await get(api_user, api_token, "/user/webhook")
+    return await client.get_webhooks(api_user, api_token)
 
 async def post_chat(api_user, api_token, group_id, message):
-    payload = {'message':message}
-    return await post(api_user, api_token, f"/groups/{group_id}/chat", payload)
+    return await client.post_chat(api_user, api_token, group_id, message)
     
 async def create_webhook(api_user, api_token, payload):
-    return await post(api_user, api_token, "/user/webhook", payload)
+    return await client.create_webhook(api_user, api_token, payload)
 
 async def delete_webhook(api_user, api_token, id):
-    return await delete(api_user, api_token, "/user/webhook", id)
+    return await client.delete_webhook(api_user, api_token, id)
+
+async def update_webhook(api_user, api_token, id, payload):
+    return await client.update_webhook(api_user, api_token, id, payload)
 
 async def update_user(api_user, api_token, payload):
-    return await put(api_user, api_token, "/user", payload)
\ No newline at end of file
+    return await client.update_user(api_user, api_token, payload)
@@ -1,29 +1,31 @@
 from app.events import event_service, habitica_events
 from habitica import habitica_api
-from habitica.model import HabiticaUser
+from habitica.model import HabiticaUser, LazyHabiticaUser, HabiticaUserSummary, HabiticaTasks, decode_webhook
+from habitica.user_cache import UserCache
+from habitica.task_index import TaskIndex
+from habitica.webhook_reconciler import WebhookReconciler
+from habitica.gold_writer import GoldWriter, InsufficientGoldException, GoldTransactionException
+from habitica.request_scheduler import Priority, with_priority
 from habitica.events.habitica_events import AddGoldEventConfirmed
 from loguru import logger
 import os, dotenv
+import dacite
 import asyncio
 dotenv.load_dotenv()
 SERVER_URL = os.getenv("SERVER_URL")
-from app.transaction_service import ledger, Operation, RollbackException
+from app.transaction_service import Operation, RollbackException
 
-class InsufficientGoldException(Exception):
-    def __init__(self, *args: object) -> None:
-        super().__init__(*args)
-        logger.error(args[0])
-
-class GoldTransactionException(Exception):
-    def __init__(self, *args: object) -> None:
-        super().__init__(*args)
-        logger.error(args[0])
 class HabiticaService:
     """
     Single interface for interacting with objects
     """
     def __init__(self, habitica_api = habitica_api) -> None:
         self.habitica_api = habitica_api
+        # Share the API client's user cache so parsed users are reused. Plain API modules get their own.
+        self.user_cache: UserCache = getattr(habitica_api, "user_cache", None) or UserCache()
+        self.task_index = TaskIndex()
+        self.gold_writer = GoldWriter(self.read_user_summary, self.update_user, self.rollback_gold)
+        self.webhook_reconciler = WebhookReconciler(habitica_api, self.get_user_summary, SERVER_URL)
         self.subscribe_events()
 
     # TODO: move these events out to the app. No point being here.
@@ -33,40 +35,76 @@ class HabiticaService:
         event_service.subscribe(habitica_events.WebhookSubscriptionEvent.type, self.handle_create_webhook_event)
         event_service.subscribe(habitica_events.WebhookSubscriptionDeleteEvent.type, self.handle_delete_webhook_event)
         event_service.subscribe(habitica_events.AddHabiticaGold.type, self.add_user_gold)
+        event_service.subscribe(event_service.ReceiveHabiticaWebhookEvent.type, self.handle_webhook_received)
 
-    async def get_user(self, api_user, api_token):
-        """Calls Habitica for user and returns a HabiticaUser object."""
+    async def get_user(self, api_user, api_token, fresh = False):
+        """
+        Calls Habitica for user and returns a HabiticaUser object. Sections of the user are loaded when first read.
+        Cached users are reused unless `fresh` is set, which always checks with Habitica.
+        """
+        if fresh:
+            self.user_cache.expire(api_user)
         user_json  = await self.habitica_api.get_user(api_user, api_token)
-        user = HabiticaUser.load(user_json)
+        user = self.user_cache.load_user(api_user, user_json, LazyHabiticaUser.load)
         return user
-    
-    async def add_user_gold(self, api_user, api_token, amount):
-        """Add or remove user gold. Set amount to negative to remove gold."""
-        logger.info(f"Initiating gold transaction for amount {amount} with Habitica for api_user {api_user}...")
-        user = await self.get_user(api_user, api_token)
-        current_gold = user.stats.gp
 
-        if current_gold + amount < 0:
-            raise InsufficientGoldException(f"Habitica user {user.profile.name} has insufficient GP. Current GP is {current_gold}.")
-        
-        new_gold = current_gold + amount
+    async def get_user_summary(self, api_user, api_token, fresh = False) -> HabiticaUserSummary:
+        """
+        Calls Habitica for only the user's name, stats, party and webhooks and returns a HabiticaUserSummary.
+        Prefer this over get_user unless other parts of the user are needed.
+        """
+        if fresh:
+            self.user_cache.expire(api_user)
+        user_json = await self.habitica_api.get_user_summary(api_user, api_token)
+        return self.user_cache.load_user(api_user, user_json, HabiticaUserSummary.load)
 
-        # Record the operation to the ledger
-        operation_object = {"api_user": api_user,"api_token": api_token}
-        operation = ledger.add_operation(operation_object, 'gp',current_gold, new_gold, self.rollback_gold)
+    async def read_user_summary(self, api_user, api_token) -> HabiticaUserSummary:
+        "get_user_summary that always reads what Habitica has now, never the cache or a GET sent earlier."
+        user_json = await self.habitica_api.read_user_summary(api_user, api_token)
+        return HabiticaUserSummary.load(user_json)
 
-        payload = {"stats.gp": new_gold}
-        await self.habitica_api.update_user(api_user, api_token, payload)
+    async def get_tasks(self, api_user, api_token, fresh = False) -> HabiticaTasks:
+        """
+        Returns the user's tasks as a HabiticaTasks object. Tasks are fetched from Habitica once, then kept up to
+        date by taskActivity webhooks and checked against Habitica every so often. `fresh` always fetches them.
+        """
+        tasks = None if fresh else self.task_index.get(api_user)
+        if tasks is None:
+            tasks_json = await self.habitica_api.get_tasks(api_user, api_token)
+            tasks = self.task_index.sync(api_user, HabiticaTasks.load(tasks_json))
+        return tasks
+
+    def handle_webhook_received(self, event: event_service.ReceiveHabiticaWebhookEvent):
+        """
+        User and task activity mean the cached user is out of date. Task activity also patches the task index.
+        The task in the payload is only built when the user's tasks are indexed.
+        """
+        webhook_type = event.payload.get('webhookType')
+        if webhook_type not in ("userActivity", "taskActivity"):
+            return
+        api_user = event.payload.get('user', {}).get('_id')
+        if api_user:
+            self.user_cache.invalidate(api_user)
+        if webhook_type == "taskActivity" and self.task_index.indexed(api_user):
+            try:
+                webhook = decode_webhook(event.payload, sections=("task",))
+            except (dacite.DaciteError, KeyError, TypeError) as e:
+                logger.error(f"Could not load task from {event.payload.get('type')} webhook for {api_user}, dropping its task index. {e}")
+                self.task_index.invalidate(api_user)
+                return
+            self.task_index.apply_webhook(webhook)
+    
+    async def add_user_gold(self, api_user, api_token, amount):
+        """
+        Add or remove user gold. Set amount to negative to remove gold.
+        Changes for the same user that arrive close together are written to Habitica together, see GoldWriter.
+        """
+        logger.info(f"Initiating gold transaction for amount {amount} with Habitica for api_user {api_user}...")
+        new_gold = await self.gold_writer.add(api_user, api_token, amount)
+        logger.info(f"Added {amount} gold to habitica account for api_user: {api_user}. Gold is now {new_gold}")
 
-        # Verify gold was added.
-        user = await self.get_user(api_user, api_token)
-        if new_gold != user.stats.gp:
-            operation.success = False
-            raise GoldTransactionException(f"Something went wrong updating Habitica User: '{user.profile.name}' gold. API_USER: '{api_user}'.")
-        
-        # Mark operation as successful in ledger
-        operation.success = True
-        logger.info(f"Added {amount} gold to habitica account for name: {user.profile.name}, api_user: {api_user}")
+    async def update_user(self, api_user, api_token, payload):
+        return await self.habitica_api.update_user(api_user, api_token, payload)
     
     async def rollback_gold(self, operation: Operation):
         try:
@@ -80,6 +118,7 @@ class HabiticaService:
             raise RollbackException(f"Failed to roll back addition of gold. Exception info: {str(e)}")
 
 
+    @with_priority(Priority.BACKGROUND)
     async def handle_create_webhook_event(self, event: habitica_events.WebhookSubscriptionEvent):
         payload = {}
         payload['url'] = SERVER_URL
@@ -89,23 +128,12 @@ class HabiticaService:
         await self.habitica_api.create_webhook(event.api_user, event.api_token, payload)
     
     async def handle_create_all_webhooks_event(self, event: habitica_events.CreateAllWebhookSubscription):
-        user = await self.get_user(event.api_user, event.api_token)
-        webhook_subscriptions: list[habitica_events.WebhookSubscriptionEvent] = [
-            habitica_events.TaskWebhookSubscriptionEvent(event.api_user, event.api_token),
-            habitica_events.UserWebhookSubscriptionEvent(event.api_user, event.api_token),
-            habitica_events.QuestWebhookSubscriptionEvent(event.api_user, event.api_token),
-            habitica_events.GroupChatWebhookSubscriptionEvent(event.api_user, event.api_token, user.party._id),
-        ]
-        for webhook in webhook_subscriptions:
-            if not webhook.webhook_type in [w['type'] for w in user.webhooks]:
-                await self.handle_create_webhook_event(webhook)
+        "Create, fix or remove the user's webhooks so they match what the bot needs."
+        await self.webhook_reconciler.reconcile(event.api_user, event.api_token)
     
+    @with_priority(Priority.BACKGROUND)
     async def handle_delete_webhook_event(self, event: habitica_events.WebhookSubscriptionDeleteEvent):
         await self.habitica_api.delete_webhook(event.api_user, event.api_token, event.id)
     
     async def handle_delete_all_webhooks_event(self, event: habitica_events.DeleteAllWebhookSubscription):
-        user = await self.get_user(event.api_user, event.api_token)
-        for webhook in user.webhooks:
-            if "Discord Habitica" in webhook['label']:
-                evt = habitica_events.WebhookSubscriptionDeleteEvent(event.api_user, event.api_token, webhook['id'])
-                await event_service.post_event(evt)
+        await self.webhook_reconciler.remove_all(event.api_user, event.api_token)
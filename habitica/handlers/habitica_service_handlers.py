@@ -1,17 +1,31 @@
+from loguru import logger
 from app.events.event_service import subscribe
+from app.app_user_service import AppUserService
+from app.transaction_service import AppliedTransactions
 from habitica.habitica_service import HabiticaService
 from habitica.events.habitica_events import AddGoldEvent
 
 class HabiticaServiceHandlers:
-    def __init__(self, habitica_service: HabiticaService) -> None:
+    def __init__(self, habitica_service: HabiticaService, app_user_service: AppUserService, applied_transactions: AppliedTransactions = None) -> None:
         self.habitica_service = habitica_service
-        
+        self.app_user_service = app_user_service
+        self.applied_transactions = applied_transactions
+
         subscribe(AddGoldEvent.type, self.handle_add_user_gold)
-    
+
     async def handle_add_user_gold(self, event: AddGoldEvent):
+        applied_transactions = self.applied_transactions
+        if applied_transactions and applied_transactions.applied(event.transaction_id):
+            logger.info(f"Skipped gold transaction {event.transaction_id} for api_user {event.api_user}, it was already applied")
+            return
+        api_token = event.api_token
+        if api_token is None:
+            # Replayed from the event journal, which doesn't keep tokens
+            api_token = self.app_user_service.get_habitica_user_link(habitica_user_id=event.api_user).api_token
         await self.habitica_service.add_user_gold(
             event.api_user,
-            event.api_token,
+            api_token,
             event.amount
         )
-    
\ No newline at end of file
+        if applied_transactions:
+            applied_transactions.mark_applied(event.transaction_id)
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Hashable
+from app.metrics_service import MetricsRegistry, registry
+
+@dataclass
+class KeyState:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Holder plus waiters. The key is dropped when this gets back to 0.
+    users: int = 0
+
+class KeyedLock:
+    """
+    One asyncio.Lock per key, like an actor per api_user: work for the same key runs one at a time in arrival
+    order, work for different keys runs in parallel. Locks only exist while someone holds or waits for them.
+
+    `name` labels the metrics, so several KeyedLocks can report to the same metrics.
+    """
+    def __init__(self, name: str, metrics: MetricsRegistry = None) -> None:
+        self.name = name
+        self.keys: dict[Hashable, KeyState] = {}
+        self.holding = 0
+        self.max_held = 0
+        metrics = metrics or registry
+        self.waiting = metrics.gauge("habitica_keyed_lock_waiting", "Callers waiting for a per-key lock", ("name",))
+        self.held = metrics.gauge("habitica_keyed_lock_held", "Keys whose lock is currently held", ("name",))
+        self.queue_depth = metrics.histogram(
+            "habitica_keyed_lock_queue_depth", "Callers already queued for a key when another asks for it", ("name",), buckets=(0, 1, 2, 4, 8, 16, 32))
+        self.wait_seconds = metrics.histogram(
+            "habitica_keyed_lock_wait_seconds", "Time waited for a per-key lock", ("name",))
+
+    def depth(self, key: Hashable) -> int:
+        "Callers holding or waiting for key."
+        state = self.keys.get(key)
+        return state.users if state else 0
+
+    @asynccontextmanager
+    async def __call__(self, key: Hashable):
+        state = self.keys.get(key)
+        if state is None:
+            state = self.keys[key] = KeyState()
+        self.queue_depth.observe(state.users, name=self.name)
+        state.users += 1
+        start = time.monotonic()
+        self.waiting.inc(name=self.name)
+        try:
+            await state.lock.acquire()
+        except BaseException:
+            self.release_key(key, state)
+            raise
+        finally:
+            self.waiting.dec(name=self.name)
+        self.wait_seconds.observe(time.monotonic() - start, name=self.name)
+        self.held.inc(name=self.name)
+        self.holding += 1
+        self.max_held = max(self.max_held, self.holding)
+        try:
+            yield
+        finally:
+            self.held.dec(name=self.name)
+            self.holding -= 1
+            state.lock.release()
+            self.release_key(key, state)
+
+    def release_key(self, key: Hashable, state: KeyState):
+        state.users -= 1
+        if state.users == 0 and self.keys.get(key) is state:
+            del self.keys[key]
+
+# Serializes every change to a user's gold across the whole process, whichever GoldWriter makes it
+gold_locks = KeyedLock("gold")
@@ -1,4 +1,4 @@
 from .party import HabiticaParty
-from .user import HabiticaUser
+from .user import HabiticaUser, LazyHabiticaUser, HabiticaUserSummary
 from .task import HabiticaTasks
-from .webhook import Webhook
\ No newline at end of file
+from .webhook import Webhook, GroupChatReceivedWebhook, UserActivityWebhook, QuestActivityWebhook, decode_webhook
\ No newline at end of file
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime
 import json
-import dacite
+from app.model.loader import ModelLoader
 from typing import Optional
 
 
@@ -21,4 +21,6 @@ class HabiticaParty:
 
     @staticmethod
     def load(response: dict):
-        return [dacite.from_dict(HabiticaParty, party) for party in response['data']]
\ No newline at end of file
+        return [load_party(party) for party in response['data']]
+
+load_party = ModelLoader(HabiticaParty)
\ No newline at end of file
@@ -1,27 +1,142 @@
+from array import array
+from collections.abc import Sequence
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterable, Optional
 import dacite
+from dacite import Config
+from app.model.loader import ModelLoader
 
+# Task models use __slots__, since tasks are cached for every user and each instance would otherwise carry a __dict__.
 
-@dataclass
+@dataclass(slots=True)
 class Reminder:
     time: str
     id: str
 
-@dataclass
+@dataclass(slots=True)
 class HistoryEntry:
     date: int
     value: float
     scoreUp: Optional[int]
     scoreDown: Optional[int]
+    # Daily history also says whether the daily was due and completed on that cron
+    isDue: Optional[bool] = None
+    completed: Optional[bool] = None
 
-@dataclass
+# Stands in for None in TaskHistory's integer columns
+NO_SCORE = -1
+UNKNOWN = -1
+
+def _flag(value: Optional[bool]) -> int:
+    return UNKNOWN if value is None else int(value)
+
+def _score(value: Optional[int]) -> int:
+    return NO_SCORE if value is None else value
+
+class TaskHistory(Sequence):
+    """
+    Task history kept in parallel arrays (date, value, scoreUp, scoreDown, isDue and completed) instead of one
+    HistoryEntry per entry. Long running habits and dailies have hundreds of entries, which cost 26 bytes each here.
+    Indexing and iterating return HistoryEntry objects built on the fly, and slicing returns a TaskHistory.
+    """
+    __slots__ = ("dates", "values", "score_ups", "score_downs", "due", "completions")
+
+    def __init__(self, entries: Iterable[HistoryEntry] = ()) -> None:
+        self.dates = array('q')
+        self.values = array('d')
+        self.score_ups = array('q')
+        self.score_downs = array('q')
+        self.due = array('b')
+        self.completions = array('b')
+        for entry in entries:
+            self.append(entry)
+
+    @property
+    def columns(self) -> tuple[array, ...]:
+        return (self.dates, self.values, self.score_ups, self.score_downs, self.due, self.completions)
+
+    @staticmethod
+    def load(history: list[dict]) -> "TaskHistory":
+        "Build from Habitica's history list. Habitica names the scores scoredUp and scoredDown."
+        if isinstance(history, TaskHistory):
+            return history
+        loaded = TaskHistory()
+        try:
+            for entry in history:
+                loaded.dates.append(entry['date'])
+                loaded.values.append(entry['value'])
+                loaded.score_ups.append(_score(entry.get('scoredUp', entry.get('scoreUp'))))
+                loaded.score_downs.append(_score(entry.get('scoredDown', entry.get('scoreDown'))))
+                loaded.due.append(_flag(entry.get('isDue')))
+                loaded.completions.append(_flag(entry.get('completed')))
+        except (KeyError, TypeError, AttributeError, OverflowError):
+            raise dacite.WrongTypeError(field_type=TaskHistory, value=history) from None
+        return loaded
+
+    def append(self, entry: HistoryEntry):
+        self.dates.append(entry.date)
+        self.values.append(entry.value)
+        self.score_ups.append(_score(entry.scoreUp))
+        self.score_downs.append(_score(entry.scoreDown))
+        self.due.append(_flag(entry.isDue))
+        self.completions.append(_flag(entry.completed))
+
+    def dump(self) -> list[dict]:
+        dumped = []
+        for entry in self:
+            row = {"date": entry.date, "value": entry.value, "scoredUp": entry.scoreUp, "scoredDown": entry.scoreDown}
+            if entry.isDue is not None or entry.completed is not None:
+                row.update({"isDue": entry.isDue, "completed": entry.completed})
+            dumped.append(row)
+        return dumped
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in self.columns)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            sliced = TaskHistory()
+            sliced.dates, sliced.values, sliced.score_ups, sliced.score_downs, sliced.due, sliced.completions = (
+                column[index] for column in self.columns)
+            return sliced
+        return self.entry(*(column[index] for column in self.columns))
+
+    def __iter__(self):
+        for row in zip(*self.columns):
+            yield self.entry(*row)
+
+    @staticmethod
+    def entry(date: int, value: float, score_up: int, score_down: int, due: int, completed: int) -> HistoryEntry:
+        return HistoryEntry(
+            date,
+            value,
+            None if score_up == NO_SCORE else score_up,
+            None if score_down == NO_SCORE else score_down,
+            None if due == UNKNOWN else bool(due),
+            None if completed == UNKNOWN else bool(completed),
+        )
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TaskHistory):
+            return self.columns == other.columns
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TaskHistory({len(self)} entries)"
+
+@dataclass(slots=True)
 class ChecklistItem:
     completed: bool
     text: str
     id: str
 
-@dataclass
+@dataclass(slots=True)
 class Repeat:
     m: bool
     t: bool
@@ -31,7 +146,7 @@ class Repeat:
     s: bool
     su: bool
 
-@dataclass
+@dataclass(slots=True)
 class HabiticaTask:
     challenge: dict
     group: dict
@@ -50,11 +165,11 @@ class HabiticaTask:
     userId: str
     id: str
     
-@dataclass
+@dataclass(slots=True)
 class HabiticaTodo(HabiticaTask):
     checklist: list[ChecklistItem]
 
-@dataclass
+@dataclass(slots=True)
 class HabiticaDaily(HabiticaTask):
     repeat: Repeat
     everyX: int
@@ -65,22 +180,22 @@ class HabiticaDaily(HabiticaTask):
     daysOfMonth: list[int]
     weeksOfMonth: list[int]
     frequency: str
-    history: list[HistoryEntry]
+    history: TaskHistory
 
-@dataclass
+@dataclass(slots=True)
 class HabiticaHabit(HabiticaTask):
     up: bool
     down: bool
     counterUp: int
     counterDown: int
     frequency: str
-    history: list[HistoryEntry]
+    history: TaskHistory
 
-@dataclass
+@dataclass(slots=True)
 class HabiticaReward(HabiticaTask):
     pass
 
-@dataclass
+@dataclass(slots=True)
 class HabiticaTasks:
     todo: list[HabiticaTodo]
     daily: list[HabiticaDaily]
@@ -93,4 +208,15 @@ class HabiticaTasks:
         for task in response['data']:
             tasks[task['type']].append(task)
             
-        return dacite.from_dict(HabiticaTasks, tasks)
\ No newline at end of file
+        return load_tasks(tasks)
+
+# Config for loading anything that contains tasks
+TASK_CONFIG = Config(type_hooks={TaskHistory: TaskHistory.load})
+
+load_tasks = ModelLoader(HabiticaTasks, TASK_CONFIG)
+TASK_CLASSES = {"todo": HabiticaTodo, "daily": HabiticaDaily, "habit": HabiticaHabit, "reward": HabiticaReward}
+task_loaders = {task_type: ModelLoader(data_class, TASK_CONFIG) for task_type, data_class in TASK_CLASSES.items()}
+
+def load_task(task: dict) -> HabiticaTask:
+    "Load a single task, like the one in a taskActivity webhook, into the model for its type."
+    return task_loaders[task['type']](task)
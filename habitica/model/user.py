@@ -1,7 +1,7 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields, make_dataclass
 from datetime import datetime
 import json
-import dacite
+from app.model.loader import ModelLoader
 from typing import Optional
 from .task import HabiticaTasks
 
@@ -274,4 +274,92 @@ class HabiticaUser:
 
     @staticmethod
     def load(response: dict):
-        return dacite.from_dict(HabiticaUser, response['data'])
\ No newline at end of file
+        return load_user(response['data'])
+
+load_user = ModelLoader(HabiticaUser)
+
+# One single-field dataclass per HabiticaUser field, so one section of the user can be loaded at a time.
+_USER_SECTIONS = {
+    field.name: ModelLoader(make_dataclass(f"HabiticaUser_{field.name}", [(field.name, field.type)]))
+    for field in fields(HabiticaUser)
+}
+
+class LazyHabiticaUser(HabiticaUser):
+    """
+    HabiticaUser that keeps the raw user document and only builds a section, like `items` or `preferences`,
+    the first time it is read. Sections are loaded exactly as HabiticaUser.load would, so the attribute
+    API is the same, but a caller that only reads `stats.gp` never pays for items, history or notifications.
+    """
+    def __init__(self, data: dict) -> None:
+        self.__dict__['_raw_data'] = data
+
+    def __getattr__(self, name: str):
+        section = _USER_SECTIONS.get(name)
+        if section is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        value = getattr(section(self._raw_data), name)
+        # Cache on the instance, so __getattr__ is not called for this section again
+        self.__dict__[name] = value
+        return value
+
+    def __repr__(self) -> str:
+        loaded = [name for name in _USER_SECTIONS if name in self.__dict__]
+        return f"LazyHabiticaUser(id={self._raw_data.get('id')!r}, loaded={loaded})"
+
+    @staticmethod
+    def load(response: dict):
+        return LazyHabiticaUser(response['data'])
+
+#########################
+#######  SUMMARY   ######
+#########################
+@dataclass
+class SummaryStats:
+    hp: float
+    mp: float
+    exp: float
+    gp: float
+    lvl: int
+    character_class: str
+    toNextLevel: Optional[int] = None
+    maxHealth: Optional[int] = None
+    maxMP: Optional[int] = None
+
+@dataclass
+class SummaryParty:
+    _id: Optional[str] = None
+
+@dataclass
+class HabiticaUserSummary:
+    """
+    The parts of a Habitica user most callers read: name, stats, party and webhooks.
+    Loaded from a `userFields` projection of `/user` (or a full user response) without dacite.
+    """
+    id: str
+    profile: Profile
+    stats: SummaryStats
+    party: SummaryParty
+    webhooks: list
+
+    @staticmethod
+    def load(response: dict):
+        data = response['data']
+        profile = data.get('profile') or {}
+        stats = data['stats']
+        return HabiticaUserSummary(
+            id=data.get('id') or data.get('_id'),
+            profile=Profile(profile.get('name'), profile.get('blurb')),
+            stats=SummaryStats(
+                hp=stats['hp'],
+                mp=stats['mp'],
+                exp=stats['exp'],
+                gp=stats['gp'],
+                lvl=stats['lvl'],
+                character_class=stats.get('character_class', stats.get('class')),
+                toNextLevel=stats.get('toNextLevel'),
+                maxHealth=stats.get('maxHealth'),
+                maxMP=stats.get('maxMP'),
+            ),
+            party=SummaryParty((data.get('party') or {}).get('_id')),
+            webhooks=data.get('webhooks') or [],
+        )
@@ -1,17 +1,137 @@
-from .task import HabiticaDaily, HabiticaTodo, HabiticaHabit, HabiticaReward
-from dataclasses import dataclass
-import dacite
+from .task import HabiticaDaily, HabiticaTodo, HabiticaHabit, HabiticaReward, TASK_CONFIG, task_loaders
+from dataclasses import dataclass, field
+from typing import Collection, Optional
+from loguru import logger
+from app.model.loader import ModelLoader
 
+class UnknownWebhookException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+        logger.error(args[0])
+
+##########################
+####  taskActivity   #####
+##########################
 @dataclass
 class Webhook:
+    "A taskActivity webhook."
     type: str
     direction: str
     delta: float
-    task: HabiticaDaily | HabiticaTodo | HabiticaHabit | HabiticaReward
+    # None when the task section was skipped
+    task: HabiticaDaily | HabiticaTodo | HabiticaHabit | HabiticaReward | None
     user: dict
     webhookType: str
 
     @staticmethod
-    def load(data):
-        webhook = dacite.from_dict(Webhook, data)
-        return webhook 
\ No newline at end of file
+    def load(data, sections: Collection[str] = None):
+        "Load a taskActivity payload. Use decode_webhook for payloads of any webhookType."
+        return decode_task_activity(data, sections)
+
+TaskActivityWebhook = Webhook
+
+##########################
+###  groupChatReceived ###
+##########################
+@dataclass
+class WebhookGroup:
+    id: str
+    name: str
+
+@dataclass
+class ChatMessage:
+    id: str
+    text: str
+    unformattedText: str
+    timestamp: str | int
+    uuid: str
+    groupId: str
+    flagCount: int = 0
+    info: dict = field(default_factory=dict)
+    likes: dict = field(default_factory=dict)
+    flags: dict = field(default_factory=dict)
+    # Only on messages sent by users, system messages have uuid "system"
+    user: Optional[str] = None
+    username: Optional[str] = None
+
+@dataclass
+class GroupChatReceivedWebhook:
+    group: WebhookGroup
+    # None when the chat section was skipped
+    chat: Optional[ChatMessage]
+    user: dict
+    webhookType: str
+
+##########################
+####  userActivity   #####
+##########################
+@dataclass
+class UserActivityWebhook:
+    "petHatched, mountRaised or leveledUp. Only the fields for the activity type are set."
+    type: str
+    user: dict
+    webhookType: str
+    pet: Optional[str] = None
+    message: Optional[str] = None
+    mount: Optional[str] = None
+    initialLvl: Optional[int] = None
+    finalLvl: Optional[int] = None
+
+##########################
+####  questActivity  #####
+##########################
+@dataclass
+class QuestActivityWebhook:
+    "questStarted, questFinished or questInvited."
+    type: str
+    group: WebhookGroup
+    quest: dict
+    user: dict
+    webhookType: str
+
+AnyWebhook = Webhook | GroupChatReceivedWebhook | UserActivityWebhook | QuestActivityWebhook
+
+load_webhook = ModelLoader(Webhook, TASK_CONFIG)
+load_group_chat_webhook = ModelLoader(GroupChatReceivedWebhook)
+load_user_activity_webhook = ModelLoader(UserActivityWebhook)
+load_quest_activity_webhook = ModelLoader(QuestActivityWebhook)
+
+# Sections that are only built when asked for. Everything else in a payload is small and always loaded.
+SKIPPABLE_SECTIONS = ("task", "chat")
+
+def decode_task_activity(payload: dict, sections: Collection[str] = None) -> Webhook:
+    """
+    Build the task with the loader for its `type`, instead of trying each member of the task union in turn.
+    Anything unexpected goes through the full loader, so errors are the same as before.
+    """
+    try:
+        task = payload['task']
+        if sections is None or "task" in sections:
+            task = task_loaders[task['type']](task)
+        else:
+            task = None
+        return Webhook(payload['type'], payload['direction'], payload['delta'], task, payload['user'], payload['webhookType'])
+    except (KeyError, TypeError):
+        return load_webhook(payload)
+
+def decode_group_chat(payload: dict, sections: Collection[str] = None) -> GroupChatReceivedWebhook:
+    if sections is not None and "chat" not in sections:
+        payload = {key: value for key, value in payload.items() if key != "chat"}
+    return load_group_chat_webhook(payload)
+
+WEBHOOK_DECODERS = {
+    "taskActivity": decode_task_activity,
+    "groupChatReceived": decode_group_chat,
+    "userActivity": lambda payload, sections=None: load_user_activity_webhook(payload),
+    "questActivity": lambda payload, sections=None: load_quest_activity_webhook(payload),
+}
+
+def decode_webhook(payload: dict, sections: Collection[str] = None) -> AnyWebhook:
+    """
+    Decode a webhook payload into the model for its `webhookType`.
+    `sections` names the parts of SKIPPABLE_SECTIONS a handler needs. The rest are left as None. All by default.
+    """
+    decoder = WEBHOOK_DECODERS.get(payload.get('webhookType'))
+    if decoder is None:
+        raise UnknownWebhookException(f"No model for Habitica webhook type {payload.get('webhookType')}.")
+    return decoder(payload, sections)
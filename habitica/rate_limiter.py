@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Mapping
+from loguru import logger
+import config as cfg
+from habitica.request_scheduler import Priority, current_priority
+
+class SlidingWindow:
+    """
+    Tracks call timestamps over a rolling window. Expired timestamps are dropped from the left as time moves on,
+    so each call costs amortized O(1) and the history never holds more than `limit` entries.
+    """
+    def __init__(self, limit: int, window_seconds: float) -> None:
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.calls: deque[float] = deque()
+
+    def expire(self, now: float):
+        cutoff = now - self.window_seconds
+        while self.calls and self.calls[0] <= cutoff:
+            self.calls.popleft()
+
+    def wait_time(self, now: float) -> float:
+        "Seconds until another call fits in the window. 0 if it fits now."
+        self.expire(now)
+        if len(self.calls) < self.limit:
+            return 0
+        return self.calls[0] + self.window_seconds - now
+
+    def record(self, now: float):
+        self.calls.append(now)
+
+
+class PriorityLock:
+    """
+    Lock that is handed to the most urgent waiter when released, in arrival order within a priority.
+    Unlike asyncio.Lock, an interactive call doesn't queue behind background calls.
+    """
+    def __init__(self) -> None:
+        self.locked = False
+        self.waiters: list[tuple[Priority, int, asyncio.Future]] = []
+        self.sequence = itertools.count()
+
+    async def acquire(self, priority: Priority):
+        if not self.locked and not self.waiters:
+            self.locked = True
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                # Lock stays held and passes straight to the waiter
+                future.set_result(None)
+                return
+        self.locked = False
+
+    @asynccontextmanager
+    async def hold(self, priority: Priority):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class RateLimiter:
+    """
+    Sliding window rate limiter with a budget per api_user and a global budget shared by all users.
+
+    Callers over budget wait their turn instead of failing. Waiters for the same api_user are served by priority,
+    then in order, and a user that is out of budget does not hold up other users.
+    """
+    def __init__(self,
+                user_limit: int = cfg.HABITICA_API_USER_RATE_LIMIT,
+                global_limit: int = cfg.HABITICA_API_GLOBAL_RATE_LIMIT,
+                window_seconds: float = cfg.HABITICA_API_RATE_LIMIT_WINDOW_SECONDS
+            ) -> None:
+        self.user_limit = user_limit
+        self.window_seconds = window_seconds
+        self.global_window = SlidingWindow(global_limit, window_seconds)
+        self.user_windows: dict[str, SlidingWindow] = {}
+        self.user_locks: dict[str, PriorityLock] = {}
+        self.global_lock = PriorityLock()
+        self.user_queue_depths: dict[str, int] = {}
+        self.queue_depth = 0
+
+    def user_queue_depth(self, api_user) -> int:
+        "Number of callers waiting for the given api_user's budget."
+        return self.user_queue_depths.get(api_user, 0)
+
+    async def acquire(self, api_user, priority: Priority = None):
+        "Wait until both the api_user budget and the global budget allow another call, then record it."
+        await self.acquire_user(api_user, priority)
+        await self.acquire_global(priority)
+
+    async def acquire_user(self, api_user, priority: Priority = None):
+        "Wait until api_user's own budget allows another call, then record it."
+        priority = current_priority.get() if priority is None else priority
+        if api_user not in self.user_locks:
+            self.user_locks[api_user] = PriorityLock()
+            self.user_windows[api_user] = SlidingWindow(self.user_limit, self.window_seconds)
+        user_window = self.user_windows[api_user]
+
+        self.queue_depth += 1
+        self.user_queue_depths[api_user] = self.user_queue_depths.get(api_user, 0) + 1
+        try:
+            async with self.user_locks[api_user].hold(priority):
+                await self._wait(user_window, api_user)
+                user_window.record(time.monotonic())
+        finally:
+            self.queue_depth -= 1
+            self.user_queue_depths[api_user] -= 1
+
+    async def acquire_global(self, priority: Priority = None):
+        "Wait until the budget shared by all users allows another call, then record it."
+        priority = current_priority.get() if priority is None else priority
+        self.queue_depth += 1
+        try:
+            async with self.global_lock.hold(priority):
+                await self._wait(self.global_window, "global")
+                self.global_window.record(time.monotonic())
+        finally:
+            self.queue_depth -= 1
+
+    async def _wait(self, window: SlidingWindow, name: str):
+        delay = window.wait_time(time.monotonic())
+        while delay > 0:
+            logger.debug(f"Rate limit reached for {name}, waiting {delay:.2f}s. Queue depth: {self.queue_depth}")
+            await asyncio.sleep(delay)
+            delay = window.wait_time(time.monotonic())
+
+
+def parse_reset_header(value: str, now: datetime = None) -> float | None:
+    """
+    Returns seconds until the rate limit resets, or None if the value can't be parsed.
+
+    Habitica sends X-RateLimit-Reset as a JavaScript date string, e.g. `Thu Apr 06 2023 18:30:46 GMT+0000 (Coordinated Universal Time)`.
+    Epoch seconds, epoch milliseconds, a plain number of seconds and HTTP dates are accepted too.
+    """
+    if value is None:
+        return None
+    now = now or datetime.now(tz=timezone.utc)
+    value = value.strip()
+    try:
+        number = float(value)
+        if number > 1e12:
+            return number/1000 - now.timestamp()
+        if number > 1e9:
+            return number - now.timestamp()
+        return number
+    except ValueError:
+        pass
+    try:
+        reset = datetime.strptime(value.split(" (")[0], "%a %b %d %Y %H:%M:%S GMT%z")
+    except ValueError:
+        try:
+            reset = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            logger.warning(f"Unable to parse rate limit reset header: {value}")
+            return None
+    return (reset - now).total_seconds()
+
+
+@dataclass
+class RateLimitBudget:
+    remaining: int
+    reset_at: float
+    next_call: float = 0
+
+
+class RateLimitPacer:
+    """
+    Tracks the budget Habitica reports in its X-RateLimit-Remaining and X-RateLimit-Reset response headers,
+    per api_user, and delays calls so the budget is never exhausted.
+
+    Calls pass straight through while more than `reserve` calls remain. Below that, the remaining calls are
+    spread evenly until the reset time, and with nothing left calls wait for the reset.
+
+    Habitica's reset header only has whole seconds, so `margin_seconds` is added to every reset time.
+    """
+    def __init__(self,
+                reserve: int = cfg.HABITICA_API_RATE_LIMIT_RESERVE,
+                margin_seconds: float = cfg.HABITICA_API_RATE_LIMIT_MARGIN_SECONDS
+            ) -> None:
+        self.reserve = reserve
+        self.margin_seconds = margin_seconds
+        self.budgets: dict[str, RateLimitBudget] = {}
+
+    def update(self, api_user, headers: Mapping[str, str], status: int = 200):
+        "Record the budget from a response's headers."
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_in = parse_reset_header(headers.get("X-RateLimit-Reset"))
+        if status == 429:
+            retry_after = parse_reset_header(headers.get("Retry-After"))
+            reset_in = retry_after if retry_after is not None else reset_in
+            remaining = 0
+        if remaining is None or reset_in is None:
+            return
+        previous = self.budgets.get(api_user)
+        self.budgets[api_user] = RateLimitBudget(
+            int(remaining),
+            time.monotonic() + max(reset_in, 0) + self.margin_seconds,
+            previous.next_call if previous else 0
+        )
+
+    def reserve_call(self, api_user) -> float:
+        "Take one call from api_user's budget. Returns how many seconds the caller must wait before making it."
+        budget = self.budgets.get(api_user)
+        now = time.monotonic()
+        if not budget or budget.reset_at <= now:
+            self.budgets.pop(api_user, None)
+            return 0
+        if budget.remaining > self.reserve:
+            budget.remaining -= 1
+            return 0
+        if budget.remaining <= 0:
+            return budget.reset_at - now
+
+        # Spread what is left of the budget until the reset
+        start = max(now, budget.next_call)
+        budget.next_call = start + (budget.reset_at - start) / budget.remaining
+        budget.remaining -= 1
+        return start - now
+
+    async def wait(self, api_user):
+        "Wait as long as the reported budget requires before making a call."
+        delay = self.reserve_call(api_user)
+        if delay > 0:
+            logger.debug(f"Pacing Habitica calls for {api_user}, waiting {delay:.2f}s")
+            await asyncio.sleep(delay)
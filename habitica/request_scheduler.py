@@ -0,0 +1,143 @@
+import asyncio
+import functools
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from loguru import logger
+import config as cfg
+
+class Priority(IntEnum):
+    "Request classes, most urgent first."
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+# Priority of Habitica calls made from the current context. Tasks created from it inherit it.
+current_priority = ContextVar('request_priority', default=Priority.NORMAL)
+
+@contextmanager
+def request_priority(priority: Priority):
+    """
+    Declare the class of Habitica calls made inside the block, e.g. for a Discord command:
+
+        with request_priority(Priority.INTERACTIVE):
+            await habitica_service.get_user_summary(api_user, api_token)
+    """
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def with_priority(priority: Priority):
+    "Decorator for coroutine functions whose Habitica calls all belong to one priority class."
+    def decorator(fcn):
+        @functools.wraps(fcn)
+        async def wrapper(*args, **kwargs):
+            with request_priority(priority):
+                return await fcn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RequestScheduler:
+    """
+    Admits outbound Habitica calls by priority class.
+
+    When calls are waiting, the most urgent class with free capacity goes first. Within a class, api_users take
+    turns so one user's bulk job can't starve others. Each class has its own concurrency cap under a shared total,
+    so background work can never take every slot.
+    """
+    def __init__(self,
+                max_concurrency: int = cfg.HABITICA_API_MAX_CONCURRENCY,
+                class_limits: dict[Priority, int] = None
+            ) -> None:
+        self.max_concurrency = max_concurrency
+        self.class_limits = class_limits or {
+            Priority.INTERACTIVE: cfg.HABITICA_API_INTERACTIVE_CONCURRENCY,
+            Priority.NORMAL: cfg.HABITICA_API_NORMAL_CONCURRENCY,
+            Priority.BACKGROUND: cfg.HABITICA_API_BACKGROUND_CONCURRENCY,
+        }
+        self.running = 0
+        self.running_by_class = {priority: 0 for priority in Priority}
+        # Per class, a queue of waiters for each api_user. Users are served round robin in insertion order.
+        self.waiting: dict[Priority, OrderedDict[str, deque[asyncio.Future]]] = {priority: OrderedDict() for priority in Priority}
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for users in self.waiting.values() for queue in users.values())
+
+    def class_queue_depth(self, priority: Priority) -> int:
+        return sum(len(queue) for queue in self.waiting[priority].values())
+
+    @asynccontextmanager
+    async def slot(self, api_user, priority: Priority = None):
+        "Hold a slot for one call. Uses the priority declared in the current context if none is given."
+        priority = current_priority.get() if priority is None else priority
+        await self.acquire(api_user, priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    async def acquire(self, api_user, priority: Priority):
+        # Run now unless someone at least as urgent is waiting and could run
+        if self._has_capacity(priority) and not any(self.waiting[p] and self._has_capacity(p) for p in Priority if p <= priority):
+            self._start(priority)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[priority].setdefault(api_user, deque()).append(future)
+        logger.debug(f"Queued {priority.name} Habitica call for {api_user}. Queue depth: {self.queue_depth}")
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled, hand it on
+                self.release(priority)
+            else:
+                self._remove(api_user, priority, future)
+            raise
+
+    def release(self, priority: Priority):
+        self.running -= 1
+        self.running_by_class[priority] -= 1
+        self._dispatch()
+
+    def _has_capacity(self, priority: Priority) -> bool:
+        return self.running < self.max_concurrency and self.running_by_class[priority] < self.class_limits[priority]
+
+    def _start(self, priority: Priority):
+        self.running += 1
+        self.running_by_class[priority] += 1
+
+    def _remove(self, api_user, priority: Priority, future: asyncio.Future):
+        queue = self.waiting[priority].get(api_user)
+        if queue and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self.waiting[priority][api_user]
+
+    def _next_waiter(self) -> tuple[Priority, asyncio.Future] | None:
+        for priority in Priority:
+            users = self.waiting[priority]
+            if not users or not self._has_capacity(priority):
+                continue
+            api_user, queue = next(iter(users.items()))
+            future = queue.popleft()
+            # Move the user to the back so the next user in this class goes next
+            del users[api_user]
+            if queue:
+                users[api_user] = queue
+            return priority, future
+        return None
+
+    def _dispatch(self):
+        while waiter := self._next_waiter():
+            priority, future = waiter
+            if future.done():
+                continue
+            self._start(priority)
+            future.set_result(None)
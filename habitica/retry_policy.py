@@ -0,0 +1,71 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable
+import aiohttp
+from loguru import logger
+import config as cfg
+
+# Statuses worth another attempt. Anything else is the caller's problem and won't change on retry.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# User fields that are set to an absolute value, so setting them twice has the same result as once.
+IDEMPOTENT_USER_FIELDS = {"stats.gp"}
+
+class RetryPolicy:
+    """
+    Retries failed Habitica calls that are safe to repeat, with exponential backoff and full jitter.
+
+    GETs are always safe. A PUT to `/user` is safe when it only sets fields in IDEMPOTENT_USER_FIELDS, and a PUT
+    to a webhook always is, since it sends the webhook's whole desired state.
+    Everything else, like posting to chat, runs once. Retries stop after `max_attempts` or once the next wait
+    would pass `max_elapsed_seconds`. HabiticaClient counts retries per method and endpoint in its metrics.
+    """
+    def __init__(self,
+                max_attempts: int = cfg.HABITICA_API_RETRY_MAX_ATTEMPTS,
+                base_delay_seconds: float = cfg.HABITICA_API_RETRY_BASE_DELAY_SECONDS,
+                max_delay_seconds: float = cfg.HABITICA_API_RETRY_MAX_DELAY_SECONDS,
+                max_elapsed_seconds: float = cfg.HABITICA_API_RETRY_MAX_ELAPSED_SECONDS,
+            ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_elapsed_seconds = max_elapsed_seconds
+
+    def is_idempotent(self, method: str, command_path: str, payload: dict = None) -> bool:
+        if method == "GET":
+            return True
+        if method == "PUT" and command_path == "/user" and payload:
+            return set(payload) <= IDEMPOTENT_USER_FIELDS
+        if method == "PUT" and command_path.startswith("/user/webhook/"):
+            return True
+        return False
+
+    def is_retryable(self, exception: Exception) -> bool:
+        "Transient network failures and retryable statuses."
+        status = getattr(exception, "status", None)
+        if status is not None:
+            return status in RETRYABLE_STATUSES
+        return isinstance(exception, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+    def backoff(self, attempt: int) -> float:
+        "Full jitter: a random wait up to the exponential backoff for this attempt."
+        return random.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * 2 ** attempt))
+
+    async def run(self, method: str, command_path: str, payload: dict, fcn: Callable[[], Awaitable[Any]]):
+        "Await fcn, calling it again on retryable failures if the call is idempotent."
+        idempotent = self.is_idempotent(method, command_path, payload)
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return await fcn()
+            except Exception as e:
+                attempt += 1
+                if not idempotent or not self.is_retryable(e) or attempt >= self.max_attempts:
+                    raise
+                delay = self.backoff(attempt)
+                if time.monotonic() - start + delay > self.max_elapsed_seconds:
+                    raise
+                logger.warning(f"HabiticaAPI: {method} {command_path} failed ({e!r}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key. The first caller runs the call and everyone who asks for the same
+    key while it is in flight awaits the same result, so N identical requests become one.
+
+    Results are shared between callers and must be treated as read only. Exceptions from the call are shared too,
+    but if the caller running it is cancelled the others aren't: one of them runs the call again instead.
+    """
+    def __init__(self) -> None:
+        self.in_flight: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fcn: Callable[[], Awaitable[Any]]):
+        while (future := self.in_flight.get(key)) is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled() or self.cancelling():
+                    raise
+                # Only the caller running the call was cancelled. The first one back here takes over.
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        self.calls += 1
+        try:
+            result = await fcn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+    @staticmethod
+    def cancelling() -> bool:
+        "Whether the current task has been asked to cancel. Always False before Python 3.11, which can't tell."
+        task = asyncio.current_task()
+        return bool(task.cancelling()) if hasattr(task, "cancelling") else False
+
+def request_key(method: str, command_path: str, api_user, params: dict = None, headers: dict = None) -> Hashable:
+    "Key for a Habitica call. Calls with the same key return the same response."
+    return (
+        method,
+        command_path,
+        api_user,
+        tuple(sorted(params.items())) if params else None,
+        tuple(sorted(headers.items())) if headers else None,
+    )
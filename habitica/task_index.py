@@ -0,0 +1,139 @@
+import time
+import zlib
+from dataclasses import dataclass, field
+from loguru import logger
+from habitica.model.task import HabiticaTask, HabiticaTasks, TASK_CLASSES
+from habitica.model.webhook import Webhook
+from app.metrics_service import MetricsRegistry, registry
+import config as cfg
+
+# taskActivity webhook types that carry the task as it is after the change
+UPSERT_WEBHOOKS = ("created", "updated", "scored", "checklistScored")
+
+def task_checksum(task_id: str, updated_at: str) -> int:
+    return zlib.crc32(f"{task_id}:{updated_at}".encode())
+
+@dataclass
+class UserTaskIndex:
+    """
+    One user's tasks by id, bucketed by type in Habitica's order.
+
+    `checksum` is the XOR of every task's id and updatedAt checksum. It is kept up to date as tasks change, so it
+    can be compared with a fresh `/tasks/user` response without walking the index.
+    """
+    buckets: dict[str, dict[str, HabiticaTask]] = field(default_factory=lambda: {task_type: {} for task_type in TASK_CLASSES})
+    checksum: int = 0
+    synced_at: float = float("-inf")
+    view: HabiticaTasks | None = None
+
+    @staticmethod
+    def from_tasks(tasks: HabiticaTasks) -> "UserTaskIndex":
+        index = UserTaskIndex(synced_at=time.monotonic())
+        for task_type in TASK_CLASSES:
+            for task in getattr(tasks, task_type):
+                index.put(task)
+        index.view = tasks
+        return index
+
+    def get(self, task_id: str) -> HabiticaTask | None:
+        for bucket in self.buckets.values():
+            if task_id in bucket:
+                return bucket[task_id]
+        return None
+
+    def put(self, task: HabiticaTask):
+        "Add or replace task. New tasks go at the end of their bucket, replaced tasks keep their place."
+        bucket = self.buckets[task.type]
+        old = bucket.get(task.id)
+        if old is not None:
+            self.checksum ^= task_checksum(old.id, old.updatedAt)
+        bucket[task.id] = task
+        self.checksum ^= task_checksum(task.id, task.updatedAt)
+        self.view = None
+
+    def remove(self, task_id: str) -> HabiticaTask | None:
+        for bucket in self.buckets.values():
+            task = bucket.pop(task_id, None)
+            if task is not None:
+                self.checksum ^= task_checksum(task.id, task.updatedAt)
+                self.view = None
+                return task
+        return None
+
+    def tasks(self) -> HabiticaTasks:
+        "The indexed tasks as a HabiticaTasks. Built once per change and shared until the next one."
+        if self.view is None:
+            self.view = HabiticaTasks(**{task_type: list(bucket.values()) for task_type, bucket in self.buckets.items()})
+        return self.view
+
+class TaskIndex:
+    """
+    Per api_user index of tasks, seeded from `/tasks/user` and patched in place from taskActivity webhooks.
+
+    Indexed tasks are served without calling Habitica. After `resync_seconds` the next read fetches the tasks again
+    and compares checksums, in case webhooks were missed or arrived out of order. A mismatch replaces the index.
+    """
+    def __init__(self, resync_seconds: float = cfg.HABITICA_TASK_INDEX_RESYNC_SECONDS, metrics: MetricsRegistry = None) -> None:
+        self.resync_seconds = resync_seconds
+        self.users: dict[str, UserTaskIndex] = {}
+        metrics = metrics or registry
+        self.webhooks = metrics.counter(
+            "habitica_task_index_webhooks_total", "taskActivity webhooks applied to the task index, by webhook type", ("type",))
+        self.resyncs = metrics.counter(
+            "habitica_task_index_resyncs_total", "Task index checks against Habitica, by whether the checksums matched", ("result",))
+
+    def get(self, api_user) -> HabiticaTasks | None:
+        "Indexed tasks for api_user, or None if they were never fetched or are due a resync."
+        index = self.users.get(api_user)
+        if index and time.monotonic() - index.synced_at < self.resync_seconds:
+            return index.tasks()
+        return None
+
+    def sync(self, api_user, tasks: HabiticaTasks) -> HabiticaTasks:
+        "Replace api_user's index with freshly fetched tasks, unless the index already matches them."
+        fresh = UserTaskIndex.from_tasks(tasks)
+        index = self.users.get(api_user)
+        if index is None:
+            self.users[api_user] = fresh
+            return tasks
+        if index.checksum == fresh.checksum:
+            self.resyncs.inc(result="match")
+            index.synced_at = fresh.synced_at
+            # Checksums ignore order, so take Habitica's
+            index.buckets, index.view = fresh.buckets, tasks
+            return tasks
+        self.resyncs.inc(result="mismatch")
+        logger.warning(f"Task index for {api_user} was out of date with Habitica, replacing it.")
+        self.users[api_user] = fresh
+        return tasks
+
+    def indexed(self, api_user) -> bool:
+        "Whether api_user has an index for webhooks to patch, due a resync or not."
+        return api_user in self.users
+
+    def apply_webhook(self, webhook: Webhook) -> bool:
+        """
+        Patch the index from a decoded taskActivity webhook. Returns True if the index changed.
+        Users that aren't indexed yet are skipped, the first read fetches their tasks anyway.
+        """
+        index = self.users.get(webhook.user.get('_id'))
+        task = webhook.task
+        if index is None or task is None:
+            return False
+        if webhook.type == "deleted":
+            changed = index.remove(task.id) is not None
+        elif webhook.type in UPSERT_WEBHOOKS:
+            current = index.get(task.id)
+            # ISO timestamps compare in time order. Older deliveries are ignored.
+            if current is not None and current.updatedAt > (task.updatedAt or ""):
+                return False
+            index.put(task)
+            changed = True
+        else:
+            return False
+        self.webhooks.inc(type=webhook.type)
+        return changed
+
+    def invalidate(self, api_user):
+        if self.users.pop(api_user, None):
+            logger.debug(f"Dropped task index for Habitica user {api_user}")
@@ -0,0 +1,99 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+from loguru import logger
+import config as cfg
+
+# View name for the full user document. Projected fetches use their userFields string as the view.
+FULL_USER = "user"
+
+@dataclass
+class UserCacheEntry:
+    response: dict
+    etag: str | None
+    fetched_at: float
+    user: Any = None
+
+class UserCache:
+    """
+    Per api_user cache of raw Habitica `/user` responses and the models parsed from them.
+
+    Each api_user can have the full document and any number of projected views cached. Entries younger than
+    `ttl_seconds` are served without calling Habitica. Older entries keep their ETag so the next fetch can be a
+    conditional GET, and a 304 reuses both the raw response and the parsed model.
+    Invalidating an api_user drops all of its views, and keeps responses to requests sent before it out of the cache.
+    """
+    def __init__(self, ttl_seconds: float = cfg.HABITICA_USER_CACHE_TTL_SECONDS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.entries: dict[str, dict[str, UserCacheEntry]] = {}
+        self.generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations, "size": len(self.entries)}
+
+    def get(self, api_user, view: str = FULL_USER) -> UserCacheEntry | None:
+        "Returns the entry for api_user if it is still fresh. Counts a hit or a miss."
+        entry = self.entries.get(api_user, {}).get(view)
+        if entry and time.monotonic() - entry.fetched_at < self.ttl_seconds:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def peek(self, api_user, view: str = FULL_USER) -> UserCacheEntry | None:
+        "The cached entry, fresh or not. Doesn't count as a hit or a miss."
+        return self.entries.get(api_user, {}).get(view)
+
+    def etag(self, api_user, view: str = FULL_USER) -> str | None:
+        "ETag of the cached response, fresh or not."
+        entry = self.peek(api_user, view)
+        return entry.etag if entry else None
+
+    def generation(self, api_user) -> int:
+        "Goes up every time api_user is invalidated. Taken before a request is sent, and given to store with its response."
+        return self.generations.get(api_user, 0)
+
+    def store(self, api_user, response: dict, etag: str = None, view: str = FULL_USER, generation: int = None) -> UserCacheEntry:
+        """
+        Cache response for api_user. If `generation` is given and api_user was invalidated since it was taken, the
+        response may be from before the change that invalidated it, so the entry is returned but not cached.
+        """
+        entry = UserCacheEntry(response, etag, time.monotonic())
+        if generation is not None and generation != self.generation(api_user):
+            logger.debug(f"Not caching Habitica user {api_user}, it was invalidated while it was fetched")
+            return entry
+        self.entries.setdefault(api_user, {})[view] = entry
+        return entry
+
+    def revalidate(self, api_user, entry: UserCacheEntry) -> UserCacheEntry:
+        """
+        Habitica answered 304 Not Modified to the conditional GET sent for `entry`, so it is fresh again.
+        If api_user was invalidated while the request was in flight, the entry is still the right answer for the
+        caller but stays out of the cache.
+        """
+        entry.fetched_at = time.monotonic()
+        self.revalidations += 1
+        return entry
+
+    def expire(self, api_user):
+        "Mark all of api_user's entries stale but keep them, so the next fetch revalidates with the ETag."
+        for entry in self.entries.get(api_user, {}).values():
+            entry.fetched_at = float("-inf")
+
+    def invalidate(self, api_user):
+        self.generations[api_user] = self.generation(api_user) + 1
+        if self.entries.pop(api_user, None):
+            logger.debug(f"Invalidated cached Habitica user {api_user}")
+
+    def load_user(self, api_user, response: dict, loader: Callable[[dict], Any]):
+        "Parse response with loader, reusing the parsed object if response is currently cached."
+        for entry in self.entries.get(api_user, {}).values():
+            if entry.response is response:
+                if entry.user is None:
+                    entry.user = loader(response)
+                return entry.user
+        return loader(response)
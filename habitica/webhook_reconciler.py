@@ -0,0 +1,153 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+from loguru import logger
+from app.events import habitica_events
+from habitica.request_scheduler import Priority, with_priority
+import config as cfg
+
+# Webhooks with this in their label belong to the bot. Anything else on the user is left alone.
+WEBHOOK_LABEL = "Discord Habitica"
+
+class WebhookReconcileException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+        logger.error(args[0])
+
+@dataclass
+class DesiredWebhook:
+    type: str
+    url: str
+    options: dict = field(default_factory=dict)
+
+    @property
+    def label(self) -> str:
+        return f"{WEBHOOK_LABEL} {self.type} Webhook"
+
+    def payload(self) -> dict:
+        return {"url": self.url, "label": self.label, "type": self.type, "options": self.options, "enabled": True}
+
+    def matches(self, webhook: dict) -> bool:
+        "Same URL and options, and enabled. Options Habitica filled in with defaults are ignored."
+        options = webhook.get('options') or {}
+        return (
+            webhook.get('url') == self.url
+            and webhook.get('enabled', True)
+            and all(options.get(key) == value for key, value in self.options.items())
+        )
+
+@dataclass
+class WebhookPlan:
+    create: list[DesiredWebhook] = field(default_factory=list)
+    update: list[tuple[str, DesiredWebhook]] = field(default_factory=list)
+    delete: list[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.create or self.update or self.delete)
+
+    def __str__(self) -> str:
+        return f"{len(self.create)} to create, {len(self.update)} to update, {len(self.delete)} to delete"
+
+def desired_webhooks(url: str, party_id: str = None) -> list[DesiredWebhook]:
+    "The webhooks the bot needs for a user, with the options from the subscription events."
+    subscriptions = [
+        habitica_events.TaskWebhookSubscriptionEvent(None, None),
+        habitica_events.UserWebhookSubscriptionEvent(None, None),
+        habitica_events.QuestWebhookSubscriptionEvent(None, None),
+    ]
+    if party_id:
+        subscriptions.append(habitica_events.GroupChatWebhookSubscriptionEvent(None, None, party_id))
+    return [DesiredWebhook(subscription.webhook_type, url, subscription.options) for subscription in subscriptions]
+
+def plan_webhooks(existing: list[dict], desired: list[DesiredWebhook]) -> WebhookPlan:
+    """
+    Compare the bot's webhooks on a user with the desired set, by type. The first webhook of each desired type
+    is kept and updated if its URL, options or enabled flag differ. Duplicates and types no longer wanted are
+    deleted, and missing types are created.
+    """
+    plan = WebhookPlan()
+    managed: dict[str, list[dict]] = {}
+    for webhook in existing:
+        if WEBHOOK_LABEL in (webhook.get('label') or ""):
+            managed.setdefault(webhook['type'], []).append(webhook)
+    for want in desired:
+        webhooks = managed.pop(want.type, [])
+        if not webhooks:
+            plan.create.append(want)
+            continue
+        keep, *duplicates = webhooks
+        if not want.matches(keep):
+            plan.update.append((keep['id'], want))
+        plan.delete.extend(webhook['id'] for webhook in duplicates)
+    for webhooks in managed.values():
+        plan.delete.extend(webhook['id'] for webhook in webhooks)
+    return plan
+
+class WebhookReconciler:
+    """
+    Brings a user's webhooks in line with what the bot needs, making only the calls the difference requires.
+
+    Create, update and delete calls run concurrently, at most `max_concurrency` at a time across all users.
+    `sweep` reconciles many users, at most `sweep_concurrency` at a time.
+    """
+    def __init__(self,
+                habitica_api,
+                get_user_summary: Callable,
+                url: str = None,
+                max_concurrency: int = cfg.HABITICA_WEBHOOK_RECONCILE_CONCURRENCY,
+                sweep_concurrency: int = cfg.HABITICA_WEBHOOK_SWEEP_CONCURRENCY,
+            ) -> None:
+        self.habitica_api = habitica_api
+        self.get_user_summary = get_user_summary
+        self.url = url
+        self.calls = asyncio.Semaphore(max_concurrency)
+        self.sweep_concurrency = sweep_concurrency
+
+    @with_priority(Priority.BACKGROUND)
+    async def reconcile(self, api_user, api_token, desired: list[DesiredWebhook] = None) -> WebhookPlan:
+        "Reconcile api_user's webhooks with `desired`, by default every webhook the bot uses."
+        user = await self.get_user_summary(api_user, api_token, fresh=True)
+        if desired is None:
+            desired = desired_webhooks(self.url, user.party._id)
+        plan = plan_webhooks(user.webhooks, desired)
+        if plan:
+            logger.info(f"Reconciling webhooks for {user.profile.name}: {plan}")
+            await self.apply(api_user, api_token, plan)
+        return plan
+
+    async def remove_all(self, api_user, api_token) -> WebhookPlan:
+        "Delete every webhook the bot created on api_user."
+        return await self.reconcile(api_user, api_token, desired=[])
+
+    async def apply(self, api_user, api_token, plan: WebhookPlan):
+        async def call(fcn, *args):
+            async with self.calls:
+                return await fcn(api_user, api_token, *args)
+        results = await asyncio.gather(
+            *[call(self.habitica_api.create_webhook, want.payload()) for want in plan.create],
+            *[call(self.habitica_api.update_webhook, id, want.payload()) for id, want in plan.update],
+            *[call(self.habitica_api.delete_webhook, id) for id in plan.delete],
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise WebhookReconcileException(f"{len(errors)} of {len(results)} webhook changes failed for api_user {api_user}: {errors[0]}")
+
+    async def sweep(self, links: Iterable) -> dict[str, WebhookPlan | Exception]:
+        """
+        Reconcile every linked Habitica user, like HabiticaUserLinks from AppUserService. A failure for one user
+        is logged and returned in its place, and doesn't stop the others.
+        """
+        users = asyncio.Semaphore(self.sweep_concurrency)
+        async def reconcile(link):
+            async with users:
+                try:
+                    return await self.reconcile(link.api_user, link.api_token)
+                except Exception as e:
+                    logger.error(f"Could not reconcile webhooks for api_user {link.api_user}: {e}")
+                    return e
+        links = list(links)
+        results = await asyncio.gather(*[reconcile(link) for link in links])
+        changed = sum(1 for result in results if isinstance(result, WebhookPlan) and result)
+        logger.info(f"Webhook sweep reconciled {len(links)} users, {changed} needed changes")
+        return {link.api_user: result for link, result in zip(links, results)}
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# config opens a file store when it is imported, keep it out of the working tree
+os.environ.setdefault("STORE_DIR", tempfile.mkdtemp(prefix="discord-habitica-test-store-"))
@@ -0,0 +1,80 @@
+"""
+compute_stats over synthetic users with years of daily, habit and exp history, against the same completion
+rate and streaks computed with a Python loop over HistoryEntry objects.
+
+Run from the repo root: python -m test.analytics_benchmark
+"""
+import random
+import time
+from habitica.model.task import TaskHistory, HistoryEntry
+from habitica.analytics import MS_PER_DAY, UserHistories, compute_stats
+
+USERS = 2000
+DAYS = 3 * 365
+DAILIES = 5
+HABITS = 3
+START = 1_600_000_000_000
+
+def synthetic_users(seed: int = 0) -> list[UserHistories]:
+    rng = random.Random(seed)
+    users = []
+    for _ in range(USERS):
+        dailies = []
+        for _ in range(DAILIES):
+            history = TaskHistory()
+            skill = rng.random()
+            for day in range(DAYS):
+                due = rng.random() < 0.8
+                history.append(HistoryEntry(START + day * MS_PER_DAY, 1.0, None, None, isDue=due, completed=due and rng.random() < skill))
+            dailies.append(history)
+        habits = []
+        for _ in range(HABITS):
+            history = TaskHistory()
+            for day in range(0, DAYS, 3):
+                history.append(HistoryEntry(START + day * MS_PER_DAY, 1.0, rng.randint(0, 3), rng.randint(0, 2)))
+            habits.append(history)
+        exp = [(START + day * MS_PER_DAY, float(day * 10 % 1000)) for day in range(DAYS)]
+        users.append(UserHistories(dailies, habits, exp, rng.choice([-60, 0, 300])))
+    return users
+
+def python_stats(users: list[UserHistories]) -> list[tuple[float, int, int]]:
+    "Completion rate, current and longest streak, entry by entry."
+    results = []
+    for user in users:
+        done = due = best_current = best_longest = 0
+        for history in user.dailies:
+            run = longest = 0
+            for entry in history:
+                if entry.isDue is False or entry.completed is None:
+                    continue
+                due += 1
+                if entry.completed:
+                    done += 1
+                    run += 1
+                    longest = max(longest, run)
+                else:
+                    run = 0
+            best_current = max(best_current, run)
+            best_longest = max(best_longest, longest)
+        results.append((done / due if due else float("nan"), best_current, best_longest))
+    return results
+
+def timed(fcn, *args):
+    start = time.perf_counter()
+    result = fcn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    users = synthetic_users()
+    entries = USERS * (DAILIES * DAYS + HABITS * len(users[0].habits[0]) + DAYS)
+    print(f"{USERS} users, {DAYS} days, {entries:,} history entries")
+    expected, loop_seconds = timed(python_stats, users)
+    stats, numpy_seconds = timed(compute_stats, users, START + DAYS * MS_PER_DAY)
+    for (rate, current, longest), user_stats in zip(expected, stats):
+        assert abs(rate - user_stats.completion_rate) < 1e-9
+        assert (current, longest) == (user_stats.current_streak, user_stats.longest_streak)
+    print(f"python loop (rate + streaks only): {loop_seconds:6.2f}s")
+    print(f"compute_stats (every stat):        {numpy_seconds:6.2f}s ({loop_seconds / numpy_seconds:.0f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import unittest
+import json
+import math
+import numpy as np
+from habitica.model.task import HabiticaTasks, TaskHistory
+from habitica.analytics import (
+    MS_PER_DAY, UserHistories, SeriesBatch, compute_stats, history_date_ms, rolling_mean, streaks, weekday_completion,
+)
+
+# 2024-01-01 was a Monday
+MONDAY = history_date_ms("2024-01-01T12:00:00Z")
+
+def daily(*outcomes, start=MONDAY) -> TaskHistory:
+    "A daily with one entry per day. True/False is completed/missed, None is a day it was not due."
+    return TaskHistory.load([
+        {"date": start + day * MS_PER_DAY, "value": 1, "isDue": outcome is not None, "completed": bool(outcome)}
+        for day, outcome in enumerate(outcomes)
+    ])
+
+def habit(*scores, start=MONDAY) -> TaskHistory:
+    return TaskHistory.load([
+        {"date": start + day * MS_PER_DAY, "value": 1, "scoredUp": up, "scoredDown": down}
+        for day, (up, down) in enumerate(scores)
+    ])
+
+class AnalyticsTest(unittest.TestCase):
+    def test_streaks_skip_days_not_due(self):
+        batch = SeriesBatch.from_task_histories([
+            daily(True, True, False, True, None, True, True),
+            daily(True, True, True, False),
+            daily(),
+            daily(True, True, True),
+        ], [0, 0, 0, 1])
+        current, longest = streaks(batch)
+        self.assertEqual(current.tolist(), [3, 0, 0, 3])
+        self.assertEqual(longest.tolist(), [3, 3, 0, 3])
+
+    def test_completion_and_rolling(self):
+        users = [
+            UserHistories(dailies=[daily(True, False, True, True), daily(None, True)]),
+            UserHistories(dailies=[daily(*[False] * 7, *[True] * 7)]),
+            UserHistories(),
+        ]
+        stats = compute_stats(users, now_ms=MONDAY + 4 * MS_PER_DAY, recent_days=2)
+        self.assertAlmostEqual(stats[0].completion_rate, 4 / 5)
+        self.assertAlmostEqual(stats[0].recent_completion_rate, 1.0)
+        self.assertAlmostEqual(stats[0].rolling_completion, (3 / 4 + 1) / 2)
+        self.assertAlmostEqual(stats[1].completion_rate, 0.5)
+        self.assertAlmostEqual(stats[1].rolling_completion, 1.0)
+        self.assertEqual(stats[1].current_streak, 7)
+        self.assertTrue(math.isnan(stats[2].completion_rate))
+        self.assertTrue(math.isnan(stats[2].rolling_completion))
+        self.assertEqual(stats[2].longest_streak, 0)
+
+    def test_rolling_mean_restarts_per_series(self):
+        values = np.array([1, 0, 1, 1, 1, 0], dtype=np.float64)
+        series = np.array([0, 0, 0, 1, 1, 1])
+        self.assertEqual(rolling_mean(values, series, 2).tolist(), [1, 0.5, 0.5, 1, 1, 0.5])
+
+    def test_weekday_completion(self):
+        # Mondays completed, Tuesdays missed, over two weeks
+        outcomes = [True, False, None, None, None, None, None] * 2
+        batch = SeriesBatch.from_task_histories([daily(*outcomes)], [0])
+        weekdays = weekday_completion(batch, 1)
+        self.assertEqual(weekdays[0, :2].tolist(), [1.0, 0.0])
+        self.assertTrue(np.isnan(weekdays[0, 2:]).all())
+
+        # 13 hours behind UTC, noon on Monday is still Sunday
+        shifted = weekday_completion(batch, 1, np.array([13 * 60]))
+        self.assertEqual(shifted[0, 6], 1.0)
+        self.assertEqual(shifted[0, 0], 0.0)
+
+    def test_habits_and_exp_velocity(self):
+        users = [
+            UserHistories(
+                habits=[habit((3, 1), (0, 0)), habit((1, 3))],
+                exp=[(MONDAY, 100), (MONDAY + MS_PER_DAY, 150), (MONDAY + 3 * MS_PER_DAY, 250), (MONDAY + 4 * MS_PER_DAY, 10)],
+            ),
+            UserHistories(exp=[(MONDAY, 5)]),
+        ]
+        stats = compute_stats(users, now_ms=MONDAY)
+        self.assertAlmostEqual(stats[0].habit_up_ratio, 0.5)
+        # +50 in a day, +100 in two days, the level up is skipped
+        self.assertAlmostEqual(stats[0].exp_per_day, 50)
+        self.assertTrue(math.isnan(stats[1].exp_per_day))
+        self.assertTrue(math.isnan(stats[1].habit_up_ratio))
+
+    def test_sample_tasks(self):
+        with open("test/sample_data/tasks_model.json") as fh:
+            tasks = HabiticaTasks.load(json.load(fh))
+        stats = compute_stats([UserHistories.from_models(tasks)])
+        self.assertEqual(len(stats[0].weekday_completion), 7)
+        self.assertGreaterEqual(stats[0].longest_streak, stats[0].current_streak)
@@ -6,4 +6,52 @@ from app.events import bank_events, event_service
 from persistence.memory_driver_new import PersistenceMemoryDriver
 from habitica.habitica_service import HabiticaService
 import test.habitica_api_mock as api
+from app.transaction_service import AppliedTransactions
 
+class RecordingHabiticaService:
+    "Records gold changes instead of calling Habitica"
+    def __init__(self) -> None:
+        self.gold_added = []
+
+    async def add_user_gold(self, api_user, api_token, amount):
+        self.gold_added.append((api_user, amount))
+
+class BankWithdrawReplayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.driver = PersistenceMemoryDriver()
+        self.app_user_service = AppUserService(self.driver)
+        self.bank_service = BankService(self.driver)
+        self.habitica_service = RecordingHabiticaService()
+        event_service.subscribers.pop(bank_events.WithdrawGold.type, None)
+        self.applied_transactions = AppliedTransactions(self.driver)
+        self.handlers = BankEventHandlers(self.bank_service, self.app_user_service, self.habitica_service, self.applied_transactions)
+
+        app_user = self.app_user_service.create_app_user("Knight1_DISCORD", "Knight1_DISCORD")
+        self.app_user_service.add_habitica_user_link(app_user.id, "API_USER", "API_TOKEN", "Knight1_Habitica")
+        bank = self.bank_service.create_bank("Knights of Nih! Bank", app_user.id)
+        self.account = self.bank_service.open_account("Knights of Nih! Account", bank.id, app_user.id, "API_USER")
+        self.account.balance = 100.0
+
+    async def asyncTearDown(self):
+        event_service.subscribers.pop(bank_events.WithdrawGold.type, None)
+
+    async def test_replayed_withdraw_is_applied_once(self):
+        event = bank_events.WithdrawGold(20.0, self.account.bank_id, self.account.id, "For a shrubbery", None)
+        await event_service.dispatch(event)
+        # Replayed after a crash, before the journal marked it complete
+        await event_service.dispatch(event)
+
+        self.assertEqual(self.account.balance, 80.0)
+        self.assertEqual(self.habitica_service.gold_added, [("API_USER", 20.0)])
+        # Kept in the transaction store for the next run until the journal completes the event
+        self.assertTrue(AppliedTransactions(self.driver).applied(event.transaction_id))
+        self.applied_transactions.forget(event)
+        self.assertFalse(AppliedTransactions(self.driver).applied(event.transaction_id))
+
+    async def test_failed_withdraw_is_not_marked(self):
+        event = bank_events.WithdrawGold(200.0, self.account.bank_id, self.account.id, "For a shrubbery", None)
+        failed = await event_service.dispatch(event)
+
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(self.habitica_service.gold_added, [])
+        self.assertFalse(self.applied_transactions.applied(event.transaction_id))
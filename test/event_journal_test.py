@@ -0,0 +1,196 @@
+import asyncio
+import tempfile
+import unittest
+from dataclasses import dataclass
+from pathlib import Path
+from app.events import event_service
+from app.events.event_journal import EventJournal
+from app.metrics_service import MetricsRegistry
+from habitica.events.habitica_events import AddGoldEvent
+
+@dataclass
+class MoveGold:
+    account_id: str
+    amount: float
+    interaction: object = None
+    type = "journal_test_move_gold"
+    journal_exclude = ("interaction",)
+
+class Receipt:
+    type = "journal_test_receipt"
+    def __init__(self, payload) -> None:
+        self.payload = payload
+
+class Unjournaled:
+    type = "journal_test_unjournaled"
+
+class EventJournalTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.dir.name) / "events.journal"
+        self.handled = []
+        self.failing = set()
+        # Handlers for these never return, like when the process dies half way
+        self.hanging = set()
+        self.hung = asyncio.Event()
+        for cls in (MoveGold, Receipt, Unjournaled):
+            event_service.subscribers.pop(cls.type, None)
+            event_service.subscribe(cls.type, self.handle)
+        self.journals = []
+
+    async def asyncTearDown(self) -> None:
+        event_service.journal = None
+        for journal in self.journals:
+            await journal.close()
+        for cls in (MoveGold, Receipt, Unjournaled):
+            event_service.subscribers.pop(cls.type, None)
+        self.dir.cleanup()
+
+    async def handle(self, event):
+        key = getattr(event, "account_id", None)
+        if key in self.failing:
+            raise ValueError(f"{key} failed")
+        if key in self.hanging:
+            self.hung.set()
+            await asyncio.Event().wait()
+        self.handled.append(event)
+
+    async def cut_short(self, coroutine):
+        "Run coroutine until a handler hangs, then cancel it like a crash would."
+        task = asyncio.create_task(coroutine)
+        await self.hung.wait()
+        self.hung.clear()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    def open(self, event_classes=(MoveGold, Receipt), **kwargs) -> EventJournal:
+        journal = EventJournal(self.path, event_classes, flush_window_seconds=0.001, metrics=MetricsRegistry(), **kwargs)
+        journal.open()
+        self.journals.append(journal)
+        event_service.journal = journal
+        return journal
+
+    async def restart(self, journal: EventJournal, **kwargs) -> EventJournal:
+        await journal.close()
+        return self.open(**kwargs)
+
+    async def test_finished_events_are_not_replayed(self):
+        journal = self.open()
+        self.failing.add("b")
+        self.hanging.add("c")
+        await event_service.post_event(MoveGold("a", 10, interaction=object()))
+        await event_service.post_event(MoveGold("b", 20))
+        await event_service.post_event(Receipt({"user": {"_id": "u1"}}))
+        await event_service.post_event(Unjournaled())
+        await self.cut_short(event_service.post_event(MoveGold("c", 30)))
+        self.assertEqual(len(self.handled), 3)
+        # The failed event is complete, with the handler that failed on it
+        self.assertIn('{"op": "complete", "seq": 2, "failed": ["EventJournalTest.handle"]}', self.path.read_text())
+
+        journal = await self.restart(journal)
+        self.assertEqual([entry.data for entry in journal.incomplete.values()], [{"account_id": "c", "amount": 30}])
+        # Compacted down to the one incomplete event, after the record of the last sequence number
+        self.assertEqual(len(self.path.read_text().splitlines()), 2)
+
+        self.hanging.clear()
+        self.handled.clear()
+        await journal.replay(event_service.dispatch)
+        self.assertEqual(self.handled, [MoveGold("c", 30, None)])
+
+        journal = await self.restart(journal)
+        self.assertEqual(journal.incomplete, {})
+        await event_service.post_event(MoveGold("d", 5))
+        # Sequence numbers keep going after a restart
+        self.assertEqual(journal.next_seq, 6)
+
+    async def test_replay_in_order_and_give_up(self):
+        journal = self.open(max_replays=2)
+        self.hanging.update({"a", "b"})
+        for account_id in ("a", "b"):
+            await self.cut_short(event_service.post_event(MoveGold(account_id, 1)))
+        self.hanging.discard("a")
+
+        for replays in range(2):
+            journal = await self.restart(journal, max_replays=2)
+            self.handled.clear()
+            await self.cut_short(journal.replay(event_service.dispatch))
+            if replays == 0:
+                self.assertEqual([event.account_id for event in self.handled], ["a"])
+
+        journal = await self.restart(journal, max_replays=2)
+        self.assertEqual([entry.replays for entry in journal.incomplete.values()], [2])
+        self.handled.clear()
+        await journal.replay(event_service.dispatch)
+        # Given up on without calling the handlers again
+        self.assertEqual(self.handled, [])
+        journal = await self.restart(journal, max_replays=2)
+        self.assertEqual(journal.incomplete, {})
+
+    async def test_torn_record_is_skipped(self):
+        journal = self.open()
+        self.hanging.add("a")
+        await self.cut_short(event_service.post_event(MoveGold("a", 1)))
+        await journal.close()
+        with self.path.open("a") as fh:
+            fh.write('{"op": "append", "seq": 2, "ty')
+        journal = self.open()
+        self.assertEqual(list(journal.incomplete), [1])
+
+    async def test_tokens_are_not_journaled(self):
+        journal = self.open(event_classes=[AddGoldEvent])
+        event = AddGoldEvent("user-1", "secret-token", 5)
+        await journal.append(event)
+        self.assertNotIn("secret-token", self.path.read_text())
+
+        journal = await self.restart(journal, event_classes=[AddGoldEvent])
+        replayed = journal.decode(journal.incomplete[1])
+        self.assertIsNone(replayed.api_token)
+        self.assertEqual(replayed.transaction_id, event.transaction_id)
+
+    async def test_group_commit(self):
+        journal = self.open()
+        await asyncio.gather(*[event_service.post_event(MoveGold(f"user-{i}", 1)) for i in range(100)])
+        self.assertEqual(len(self.handled), 100)
+        # 100 appends and 100 completions, a few fsyncs
+        self.assertLessEqual(journal.fsyncs, 4)
+        journal = await self.restart(journal)
+        self.assertEqual(journal.incomplete, {})
+
+    async def test_completed_events_are_passed_on(self):
+        completed = []
+        journal = self.open(on_complete=completed.append)
+        self.hanging.add("b")
+        await event_service.post_event(MoveGold("a", 1))
+        await self.cut_short(event_service.post_event(MoveGold("b", 2)))
+        self.assertEqual(completed, [MoveGold("a", 1)])
+
+        journal = await self.restart(journal, on_complete=completed.append)
+        self.hanging.clear()
+        await journal.replay(event_service.dispatch)
+        self.assertEqual(completed, [MoveGold("a", 1), MoveGold("b", 2)])
+
+    async def test_published_events_are_journaled_before_queued(self):
+        journal = self.open()
+        bus = event_service.EventBus(workers=1, max_queue_size=1)
+        await bus.start()
+        self.hanging.update({"a", "b"})
+        await bus.publish(MoveGold("a", 1), wait=False)
+        await self.hung.wait()
+        await bus.publish(MoveGold("b", 2), wait=False)
+        # On disk before publish returns, while still queued behind a
+        self.assertEqual(len(self.path.read_text().splitlines()), 3)
+
+        with self.assertRaises(event_service.QueueFullException):
+            await bus.publish(MoveGold("c", 3), timeout=0.01)
+        self.assertIn('{"op": "complete", "seq": 3, "failed": ["EventBus.publish"]}', self.path.read_text())
+        # Rejected before it is journaled when it can't wait
+        with self.assertRaises(event_service.QueueFullException):
+            await bus.publish(MoveGold("d", 4), wait=False)
+        self.assertEqual(journal.next_seq, 4)
+
+        # The process dies with a half handled and b queued
+        for worker in bus.workers:
+            worker.cancel()
+        await asyncio.gather(*bus.workers, return_exceptions=True)
+        journal = await self.restart(journal)
+        self.assertEqual([entry.data['account_id'] for entry in journal.incomplete.values()], ["a", "b"])
@@ -1,5 +1,7 @@
 import unittest
+import asyncio
 from  app.events import event_service
+from habitica.request_scheduler import Priority, request_priority, current_priority
 
 
 class Event:
@@ -25,4 +27,253 @@ class EventTest(unittest.IsolatedAsyncioTestCase):
         event_service.subscribe(Event.type,eggs.set_true_flag)
         await event_service.post_event(Event(True))
         self.assertEqual(spam.true_flag, True)
-        self.assertEqual(eggs.true_flag, True)
\ No newline at end of file
+        self.assertEqual(eggs.true_flag, True)
+
+    async def test_subscribe_and_unsubscribe(self):
+        spam = FoodAsync()
+        eggs = FoodSync()
+        event_service.subscribers.pop(Event.type, None)
+        event_service.subscribe(Event.type, spam.set_true_flag)
+        event_service.subscribe(Event.type, eggs.set_true_flag)
+        event_service.subscribe(Event.type, spam.set_true_flag)
+        handlers = event_service.subscribers[Event.type]
+        self.assertEqual(len(handlers), 2)
+        self.assertEqual([handler.fcn for handler in handlers.sync], [eggs.set_true_flag])
+        self.assertEqual([handler.fcn for handler in handlers.coroutines], [spam.set_true_flag])
+
+        event_service.unsubscribe(Event.type, spam.set_true_flag)
+        await event_service.post_event(Event(True))
+        self.assertEqual(spam.true_flag, False)
+        self.assertEqual(eggs.true_flag, True)
+
+        event_service.unsubscribe(Event.type, eggs.set_true_flag)
+        self.assertNotIn(Event.type, event_service.subscribers)
+        # Unsubscribing twice does nothing
+        event_service.unsubscribe(Event.type, eggs.set_true_flag)
+
+
+class SlowEvent:
+    type = "slow_event"
+    def __init__(self, value) -> None:
+        self.value = value
+
+
+class KeyedEvent:
+    type = "keyed_event"
+    partition_key = "account_id"
+    def __init__(self, account_id, value) -> None:
+        self.account_id = account_id
+        self.value = value
+
+
+class EventBusTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.handled = []
+        self.release = asyncio.Event()
+        self.release.set()
+        event_service.subscribers.pop(SlowEvent.type, None)
+        event_service.subscribe(SlowEvent.type, self.handle)
+
+    async def asyncTearDown(self) -> None:
+        event_service.subscribers.pop(SlowEvent.type, None)
+
+    async def handle(self, event: SlowEvent):
+        await self.release.wait()
+        if event.value == "fail":
+            raise ValueError("handler failed")
+        self.handled.append((event.value, current_priority.get()))
+
+    async def test_workers_and_context(self):
+        bus = event_service.EventBus(workers=2, max_queue_size=10)
+        await bus.start()
+        with request_priority(Priority.INTERACTIVE):
+            await bus.publish(SlowEvent(1))
+        await bus.publish(SlowEvent("fail"))
+        await bus.publish(SlowEvent(2))
+        await bus.drain()
+        # The failure is logged and counted, the other events still run
+        self.assertEqual(sorted(self.handled), [(1, Priority.INTERACTIVE), (2, Priority.NORMAL)])
+        self.assertEqual(bus.failed, 1)
+        self.assertFalse(bus.running)
+
+    async def test_backpressure(self):
+        bus = event_service.EventBus(workers=1, max_queue_size=2)
+        await bus.start()
+        self.release.clear()
+        for i in range(3):
+            await bus.publish(SlowEvent(i))
+        await asyncio.sleep(0)
+        # One event is being handled and two are queued
+        with self.assertRaises(event_service.QueueFullException):
+            await bus.publish(SlowEvent(3), wait=False)
+        with self.assertRaises(event_service.QueueFullException):
+            await bus.publish(SlowEvent(3), timeout=0.01)
+        waiting = asyncio.create_task(bus.publish(SlowEvent(3)))
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiting.done())
+        self.release.set()
+        await waiting
+        await bus.drain()
+        self.assertEqual([value for value, _ in self.handled], [0, 1, 2, 3])
+        self.assertEqual(bus.rejected, 2)
+
+    async def test_drain(self):
+        bus = event_service.EventBus(workers=1, max_queue_size=10)
+        await bus.start()
+        self.release.clear()
+        await bus.publish(SlowEvent(1))
+        drain = asyncio.create_task(bus.drain(timeout=1))
+        await asyncio.sleep(0)
+        with self.assertRaises(event_service.EventBusClosedException):
+            await bus.publish(SlowEvent(2))
+        self.release.set()
+        await drain
+        self.assertEqual([value for value, _ in self.handled], [1])
+
+        # Queued events that don't finish in time are dropped
+        bus = event_service.EventBus(workers=1, max_queue_size=10)
+        await bus.start()
+        self.release.clear()
+        await bus.publish(SlowEvent(3))
+        await bus.drain(timeout=0.01)
+        self.assertFalse(bus.running)
+
+    async def test_unkeyed_events_go_to_idle_workers(self):
+        bus = event_service.EventBus(workers=4, max_queue_size=100)
+        await bus.start()
+        self.release.clear()
+        await bus.publish(SlowEvent("slow"))
+        await asyncio.sleep(0)
+        # The slow event's lane is empty again while it is handled, the next event still goes to another lane
+        fast = asyncio.Event()
+        event_service.subscribe(SlowEvent.type, lambda event: event.value == "fast" and fast.set())
+        await bus.publish(SlowEvent("fast"))
+        await asyncio.wait_for(fast.wait(), 1)
+        self.release.set()
+        await bus.drain()
+        self.assertEqual(sorted(value for value, _ in self.handled), ["fast", "slow"])
+
+    async def test_publish_without_bus(self):
+        await event_service.publish(SlowEvent(1))
+        self.assertEqual(self.handled, [(1, Priority.NORMAL)])
+
+
+class PartitionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.log = []
+        self.running = {}
+        self.overlapped = False
+        event_service.subscribers.pop(KeyedEvent.type, None)
+        event_service.subscribe(KeyedEvent.type, self.handle)
+
+    async def asyncTearDown(self) -> None:
+        event_service.subscribers.pop(KeyedEvent.type, None)
+
+    async def handle(self, event: KeyedEvent):
+        self.running[event.account_id] = self.running.get(event.account_id, 0) + 1
+        self.overlapped |= self.running[event.account_id] > 1
+        self.log.append(("start", event.account_id, event.value))
+        # Later events finish sooner, so anything running in parallel would finish out of order
+        await asyncio.sleep(0.001 * (10 - event.value))
+        self.log.append(("end", event.account_id, event.value))
+        self.running[event.account_id] -= 1
+
+    def finished(self, account_id):
+        return [value for step, key, value in self.log if step == "end" and key == account_id]
+
+    async def test_partition(self):
+        self.assertEqual(event_service.partition(KeyedEvent("a", 1)), "a")
+        self.assertIsNone(event_service.partition(SlowEvent(1)))
+        webhook = event_service.ReceiveHabiticaWebhookEvent({"user": {"_id": "user-1"}, "webhookType": "taskActivity"})
+        self.assertEqual(event_service.partition(webhook), "user-1")
+        self.assertIsNone(event_service.partition(event_service.ReceiveHabiticaWebhookEvent({})))
+
+    async def test_same_key_in_order(self):
+        bus = event_service.EventBus(workers=4, max_queue_size=100)
+        await bus.start()
+        for value in range(10):
+            for account_id in ("a", "b", "c"):
+                await bus.publish(KeyedEvent(account_id, value))
+        await bus.drain()
+        self.assertFalse(self.overlapped)
+        for account_id in ("a", "b", "c"):
+            self.assertEqual(self.finished(account_id), list(range(10)))
+
+    async def test_keys_run_in_parallel(self):
+        bus = event_service.EventBus(workers=8, max_queue_size=100)
+        await bus.start()
+        # Two keys that land on different lanes
+        first = KeyedEvent("a", 0)
+        second = next(KeyedEvent(f"key-{i}", 0) for i in range(100) if bus.lane(KeyedEvent(f"key-{i}", 0)) is not bus.lane(first))
+        await bus.publish(first)
+        await bus.publish(second)
+        await asyncio.sleep(0.002)
+        starts = [key for step, key, _ in self.log if step == "start"]
+        self.assertEqual(sorted(starts), sorted(["a", second.account_id]))
+        await bus.drain()
+
+
+class InstrumentedEvent:
+    type = "instrumented_event"
+
+
+class HandlerInstrumentationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.handled = []
+        event_service.subscribers.pop(InstrumentedEvent.type, None)
+        for fcn in (self.ok, self.fails, self.hangs, self.sync_fails):
+            event_service.subscribe(InstrumentedEvent.type, fcn)
+
+    async def asyncTearDown(self) -> None:
+        event_service.subscribers.pop(InstrumentedEvent.type, None)
+
+    async def ok(self, event):
+        await asyncio.sleep(0)
+        self.handled.append("ok")
+
+    async def fails(self, event):
+        raise ValueError("handler failed")
+
+    async def hangs(self, event):
+        await asyncio.sleep(10)
+
+    def sync_fails(self, event):
+        raise KeyError("sync handler failed")
+
+    def outcomes(self, handler):
+        name = f"HandlerInstrumentationTest.{handler}"
+        return {outcome: event_service.handler_calls.get(event_type=InstrumentedEvent.type, handler=name, outcome=outcome)
+                for outcome in ("success", "failure", "timeout")}
+
+    async def test_failures_dont_stop_other_handlers(self):
+        before = {handler: self.outcomes(handler) for handler in ("ok", "fails", "hangs", "sync_fails")}
+        dead = await event_service.post_event(InstrumentedEvent(), timeout=0.01)
+        # Every handler ran, the failures came back as dead letters instead of being raised
+        self.assertEqual(self.handled, ["ok"])
+        self.assertEqual(sorted((letter.handler, letter.outcome) for letter in dead), [
+            ("HandlerInstrumentationTest.fails", "failure"),
+            ("HandlerInstrumentationTest.hangs", "timeout"),
+            ("HandlerInstrumentationTest.sync_fails", "failure"),
+        ])
+        self.assertTrue(all(letter in event_service.dead_letters for letter in dead))
+        self.assertIsInstance(next(letter for letter in dead if letter.outcome == "timeout").exception, asyncio.TimeoutError)
+
+        expected = {"ok": "success", "fails": "failure", "hangs": "timeout", "sync_fails": "failure"}
+        for handler, outcome in expected.items():
+            after = self.outcomes(handler)
+            self.assertEqual(after[outcome], before[handler][outcome] + 1, handler)
+
+        stats = {row.handler: row for row in event_service.handler_stats() if row.event_type == InstrumentedEvent.type}
+        self.assertGreaterEqual(stats["HandlerInstrumentationTest.hangs"].mean_seconds, 0.01)
+        self.assertIsNotNone(stats["HandlerInstrumentationTest.ok"].p95_seconds)
+        self.assertIn('event_handler_calls_total{event_type="instrumented_event",handler="HandlerInstrumentationTest.ok",outcome="success"}',
+                      event_service.registry.render())
+
+    async def test_bus_counts_events_with_dead_letters(self):
+        bus = event_service.EventBus(workers=1, max_queue_size=10)
+        await bus.start()
+        event_service.unsubscribe(InstrumentedEvent.type, self.hangs)
+        await bus.publish(InstrumentedEvent())
+        await bus.drain()
+        self.assertEqual(self.handled, ["ok"])
+        self.assertEqual(bus.failed, 1)
@@ -0,0 +1,211 @@
+import unittest
+import asyncio
+import random
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from habitica.habitica_service import HabiticaService, InsufficientGoldException, GoldTransactionException
+from habitica.habitica_api import HabiticaClient
+from habitica.keyed_lock import KeyedLock
+from habitica.rate_limiter import RateLimiter
+from app.transaction_service import ledger
+from app.metrics_service import MetricsRegistry
+from test.habitica_stub_server import HabiticaStubServer
+
+class GoldApi:
+    "Habitica gold per user, counting calls."
+    def __init__(self, gp: float) -> None:
+        self.gold = {}
+        self.starting_gp = gp
+        self.gets = 0
+        self.puts = []
+        self.ignore_puts = False
+
+    async def read_user_summary(self, api_user, api_token):
+        self.gets += 1
+        await asyncio.sleep(0)
+        return self.user(api_user)
+
+    def user(self, api_user) -> dict:
+        return {"data": {"_id": api_user, "profile": {"name": api_user}, "party": {"_id": "party"}, "webhooks": [],
+                         "stats": {"hp": 50, "mp": 10, "exp": 1, "gp": self.gold.get(api_user, self.starting_gp), "lvl": 3, "class": "rogue"}}}
+
+    async def update_user(self, api_user, api_token, payload):
+        self.puts.append(payload)
+        await asyncio.sleep(0)
+        if not self.ignore_puts:
+            self.gold[api_user] = payload["stats.gp"]
+        # Habitica answers with the updated user
+        return self.user(api_user)
+
+class GoldWriterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.api = GoldApi(100)
+        self.service = HabiticaService(self.api)
+        self.service.gold_writer.flush_window_seconds = 0.01
+        ledger.operations.clear()
+
+    async def test_concurrent_deltas_share_one_write(self):
+        amounts = [10, -5, 20, -30, 5]
+        await asyncio.gather(*[self.service.add_user_gold("user1", "token", amount) for amount in amounts])
+        self.assertEqual(self.api.gold["user1"], 100)
+        self.assertEqual(self.api.gets, 1)
+        self.assertEqual(self.api.puts, [{"stats.gp": 100}])
+
+        # Every caller has its own ledger operation, chained in arrival order
+        changes = [(operation.old_value, operation.new_value) for operation in ledger.operations]
+        self.assertEqual(changes, [(100, 110), (110, 105), (105, 125), (125, 95), (95, 100)])
+        self.assertTrue(all(operation.success for operation in ledger.operations))
+
+    async def test_verify_with_get(self):
+        self.service.gold_writer.verify_with_get = True
+        await self.service.add_user_gold("user1", "token", 10)
+        self.assertEqual(self.api.gets, 2)
+
+        # Updates that don't answer with the user are always checked with a GET
+        self.service.gold_writer.verify_with_get = False
+        self.api.update_user = lambda api_user, api_token, payload: asyncio.sleep(0)
+        with self.assertRaises(GoldTransactionException):
+            await self.service.add_user_gold("user1", "token", 10)
+        self.assertEqual(self.api.gets, 4)
+
+    async def test_each_caller_gets_its_own_outcome(self):
+        results = await asyncio.gather(
+            self.service.gold_writer.add("user1", "token", 5),
+            self.service.gold_writer.add("user1", "token", -200),
+            self.service.gold_writer.add("user1", "token", -100),
+            return_exceptions=True,
+        )
+        self.assertEqual(results[0], 105)
+        self.assertIsInstance(results[1], InsufficientGoldException)
+        self.assertEqual(results[2], 5)
+        self.assertEqual(self.api.gold["user1"], 5)
+        self.assertEqual(len(ledger.operations), 2)
+
+    async def test_users_are_flushed_separately(self):
+        await asyncio.gather(
+            self.service.add_user_gold("user1", "token", 1),
+            self.service.add_user_gold("user2", "token", 2),
+        )
+        self.assertEqual(self.api.gold, {"user1": 101, "user2": 102})
+        self.assertEqual(self.service.gold_writer.queues, {})
+
+    async def test_deltas_during_a_flush_go_in_the_next(self):
+        first = asyncio.create_task(self.service.add_user_gold("user1", "token", 1))
+        await asyncio.sleep(0.015)
+        second = asyncio.create_task(self.service.add_user_gold("user1", "token", 2))
+        await asyncio.gather(first, second)
+        self.assertEqual(self.api.puts, [{"stats.gp": 101}, {"stats.gp": 103}])
+        self.assertEqual(self.service.gold_writer.flushes, 2)
+
+    async def test_failed_verification(self):
+        self.api.ignore_puts = True
+        results = await asyncio.gather(
+            self.service.add_user_gold("user1", "token", 1),
+            self.service.add_user_gold("user1", "token", 2),
+            return_exceptions=True,
+        )
+        self.assertTrue(all(isinstance(result, GoldTransactionException) for result in results))
+        self.assertEqual(len(ledger.operations), 2)
+        self.assertFalse(any(operation.success for operation in ledger.operations))
+
+    async def test_cancelled_flusher_fails_its_writes(self):
+        # Cancelled during the PUT
+        puts = asyncio.Event()
+        async def hanging_update(api_user, api_token, payload):
+            puts.set()
+            await asyncio.Event().wait()
+        self.api.update_user = hanging_update
+        write = asyncio.create_task(self.service.gold_writer.add("user1", "token", 5))
+        await puts.wait()
+        self.service.gold_writer.queues["user1"].flusher.cancel()
+        with self.assertRaises(GoldTransactionException):
+            await write
+
+        # Cancelled before the flush window is over
+        write = asyncio.create_task(self.service.gold_writer.add("user1", "token", 5))
+        await asyncio.sleep(0)
+        self.service.gold_writer.queues["user1"].flusher.cancel()
+        with self.assertRaises(GoldTransactionException):
+            await write
+        self.assertEqual(self.service.gold_writer.queues, {})
+        self.assertEqual(self.service.gold_writer.depth("user1"), 0)
+
+class GoldWriterStressTest(unittest.IsolatedAsyncioTestCase):
+    "Many concurrent gold changes through two services sharing the real client, against the local stub server."
+    async def asyncSetUp(self) -> None:
+        self.server = HabiticaStubServer(latency_seconds=0.002, jitter_seconds=0.005, rate_limit=100000, seed=1)
+        base_url = await self.server.start()
+        self.client = HabiticaClient(base_url=base_url, rate_limiter=RateLimiter(user_limit=100000, global_limit=100000))
+        self.locks = KeyedLock("stress", MetricsRegistry())
+        # Separate writers, like two handlers each with their own HabiticaService
+        self.services = [HabiticaService(self.client) for _ in range(2)]
+        for service in self.services:
+            service.gold_writer.locks = self.locks
+            service.gold_writer.flush_window_seconds = 0.001
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_no_lost_updates(self):
+        users = [f"user{i}" for i in range(5)]
+        starting_gold = {user: (await self.services[0].get_user_summary(user, "token")).stats.gp for user in users}
+        rng = random.Random(1)
+        changes = [(rng.choice(users), rng.choice([5, 10, 25, -10, -40, -500])) for _ in range(300)]
+
+        async def change(i, api_user, amount):
+            await asyncio.sleep(rng.random() * 0.05)
+            return await self.services[i % 2].gold_writer.add(api_user, "token", amount)
+        results = await asyncio.gather(*[change(i, *args) for i, args in enumerate(changes)], return_exceptions=True)
+
+        errors = [result for result in results if isinstance(result, Exception) and not isinstance(result, InsufficientGoldException)]
+        self.assertEqual(errors, [])
+        for user in users:
+            applied = sum(amount for (api_user, amount), result in zip(changes, results)
+                          if api_user == user and not isinstance(result, Exception))
+            self.assertAlmostEqual(self.server.users[user].data["stats"]["gp"], starting_gold[user] + applied)
+        # Users were written in parallel, and each user's changes were batched
+        self.assertGreater(self.locks.max_held, 1)
+        flushes = sum(service.gold_writer.flushes for service in self.services)
+        self.assertLess(flushes, len(changes))
+
+
+class StaleReadTest(unittest.IsolatedAsyncioTestCase):
+    "A GET for the user that was sent before the gold changed is still in flight when a flush reads the gold."
+    async def asyncSetUp(self) -> None:
+        self.api = GoldApi(100)
+        self.release = asyncio.Event()
+        self.slow_gets = 1
+        async def handle_get(request: web.Request):
+            api_user = request.headers["x-api-user"]
+            user = self.api.user(api_user)
+            if self.slow_gets:
+                self.slow_gets -= 1
+                await self.release.wait()
+            return web.json_response(user)
+        async def handle_put(request: web.Request):
+            return web.json_response(await self.api.update_user(request.headers["x-api-user"], None, await request.json()))
+        stub = web.Application()
+        stub.router.add_get("/user", handle_get)
+        stub.router.add_put("/user", handle_put)
+        self.server = TestServer(stub)
+        await self.server.start_server()
+        self.client = HabiticaClient(base_url=str(self.server.make_url("")).rstrip("/"))
+        self.service = HabiticaService(self.client)
+        self.service.gold_writer.flush_window_seconds = 0.001
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_flush_does_not_join_a_stale_get(self):
+        status = asyncio.create_task(self.service.get_user_summary("user1", "token"))
+        while self.slow_gets:
+            await asyncio.sleep(0.001)
+        # Another flush changed the gold after the status GET read it
+        self.api.gold["user1"] = 110
+        # Joining the status GET would wait for it, and then write 105
+        await asyncio.wait_for(self.service.add_user_gold("user1", "token", 5), 5)
+        self.assertEqual(self.api.gold["user1"], 115)
+        self.release.set()
+        self.assertEqual((await status).stats.gp, 100)
@@ -20,6 +20,21 @@ async def get_user(api_user, api_token):
         del obj_json['data']['stats']['class']
     return obj_json
 
+async def get_user_summary(api_user, api_token, user_fields = "profile.name,stats,party._id,webhooks"):
+    obj_json = await get_user(api_user, api_token)
+    data = obj_json['data']
+    return {"success": True, "data": {
+        "_id": data['_id'],
+        "id": data['id'],
+        "profile": {"name": data['profile']['name']},
+        "stats": data['stats'],
+        "party": {"_id": data['party'].get('_id')},
+        "webhooks": data['webhooks'],
+    }}
+
+async def read_user_summary(api_user, api_token, user_fields = "profile.name,stats,party._id,webhooks"):
+    return await get_user_summary(api_user, api_token, user_fields)
+
 async def get_tasks(api_user, api_token):
     with open("test\\sample_data\\tasks_model.json") as fh:
         obj_json = json.load(fh)
@@ -1,5 +1,8 @@
 import unittest
 import habitica.habitica_api as api
+from habitica.habitica_api import HabiticaClient
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 import dotenv, os
 from config import TEST_HABITICA_API_TOKEN, TEST_HABITICA_API_USER
 
@@ -21,3 +24,38 @@ class HabiticaAPITest(unittest.IsolatedAsyncioTestCase):
     async def test_get_webhooks(self):
         webhooks = await api.get_webhooks(TEST_HABITICA_API_USER, TEST_HABITICA_API_TOKEN)
         self.assertIn('data',webhooks)
+
+class HabiticaClientTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        # Local stub that records the client socket of each call
+        self.peers = []
+        async def handle_user(request: web.Request):
+            self.peers.append(request.transport.get_extra_info('peername'))
+            return web.json_response({"success": True, "data": {"stats": {"class": "warrior", "gp": 10}}})
+        stub = web.Application()
+        stub.router.add_get("/user", handle_user)
+        self.server = TestServer(stub)
+        await self.server.start_server()
+        self.client = HabiticaClient(base_url=str(self.server.make_url("")).rstrip("/"))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_session_is_reused(self):
+        await self.client.start()
+        session = self.client.session
+        for _ in range(3):
+            user = await self.client.get("api_user", "api_token", "/user")
+            self.assertEqual(user['data']['stats']['class'], "warrior")
+        self.assertIs(self.client.session, session)
+        # Keep-alive means all calls share one connection
+        self.assertEqual(len(set(self.peers)), 1)
+
+    async def test_close(self):
+        await self.client.get("api_user", "api_token", "/user")
+        await self.client.close()
+        self.assertIsNone(self.client.session)
+        # Session is recreated on next use
+        await self.client.get("api_user", "api_token", "/user")
+        self.assertFalse(self.client.session.closed)
@@ -1,9 +1,11 @@
 import unittest
 import habitica.habitica_api as api
 import json
+import dacite
+from dataclasses import fields
 import habitica.model.user as User
 import habitica.model.task as Task
-from habitica.model import HabiticaParty, HabiticaTasks, HabiticaUser
+from habitica.model import HabiticaParty, HabiticaTasks, HabiticaUser, LazyHabiticaUser
 from habitica.model import Webhook
 import dotenv, os
 
@@ -59,4 +61,60 @@ class HabiticaUserModelTest(unittest.IsolatedAsyncioTestCase):
                 webhook_json = json.load(fh)
                 webhook = Webhook.load(webhook_json)
             self.assertTrue(type(webhook.task), expected_class)
-        
\ No newline at end of file
+        
+class LazyHabiticaUserTest(unittest.TestCase):
+    def load_response(self, path):
+        with open(path) as fh:
+            response = json.load(fh)
+        response['data']['stats']['character_class'] = response['data']['stats'].pop('class')
+        return response
+
+    def test_matches_eager_user(self):
+        for path in ['test/sample_data/user_model.json', 'test/sample_data/user_model_new_user.json']:
+            response = self.load_response(path)
+            eager = HabiticaUser.load(response)
+            lazy = LazyHabiticaUser.load(response)
+            self.assertIsInstance(lazy, HabiticaUser)
+            for field in fields(HabiticaUser):
+                self.assertEqual(getattr(lazy, field.name), getattr(eager, field.name), field.name)
+
+    def test_sections_load_on_first_access(self):
+        lazy = LazyHabiticaUser.load(self.load_response('test/sample_data/user_model.json'))
+        self.assertNotIn('items', lazy.__dict__)
+        self.assertEqual(type(lazy.stats), User.Stats)
+        self.assertIs(lazy.stats, lazy.stats)
+        self.assertNotIn('items', lazy.__dict__)
+        self.assertEqual(type(lazy.items.gear), User.Gear)
+        with self.assertRaises(AttributeError):
+            lazy.not_a_field
+
+class TaskHistoryTest(unittest.TestCase):
+    def test_columns(self):
+        raw = [{'date': 1668271096451, 'value': 1, 'scoredUp': 1, 'scoredDown': 0}, {'date': 1672500618743, 'value': 1.9747}]
+        history = Task.TaskHistory.load(raw)
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[0], Task.HistoryEntry(1668271096451, 1.0, 1, 0))
+        self.assertEqual(history[-1], Task.HistoryEntry(1672500618743, 1.9747, None, None))
+        self.assertEqual(history[1:], [Task.HistoryEntry(1672500618743, 1.9747, None, None)])
+        self.assertIsInstance(history[1:], Task.TaskHistory)
+        self.assertEqual(list(history), [history[0], history[1]])
+        self.assertEqual(Task.TaskHistory(history), history)
+        self.assertEqual(history.nbytes, 2 * (4 * 8 + 2))
+        self.assertEqual(Task.TaskHistory.load(history.dump()), history)
+
+        daily = Task.TaskHistory.load([{'date': 1697922779862, 'value': 1, 'isDue': True, 'completed': False}])
+        self.assertEqual(daily[0], Task.HistoryEntry(1697922779862, 1.0, None, None, True, False))
+        self.assertEqual(Task.TaskHistory.load(daily.dump()), daily)
+
+    def test_loaded_tasks(self):
+        with open('test/sample_data/tasks_model.json') as fh:
+            tasks = HabiticaTasks.load(json.load(fh))
+        habit = tasks.habit[0]
+        self.assertIsInstance(habit.history, Task.TaskHistory)
+        self.assertEqual(habit.history[0].scoreUp, 1)
+        self.assertFalse(hasattr(habit, '__dict__'))
+        self.assertFalse(hasattr(habit.history, '__dict__'))
+
+    def test_bad_history(self):
+        with self.assertRaises(dacite.WrongTypeError):
+            Task.TaskHistory.load([{'date': "yesterday", 'value': 1}])
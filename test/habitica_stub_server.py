@@ -0,0 +1,274 @@
+"""
+Local stand-in for the Habitica v3 API, for load and latency tests of the real client stack.
+
+Serves stateful fake users seeded from test/sample_data. Each `x-api-user` gets its own copy of the sample user
+on first use, so gold updates and webhooks persist per user for the life of the server.
+Latency, error rate and the per-user rate limit are configurable, and responses carry the same
+X-RateLimit-* and ETag headers Habitica sends.
+
+Run from the repo root: python -m test.habitica_stub_server --port 3000 --latency 0.05
+then start the bot with HABITICA_BASE_URL=http://localhost:3000/api/v3
+"""
+import argparse
+import asyncio
+import copy
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from aiohttp import web
+
+SAMPLE_DATA = "test/sample_data"
+API_PREFIX = "/api/v3"
+
+def load_sample(name: str) -> dict:
+    with open(f"{SAMPLE_DATA}/{name}") as fh:
+        return json.load(fh)
+
+def reset_header(reset_at: float) -> str:
+    "Format a reset time the way Habitica does, as a JavaScript date string. Rounds up, since it has no fractions."
+    reset = datetime.fromtimestamp(math.ceil(reset_at), timezone.utc)
+    return reset.strftime("%a %b %d %Y %H:%M:%S GMT+0000 (Coordinated Universal Time)")
+
+def project(data: dict, user_fields: str) -> dict:
+    "Apply a `userFields` projection like `profile.name,stats`. The ids are always returned."
+    projected = {"_id": data.get("_id"), "id": data.get("id")}
+    for field in user_fields.split(","):
+        source, target = data, projected
+        keys = field.strip().split(".")
+        for key in keys[:-1]:
+            if key not in source:
+                break
+            source = source[key]
+            target = target.setdefault(key, {})
+        else:
+            if keys[-1] in source:
+                target[keys[-1]] = copy.deepcopy(source[keys[-1]])
+    return projected
+
+class StubUser:
+    def __init__(self, api_user: str, seed: dict) -> None:
+        self.data = copy.deepcopy(seed)
+        self.data["_id"] = self.data["id"] = api_user
+        self.version = 0
+        self.window_start = 0.0
+        self.window_calls = 0
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{self.data["id"]}-{self.version}"'
+
+    def touch(self):
+        self.version += 1
+
+class HabiticaStubServer:
+    """
+    aiohttp app implementing the Habitica endpoints the bot uses: `/user` GET and PUT, `/groups`, `/tasks/user`,
+    `/user/webhook` GET, POST, PUT and DELETE, and group chat.
+
+    `latency_seconds` (plus up to `jitter_seconds`) is added to every response. `error_rate` is the fraction of
+    calls answered with 503. Each api_user may make `rate_limit` calls per `window_seconds` before getting 429.
+    """
+    def __init__(self,
+                latency_seconds: float = 0,
+                jitter_seconds: float = 0,
+                error_rate: float = 0,
+                rate_limit: int = 30,
+                window_seconds: float = 60,
+                seed: int = None,
+            ) -> None:
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.window_seconds = window_seconds
+        self.random = random.Random(seed)
+        self.user_seed = load_sample("user_model.json")["data"]
+        self.party = load_sample("party_model.json")
+        self.tasks = load_sample("tasks_model.json")
+        self.users: dict[str, StubUser] = {}
+        self.chat: list[dict] = []
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.runner: web.AppRunner = None
+        self.app = self.make_app()
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get(f"{API_PREFIX}/user", self.get_user)
+        app.router.add_put(f"{API_PREFIX}/user", self.put_user)
+        app.router.add_get(f"{API_PREFIX}/groups", self.get_groups)
+        app.router.add_get(f"{API_PREFIX}/tasks/user", self.get_tasks)
+        app.router.add_get(f"{API_PREFIX}/user/webhook", self.get_webhooks)
+        app.router.add_post(f"{API_PREFIX}/user/webhook", self.post_webhook)
+        app.router.add_put(f"{API_PREFIX}/user/webhook/{{id}}", self.put_webhook)
+        app.router.add_delete(f"{API_PREFIX}/user/webhook/{{id}}", self.delete_webhook)
+        app.router.add_post(f"{API_PREFIX}/groups/{{group_id}}/chat", self.post_chat)
+        return app
+
+    async def start(self, host: str = "localhost", port: int = 0) -> str:
+        "Start serving and return the base URL to give HabiticaClient."
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    async def close(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def user(self, request: web.Request) -> StubUser:
+        api_user = request.headers["x-api-user"]
+        if api_user not in self.users:
+            self.users[api_user] = StubUser(api_user, self.user_seed)
+        return self.users[api_user]
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        self.calls += 1
+        if not request.headers.get("x-api-user") or not request.headers.get("x-api-key"):
+            return error_response(401, "NotAuthorized", "Missing authentication headers.")
+        user = self.user(request)
+
+        # Fixed window per user, like Habitica
+        now = time.time()
+        if now - user.window_start >= self.window_seconds:
+            user.window_start = now
+            user.window_calls = 0
+        user.window_calls += 1
+        rate_headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(max(self.rate_limit - user.window_calls, 0)),
+            "X-RateLimit-Reset": reset_header(user.window_start + self.window_seconds),
+        }
+
+        delay = self.latency_seconds + self.random.uniform(0, self.jitter_seconds)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if user.window_calls > self.rate_limit:
+            self.rate_limited += 1
+            retry_after = max(int(user.window_start + self.window_seconds - now) + 1, 1)
+            response = error_response(429, "TooManyRequests", "Too many requests.")
+            response.headers["Retry-After"] = str(retry_after)
+        elif self.random.random() < self.error_rate:
+            self.errors += 1
+            response = error_response(503, "ServiceUnavailable", "Stub server error.")
+        else:
+            response = await handler(request)
+        response.headers.update(rate_headers)
+        return response
+
+    async def get_user(self, request: web.Request):
+        user = self.user(request)
+        if request.headers.get("If-None-Match") == user.etag:
+            return web.Response(status=304, headers={"ETag": user.etag})
+        user_fields = request.query.get("userFields")
+        data = project(user.data, user_fields) if user_fields else user.data
+        return success_response(data, headers={"ETag": user.etag})
+
+    async def put_user(self, request: web.Request):
+        user = self.user(request)
+        payload = await request.json()
+        for path, value in payload.items():
+            target = user.data
+            keys = path.split(".")
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+        user.touch()
+        return success_response(user.data, headers={"ETag": user.etag})
+
+    async def get_groups(self, request: web.Request):
+        return web.json_response(self.party)
+
+    async def get_tasks(self, request: web.Request):
+        return web.json_response(self.tasks)
+
+    async def get_webhooks(self, request: web.Request):
+        return success_response(self.user(request).data["webhooks"])
+
+    async def post_webhook(self, request: web.Request):
+        user = self.user(request)
+        payload = await request.json()
+        now = datetime.now(timezone.utc).isoformat()
+        webhook = {"enabled": True, "failures": 0, "options": {}, **payload, "createdAt": now, "updatedAt": now}
+        webhook.setdefault("id", str(uuid.uuid4()))
+        if any(existing["id"] == webhook["id"] for existing in user.data["webhooks"]):
+            return error_response(400, "BadRequest", f"A webhook with the id {webhook['id']} already exists.")
+        user.data["webhooks"].append(webhook)
+        user.touch()
+        return success_response(webhook, status=201)
+
+    async def put_webhook(self, request: web.Request):
+        user = self.user(request)
+        webhook = next((webhook for webhook in user.data["webhooks"] if webhook["id"] == request.match_info["id"]), None)
+        if webhook is None:
+            return error_response(404, "NotFound", "Webhook not found.")
+        payload = await request.json()
+        webhook.update({key: value for key, value in payload.items() if key not in ("id", "type")})
+        webhook["updatedAt"] = datetime.now(timezone.utc).isoformat()
+        user.touch()
+        return success_response(webhook)
+
+    async def delete_webhook(self, request: web.Request):
+        user = self.user(request)
+        webhooks = [webhook for webhook in user.data["webhooks"] if webhook["id"] != request.match_info["id"]]
+        if len(webhooks) == len(user.data["webhooks"]):
+            return error_response(404, "NotFound", "Webhook not found.")
+        user.data["webhooks"] = webhooks
+        user.touch()
+        return success_response(webhooks)
+
+    async def post_chat(self, request: web.Request):
+        payload = await request.json()
+        message = {
+            "id": str(uuid.uuid4()),
+            "groupId": request.match_info["group_id"],
+            "uuid": request.headers["x-api-user"],
+            "text": payload["message"],
+            "timestamp": int(time.time() * 1000),
+        }
+        self.chat.append(message)
+        return success_response({"message": message})
+
+def success_response(data, status: int = 200, headers: dict = None) -> web.Response:
+    return web.json_response({"success": True, "data": data}, status=status, headers=headers)
+
+def error_response(status: int, error: str, message: str) -> web.Response:
+    return web.json_response({"success": False, "error": error, "message": message}, status=status)
+
+async def serve(args):
+    server = HabiticaStubServer(
+        latency_seconds=args.latency,
+        jitter_seconds=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        window_seconds=args.window,
+    )
+    base_url = await server.start(args.host, args.port)
+    print(f"Habitica stub serving at {base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Habitica API")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="Up to this many extra seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of calls answered with 503")
+    parser.add_argument("--rate-limit", type=int, default=30, help="Calls per user per window")
+    parser.add_argument("--window", type=float, default=60, help="Rate limit window in seconds")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,94 @@
+import unittest
+import asyncio
+import time
+from habitica.habitica_api import HabiticaClient, HabiticaAPIException
+from habitica.rate_limiter import RateLimiter, RateLimitPacer
+from habitica.retry_policy import RetryPolicy
+from habitica.user_cache import UserCache
+from habitica.model.user import HabiticaUserSummary
+from test.habitica_stub_server import HabiticaStubServer
+
+class HabiticaStubServerTest(unittest.IsolatedAsyncioTestCase):
+    "Runs the real HabiticaClient against the local stub server."
+    async def start(self, server: HabiticaStubServer, **client_args):
+        self.server = server
+        base_url = await server.start()
+        self.client = HabiticaClient(base_url=base_url, **client_args)
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_user_state(self):
+        await self.start(HabiticaStubServer(), user_cache=UserCache(ttl_seconds=0))
+        user = await self.client.get_user("user1", "token")
+        self.assertEqual(user['data']['id'], "user1")
+        self.assertIn('character_class', user['data']['stats'])
+
+        await self.client.update_user("user1", "token", {"stats.gp": 12.5})
+        summary = HabiticaUserSummary.load(await self.client.get_user_summary("user1", "token"))
+        self.assertEqual(summary.stats.gp, 12.5)
+        self.assertNotIn('items', (await self.client.get_user_summary("user1", "token"))['data'])
+
+        # Other users keep their own copy
+        other = await self.client.get_user_summary("user2", "token")
+        self.assertNotEqual(other['data']['stats']['gp'], 12.5)
+
+    async def test_etag_revalidation(self):
+        cache = UserCache(ttl_seconds=0)
+        await self.start(HabiticaStubServer(), user_cache=cache)
+        await self.client.get_user("user1", "token")
+        await self.client.get_user("user1", "token")
+        self.assertEqual(cache.revalidations, 1)
+
+    async def test_webhooks_and_chat(self):
+        await self.start(HabiticaStubServer())
+        webhook = await self.client.create_webhook("user1", "token", {"url": "http://localhost/habitica", "label": "test"})
+        webhooks = await self.client.get_webhooks("user1", "token")
+        self.assertIn(webhook['data']['id'], [hook['id'] for hook in webhooks['data']])
+
+        await self.client.delete_webhook("user1", "token", webhook['data']['id'])
+        webhooks = await self.client.get_webhooks("user1", "token")
+        self.assertNotIn(webhook['data']['id'], [hook['id'] for hook in webhooks['data']])
+
+        party = await self.client.get_party("user1", "token")
+        await self.client.post_chat("user1", "token", party['data'][0]['_id'], "hello")
+        self.assertEqual(self.server.chat[0]['text'], "hello")
+        self.assertEqual(len((await self.client.get_tasks("user1", "token"))['data']), len(self.server.tasks['data']))
+
+    async def test_errors_are_retried(self):
+        policy = RetryPolicy(max_attempts=10, base_delay_seconds=0.001, max_delay_seconds=0.001)
+        await self.start(HabiticaStubServer(error_rate=0.5, seed=1), retry_policy=policy)
+        results = await asyncio.gather(*[self.client.get_party(f"user{i}", "token") for i in range(10)])
+        self.assertEqual(len(results), 10)
+        self.assertGreater(self.server.errors, 0)
+
+    async def test_rate_limit_headers(self):
+        server = HabiticaStubServer(rate_limit=3, window_seconds=1)
+        await self.start(
+            server,
+            rate_limiter=RateLimiter(user_limit=100),
+            pacer=RateLimitPacer(reserve=0, margin_seconds=0.05),
+            retry_policy=RetryPolicy(max_attempts=1),
+        )
+        start = time.monotonic()
+        for _ in range(5):
+            await self.client.get_party("user1", "token")
+        # Paced into the second window instead of hitting 429
+        self.assertEqual(server.rate_limited, 0)
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+
+    async def test_throughput(self):
+        await self.start(HabiticaStubServer(latency_seconds=0.05, rate_limit=1000), rate_limiter=RateLimiter(user_limit=1000, global_limit=1000))
+        start = time.monotonic()
+        await asyncio.gather(*[self.client.post_chat(f"user{i % 5}", "token", "party", f"message {i}") for i in range(50)])
+        elapsed = time.monotonic() - start
+        self.assertEqual(self.server.calls, 50)
+        # Calls overlap on pooled connections instead of running one after another
+        self.assertLess(elapsed, 50 * 0.05 / 2)
+
+    async def test_missing_auth(self):
+        await self.start(HabiticaStubServer(), retry_policy=RetryPolicy(max_attempts=1))
+        with self.assertRaises(HabiticaAPIException) as error:
+            await self.client.get_party("user1", "")
+        self.assertEqual(error.exception.status, 401)
@@ -0,0 +1,63 @@
+import unittest
+import asyncio
+from habitica.keyed_lock import KeyedLock
+from app.metrics_service import MetricsRegistry
+
+class KeyedLockTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.metrics = MetricsRegistry()
+        self.locks = KeyedLock("test", self.metrics)
+
+    async def test_same_key_runs_in_order(self):
+        order = []
+        async def work(key, i):
+            async with self.locks(key):
+                order.append(("start", i))
+                await asyncio.sleep(0.001)
+                order.append(("end", i))
+        await asyncio.gather(*[work("user1", i) for i in range(3)])
+        self.assertEqual(order, [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)])
+        self.assertEqual(self.locks.max_held, 1)
+        self.assertEqual(self.locks.keys, {})
+
+    async def test_different_keys_run_in_parallel(self):
+        started = asyncio.Event()
+        async def hold(key):
+            async with self.locks(key):
+                await started.wait()
+        tasks = [asyncio.create_task(hold(f"user{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        self.assertEqual(self.locks.max_held, 3)
+        started.set()
+        await asyncio.gather(*tasks)
+
+    async def test_queue_depth_metrics(self):
+        release = asyncio.Event()
+        async def hold():
+            async with self.locks("user1"):
+                await release.wait()
+        tasks = [asyncio.create_task(hold()) for _ in range(4)]
+        await asyncio.sleep(0)
+        self.assertEqual(self.locks.depth("user1"), 4)
+        self.assertEqual(self.locks.waiting.get(name="test"), 3)
+        self.assertEqual(self.locks.held.get(name="test"), 1)
+        self.assertIn('habitica_keyed_lock_waiting{name="test"} 3', self.metrics.render())
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.locks.waiting.get(name="test"), 0)
+        self.assertEqual(self.locks.queue_depth.get(name="test").sum, 0 + 1 + 2 + 3)
+
+    async def test_cancelled_waiter(self):
+        release = asyncio.Event()
+        async def hold():
+            async with self.locks("user1"):
+                await release.wait()
+        holder = asyncio.create_task(hold())
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        self.assertEqual(self.locks.depth("user1"), 1)
+        release.set()
+        await holder
+        self.assertEqual(self.locks.keys, {})
@@ -0,0 +1,85 @@
+import unittest
+from app.metrics_service import MetricsRegistry
+from app.webhook_service import metrics
+from habitica.habitica_api import HabiticaClient, HabiticaAPIException, endpoint_label
+from habitica.retry_policy import RetryPolicy
+from test.habitica_stub_server import HabiticaStubServer
+
+class MetricsRegistryTest(unittest.TestCase):
+    def test_counter(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("calls_total", "Calls", ("method",))
+        counter.inc(method="GET")
+        counter.inc(2, method="GET")
+        self.assertEqual(counter.get(method="GET"), 3)
+        self.assertIs(registry.counter("calls_total", "Calls", ("method",)), counter)
+        self.assertIn('calls_total{method="GET"} 3', registry.render())
+        with self.assertRaises(ValueError):
+            registry.histogram("calls_total", "Calls")
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+        series = histogram.get()
+        self.assertEqual(series.buckets, [1, 2, 1])
+        self.assertEqual(series.count, 4)
+        self.assertEqual(histogram.quantile(0.5), 1)
+        rendered = registry.render()
+        self.assertIn('latency_seconds_bucket{le="1"} 3', rendered)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', rendered)
+        self.assertIn('latency_seconds_count 4', rendered)
+
+    def test_bound_labels(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("calls_total", "Calls", ("method",))
+        histogram = registry.histogram("latency_seconds", "Latency", ("method",), buckets=(0.1, 1))
+        calls = counter.labels(method="GET")
+        latency = histogram.labels(method="GET")
+        calls.inc()
+        counter.inc(method="GET")
+        latency.observe(0.5)
+        histogram.observe(5, method="GET")
+        self.assertEqual(counter.get(method="GET"), 2)
+        self.assertEqual(histogram.get(method="GET").buckets, [0, 1, 1])
+
+    def test_endpoint_label(self):
+        self.assertEqual(endpoint_label("/user/webhook/af6dbc2b-58f4-4aa6-8211-659f3adf6675"), "/user/webhook/:id")
+        self.assertEqual(endpoint_label("/groups/d0b9e85f-cc59-4510-a64c-ecee22e1c1b0/chat"), "/groups/:id/chat")
+        self.assertEqual(endpoint_label("/groups/party/chat"), "/groups/party/chat")
+
+class ClientMetricsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.server = HabiticaStubServer()
+        self.registry = MetricsRegistry()
+        base_url = await self.server.start()
+        self.client = HabiticaClient(base_url=base_url, metrics=self.registry, retry_policy=RetryPolicy(max_attempts=3, base_delay_seconds=0.001))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_request_metrics(self):
+        await self.client.get_party("user1", "token")
+        await self.client.get_user("user1", "token")
+        self.assertEqual(self.client.responses.get(method="GET", endpoint="/groups", status=200), 1)
+        self.assertEqual(self.client.request_seconds.get(method="GET", endpoint="/user", status=200).count, 1)
+        # The full sample user is tens of KB, the party much less
+        user_bytes = self.client.response_bytes.get(method="GET", endpoint="/user").sum
+        party_bytes = self.client.response_bytes.get(method="GET", endpoint="/groups").sum
+        self.assertGreater(user_bytes, party_bytes)
+        self.assertEqual(self.client.queue_wait_seconds.get(stage="limiter").count, 2)
+        self.assertEqual(self.client.queue_wait_seconds.get(stage="scheduler").count, 2)
+
+    async def test_errors_and_retries(self):
+        self.server.error_rate = 1
+        with self.assertRaises(HabiticaAPIException):
+            await self.client.get_party("user1", "token")
+        self.assertEqual(self.client.responses.get(method="GET", endpoint="/groups", status=503), 3)
+        self.assertEqual(self.client.retries.get(method="GET", endpoint="/groups"), 2)
+
+    async def test_metrics_route(self):
+        response = await metrics()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE", response.body)
@@ -0,0 +1,55 @@
+"""
+Compares dacite.from_dict with the compiled ModelLoader for each model loaded from Habitica or persistence.
+
+Run from the repo root: python -m test.model_loader_benchmark
+"""
+import json
+import timeit
+import dacite
+from app.model.app_user import AppUser, UserMap, HabiticaUserLink, load_app_user
+from app.model.bank import Bank, BankAccount, load_bank
+from habitica.model.user import HabiticaUser, load_user
+from habitica.model.task import HabiticaTasks, load_tasks
+from habitica.model.party import HabiticaParty, load_party
+from habitica.model.webhook import Webhook, load_webhook
+
+def load_sample(name: str) -> dict:
+    with open(f"test/sample_data/{name}") as fh:
+        return json.load(fh)
+
+def cases():
+    user = load_sample("user_model.json")["data"]
+    user["stats"]["character_class"] = user["stats"].pop("class")
+
+    tasks = {"todo": [], "daily": [], "habit": [], "reward": []}
+    for task in load_sample("tasks_model.json")["data"]:
+        tasks[task["type"]].append(task)
+
+    app_user = AppUser("id", "name", [UserMap("id", "channel", "api_user", "token")], [HabiticaUserLink("id", "api_user", "token")])
+    bank = Bank("bank", "Bank", "owner")
+    bank.accounts.extend(BankAccount(f"account{i}", "Account", "bank", "owner", "habitica", i) for i in range(10))
+
+    return [
+        ("HabiticaUser", HabiticaUser, load_user, user),
+        ("HabiticaTasks", HabiticaTasks, load_tasks, tasks),
+        ("HabiticaParty", HabiticaParty, load_party, load_sample("party_model.json")["data"][0]),
+        ("Webhook", Webhook, load_webhook, load_sample("taskActivity-todo.json")),
+        ("AppUser", AppUser, load_app_user, app_user.dump()),
+        ("Bank", Bank, load_bank, bank.dump()),
+    ]
+
+def best_of(fcn, number: int) -> float:
+    "Fastest mean seconds per call over a few repeats."
+    return min(timeit.repeat(fcn, number=number, repeat=5)) / number
+
+def main():
+    print(f"{'model':>14} {'dacite':>10} {'compiled':>10} {'speedup':>8}")
+    for name, data_class, loader, data in cases():
+        loader(data) # Compile outside the timing
+        number = 20 if data_class in (HabiticaUser, HabiticaTasks) else 500
+        reflected = best_of(lambda: dacite.from_dict(data_class, data, loader.config), number)
+        compiled = best_of(lambda: loader(data), number)
+        print(f"{name:>14} {reflected * 1e6:>8.0f}us {compiled * 1e6:>8.0f}us {reflected / compiled:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
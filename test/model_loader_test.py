@@ -0,0 +1,123 @@
+import unittest
+from unittest import mock
+import json
+from datetime import date
+import dacite
+from dataclasses import dataclass, field
+from typing import Optional, Any
+from dacite import Config
+from app.model import loader as loader_module
+from app.model.loader import ModelLoader, LoaderCompiler
+from app.model.bank import Bank, BankAccount, BankLoanAccount, load_bank
+from app.model.app_user import AppUser, UserMap, HabiticaUserLink
+from app.transaction_service import TransactableAttribute
+from habitica.model.user import HabiticaUser
+from habitica.model.task import HabiticaTasks, HabiticaDaily, TASK_CONFIG
+from habitica.model.party import HabiticaParty
+from habitica.model.webhook import Webhook
+
+def load_sample(name):
+    with open(f'test/sample_data/{name}') as fh:
+        return json.load(fh)
+
+@dataclass
+class Node:
+    name: str
+    weight: float
+    tags: list[str]
+    extra: dict
+    child: Optional["Node"] = None
+    children: list["Node"] = field(default_factory=list)
+    value: int | str | None = None
+    anything: Any = None
+
+class ModelLoaderTest(unittest.TestCase):
+    def assertSameAsDacite(self, data_class, data, config=None):
+        expected = dacite.from_dict(data_class, data, config)
+        loaded = ModelLoader(data_class, config)(data)
+        self.assertEqual(loaded, expected)
+        self.assertEqual(repr(loaded), repr(expected))
+        return loaded
+
+    def test_habitica_models(self):
+        user = load_sample('user_model.json')
+        user['data']['stats']['character_class'] = user['data']['stats'].pop('class')
+        self.assertSameAsDacite(HabiticaUser, user['data'])
+
+        tasks = {"todo":[],"daily":[],"habit":[],"reward":[]}
+        for task in load_sample('tasks_model.json')['data']:
+            tasks[task['type']].append(task)
+        self.assertSameAsDacite(HabiticaTasks, tasks, TASK_CONFIG)
+
+        for party in load_sample('party_model.json')['data']:
+            self.assertSameAsDacite(HabiticaParty, party)
+
+        webhook = self.assertSameAsDacite(Webhook, load_sample('taskActivity-daily.json'), TASK_CONFIG)
+        self.assertIsInstance(webhook.task, HabiticaDaily)
+        for name in ['taskActivity-habit.json', 'taskActivity-reward.json', 'taskActivity-todo.json']:
+            self.assertSameAsDacite(Webhook, load_sample(name), TASK_CONFIG)
+
+    def test_app_models(self):
+        app_user = AppUser("id", "name", [UserMap("id", "channel", "api_user", "token")], [HabiticaUserLink("id", "api_user", "token")])
+        self.assertSameAsDacite(AppUser, app_user.dump())
+
+        bank = Bank("bank", "Bank", "owner")
+        bank.accounts.append(BankAccount("account", "Account", "bank", "owner", "habitica", 50))
+        bank.loan_accounts.append(BankLoanAccount("loan", "Loan", "bank", "owner", "habitica", 100.0, 0.03, 30, 80, date(2024, 1, 1)))
+        loaded = self.assertSameAsDacite(Bank, bank.dump(), load_bank.config)
+        self.assertEqual(loaded.accounts[0].balance, 50)
+        self.assertIsInstance(loaded.accounts[0]._balance, TransactableAttribute)
+        self.assertEqual(loaded.dump(), bank.dump())
+
+    def test_types(self):
+        data = {
+            "name": "root", "weight": 1, "tags": ["a"], "extra": {"k": [1]}, "value": "1", "anything": object,
+            "child": {"name": "child", "weight": 0.5, "tags": [], "extra": {}, "value": None},
+            "children": [{"name": "a", "weight": 2.5, "tags": ["x", "y"], "extra": {}, "value": 3}],
+        }
+        loaded = self.assertSameAsDacite(Node, data)
+        self.assertIsNone(loaded.child.child)
+        self.assertEqual(loaded.children[0].value, 3)
+
+    def test_hooks_and_cast(self):
+        config = Config(type_hooks={str: str.upper}, cast=[int])
+        data = {"name": "root", "weight": 1.5, "tags": ["a", "b"], "extra": {}, "value": "7"}
+        self.assertSameAsDacite(Node, data, config)
+
+    def test_same_errors(self):
+        cases = [
+            {"weight": 1, "tags": [], "extra": {}},  # Missing name
+            {"name": "root", "weight": "heavy", "tags": [], "extra": {}},  # Wrong type
+            {"name": "root", "weight": 1, "tags": [1], "extra": {}},  # Wrong item type
+            {"name": "root", "weight": 1, "tags": [], "extra": {}, "value": 1.5},  # No union member matches
+            {"name": "root", "weight": 1, "tags": [], "extra": {}, "child": {"name": 1, "weight": 1, "tags": [], "extra": {}}},
+        ]
+        loader = ModelLoader(Node)
+        for data in cases:
+            with self.assertRaises(dacite.DaciteError) as expected:
+                dacite.from_dict(Node, data)
+            with self.assertRaises(dacite.DaciteError) as loaded:
+                loader(data)
+            self.assertEqual(type(loaded.exception), type(expected.exception))
+            self.assertEqual(str(loaded.exception), str(expected.exception))
+
+    def test_compiled_once(self):
+        loader = ModelLoader(Node)
+        loader({"name": "root", "weight": 1, "tags": [], "extra": {}})
+        compiled = loader.load
+        loader({"name": "other", "weight": 2, "tags": [], "extra": {}})
+        self.assertIs(loader.load, compiled)
+
+    def test_falls_back_to_dacite(self):
+        data = {"name": "root", "weight": 1, "tags": ["a"], "extra": {}, "child": {"name": "leaf", "weight": 0.5, "tags": [], "extra": {}}}
+        # Without dacite's internals
+        with mock.patch.object(loader_module, "COMPILER_AVAILABLE", False):
+            loader = ModelLoader(Node)
+            self.assertEqual(loader(data), dacite.from_dict(Node, data))
+            self.assertEqual(loader.load, loader.from_dict)
+        # With internals that changed shape
+        with mock.patch.object(LoaderCompiler, "compile_dataclass", side_effect=AttributeError("changed")):
+            loader = ModelLoader(Node, Config())
+            self.assertEqual(loader(data), dacite.from_dict(Node, data))
+            self.assertEqual(loader.load, loader.from_dict)
+
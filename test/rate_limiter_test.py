@@ -0,0 +1,112 @@
+import unittest
+import asyncio
+import time
+from datetime import datetime, timezone
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from habitica.rate_limiter import RateLimiter, SlidingWindow, RateLimitPacer, parse_reset_header
+from habitica.habitica_api import HabiticaClient, HabiticaRateLimitException
+from habitica.retry_policy import RetryPolicy
+
+class SlidingWindowTest(unittest.TestCase):
+    def test_wait_time_and_expiry(self):
+        window = SlidingWindow(2, 10)
+        window.record(0)
+        window.record(1)
+        self.assertEqual(window.wait_time(5), 5) # Oldest call leaves the window at t=10
+        self.assertEqual(window.wait_time(10.5), 0)
+        self.assertEqual(len(window.calls), 1) # Expired call was dropped
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_user_budget_waits(self):
+        limiter = RateLimiter(user_limit=2, global_limit=100, window_seconds=0.2)
+        start = time.monotonic()
+        await limiter.acquire("user1")
+        await limiter.acquire("user1")
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        # Third call waits for the window instead of raising
+        await limiter.acquire("user1")
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    async def test_users_have_separate_budgets(self):
+        limiter = RateLimiter(user_limit=1, global_limit=100, window_seconds=0.5)
+        await limiter.acquire("user1")
+        start = time.monotonic()
+        await limiter.acquire("user2")
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    async def test_global_budget(self):
+        limiter = RateLimiter(user_limit=10, global_limit=2, window_seconds=0.2)
+        start = time.monotonic()
+        await asyncio.gather(*[limiter.acquire(f"user{i}") for i in range(3)])
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    async def test_queue_depth(self):
+        limiter = RateLimiter(user_limit=1, global_limit=100, window_seconds=0.2)
+        await limiter.acquire("user1")
+        waiters = [asyncio.create_task(limiter.acquire("user1")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        self.assertEqual(limiter.queue_depth, 3)
+        self.assertEqual(limiter.user_queue_depth("user1"), 3)
+        await asyncio.gather(*waiters)
+        self.assertEqual(limiter.queue_depth, 0)
+
+class ParseResetHeaderTest(unittest.TestCase):
+    def test_formats(self):
+        now = datetime(2023, 4, 6, 18, 30, 0, tzinfo=timezone.utc)
+        self.assertEqual(parse_reset_header("Thu Apr 06 2023 18:30:46 GMT+0000 (Coordinated Universal Time)", now), 46)
+        self.assertEqual(parse_reset_header("Thu, 06 Apr 2023 18:30:46 GMT", now), 46)
+        self.assertEqual(parse_reset_header(str(int(now.timestamp() * 1000) + 2000), now), 2)
+        self.assertEqual(parse_reset_header("5", now), 5)
+        self.assertIsNone(parse_reset_header("soon", now))
+
+class RateLimitPacerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        # Local stub with a fixed window limit that other Habitica clients have already used part of.
+        self.limit = 5
+        self.window = 0.5
+        self.window_start = time.time()
+        self.window_calls = 3
+        self.too_many = 0
+        async def handle_user(request: web.Request):
+            now = time.time()
+            if now - self.window_start >= self.window:
+                self.window_start = now
+                self.window_calls = 0
+            self.window_calls += 1
+            headers = {
+                "X-RateLimit-Limit": str(self.limit),
+                "X-RateLimit-Remaining": str(max(self.limit - self.window_calls, 0)),
+                "X-RateLimit-Reset": str(int((self.window_start + self.window) * 1000)),
+            }
+            if self.window_calls > self.limit:
+                self.too_many += 1
+                return web.json_response({"success": False}, status=429, headers=headers)
+            return web.json_response({"success": True, "data": {}}, headers=headers)
+        stub = web.Application()
+        stub.router.add_get("/user/webhook", handle_user)
+        self.server = TestServer(stub)
+        await self.server.start_server()
+        self.client = HabiticaClient(
+            base_url=str(self.server.make_url("")).rstrip("/"),
+            rate_limiter=RateLimiter(user_limit=self.limit, global_limit=100, window_seconds=self.window + 0.1),
+            pacer=RateLimitPacer(reserve=2, margin_seconds=0.05)
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_pacing_avoids_429(self):
+        await self.client.get_webhooks("api_user", "api_token")
+        self.assertEqual(self.client.pacer.budgets["api_user"].remaining, 1)
+        await asyncio.gather(*[self.client.get_webhooks("api_user", "api_token") for _ in range(7)])
+        self.assertEqual(self.too_many, 0)
+
+    async def test_429_raises(self):
+        self.client.retry_policy = RetryPolicy(max_attempts=1)
+        self.window_calls = self.limit
+        with self.assertRaises(HabiticaRateLimitException):
+            await self.client.get_webhooks("api_user", "api_token")
+        self.assertEqual(self.client.pacer.budgets["api_user"].remaining, 0)
@@ -0,0 +1,128 @@
+import unittest
+import asyncio
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from habitica.request_scheduler import RequestScheduler, Priority, request_priority, current_priority, with_priority
+from habitica.rate_limiter import PriorityLock, RateLimiter
+from habitica.habitica_api import HabiticaClient
+
+class RequestSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def run_calls(self, scheduler: RequestScheduler, calls: list[tuple[str, Priority]], order: list):
+        all_queued = asyncio.Event()
+        async def call(api_user, priority):
+            async with scheduler.slot(api_user, priority):
+                order.append((api_user, priority))
+                # Hold the slot until every call is queued, however slow the machine
+                await all_queued.wait()
+                await asyncio.sleep(0.001)
+        tasks = []
+        for api_user, priority in calls:
+            tasks.append(asyncio.create_task(call(api_user, priority)))
+            await asyncio.sleep(0) # Queue in submission order
+        all_queued.set()
+        await asyncio.gather(*tasks)
+
+    async def test_interactive_goes_first(self):
+        scheduler = RequestScheduler(max_concurrency=1)
+        order = []
+        calls = [("user1", Priority.BACKGROUND)] * 3 + [("user2", Priority.INTERACTIVE)]
+        await self.run_calls(scheduler, calls, order)
+        # First background call was already running, the interactive call is next
+        self.assertEqual(order[1], ("user2", Priority.INTERACTIVE))
+
+    async def test_users_take_turns(self):
+        scheduler = RequestScheduler(max_concurrency=1)
+        order = []
+        calls = [("user1", Priority.NORMAL)] * 4 + [("user2", Priority.NORMAL)] * 2
+        await self.run_calls(scheduler, calls, order)
+        self.assertEqual([api_user for api_user, _ in order], ["user1", "user1", "user2", "user1", "user2", "user1"])
+
+    async def test_class_limits(self):
+        limits = {Priority.INTERACTIVE: 4, Priority.NORMAL: 4, Priority.BACKGROUND: 1}
+        scheduler = RequestScheduler(max_concurrency=4, class_limits=limits)
+        peak = {priority: 0 for priority in Priority}
+        async def call(priority):
+            async with scheduler.slot("user1", priority):
+                peak[priority] = max(peak[priority], scheduler.running_by_class[priority])
+                peak["total"] = max(peak.get("total", 0), scheduler.running)
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*[call(Priority.BACKGROUND) for _ in range(5)], *[call(Priority.INTERACTIVE) for _ in range(5)])
+        self.assertEqual(peak[Priority.BACKGROUND], 1)
+        self.assertEqual(peak["total"], 4)
+        self.assertEqual(scheduler.running, 0)
+
+    async def test_cancelled_waiter(self):
+        scheduler = RequestScheduler(max_concurrency=1)
+        async with scheduler.slot("user1", Priority.NORMAL):
+            waiter = asyncio.create_task(scheduler.acquire("user1", Priority.NORMAL))
+            await asyncio.sleep(0)
+            self.assertEqual(scheduler.queue_depth, 1)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            self.assertEqual(scheduler.queue_depth, 0)
+        self.assertEqual(scheduler.running, 0)
+
+    async def test_priority_context(self):
+        self.assertEqual(current_priority.get(), Priority.NORMAL)
+        with request_priority(Priority.INTERACTIVE):
+            self.assertEqual(current_priority.get(), Priority.INTERACTIVE)
+            # Tasks inherit the declared priority
+            task = asyncio.create_task(asyncio.sleep(0, current_priority.get()))
+            self.assertEqual(await task, Priority.INTERACTIVE)
+        self.assertEqual(current_priority.get(), Priority.NORMAL)
+
+        @with_priority(Priority.BACKGROUND)
+        async def background_job():
+            return current_priority.get()
+        self.assertEqual(await background_job(), Priority.BACKGROUND)
+
+class PriorityLockTest(unittest.IsolatedAsyncioTestCase):
+    async def test_handoff_by_priority(self):
+        lock = PriorityLock()
+        order = []
+        async def hold(name, priority):
+            async with lock.hold(priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+        first = asyncio.create_task(hold("first", Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(hold("background", Priority.BACKGROUND)),
+            asyncio.create_task(hold("interactive", Priority.INTERACTIVE)),
+        ]
+        await asyncio.gather(first, *waiters)
+        self.assertEqual(order, ["first", "interactive", "background"])
+        self.assertFalse(lock.locked)
+
+class ThrottledUserTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        async def handle(request: web.Request):
+            return web.json_response({"success": True, "data": {}})
+        stub = web.Application()
+        stub.router.add_get("/user/webhook", handle)
+        self.server = TestServer(stub)
+        await self.server.start_server()
+        self.client = HabiticaClient(
+            base_url=str(self.server.make_url("")).rstrip("/"),
+            rate_limiter=RateLimiter(user_limit=1, global_limit=100, window_seconds=0.5),
+            scheduler=RequestScheduler(max_concurrency=1, class_limits={priority: 1 for priority in Priority}),
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_throttled_user_doesnt_hold_slots(self):
+        await self.client.get_webhooks("user1", "token")
+        # user1 is out of budget for the rest of the window, its calls wait without a scheduler slot
+        throttled = [asyncio.create_task(self.client.get_webhooks("user1", "token")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.client.scheduler.running, 0)
+        start = time.monotonic()
+        await self.client.get_webhooks("user2", "token")
+        self.assertLess(time.monotonic() - start, 0.25)
+        for task in throttled:
+            task.cancel()
+        await asyncio.gather(*throttled, return_exceptions=True)
+
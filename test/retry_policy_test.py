@@ -0,0 +1,73 @@
+import unittest
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from habitica.retry_policy import RetryPolicy
+from habitica.habitica_api import HabiticaClient, HabiticaAPIException
+from app.metrics_service import MetricsRegistry
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_idempotency_rules(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.is_idempotent("GET", "/user"))
+        self.assertTrue(policy.is_idempotent("PUT", "/user", {"stats.gp": 10}))
+        self.assertFalse(policy.is_idempotent("PUT", "/user", {"stats.gp": 10, "stats.hp": 5}))
+        self.assertFalse(policy.is_idempotent("POST", "/groups/party/chat", {"message": "hi"}))
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(base_delay_seconds=1, max_delay_seconds=3)
+        for attempt in range(10):
+            self.assertLessEqual(policy.backoff(attempt), 3)
+
+class FaultInjectionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        # Local stub that fails the first `self.failures` calls to each route with a 502
+        self.failures = 2
+        self.calls = {}
+        async def flaky(request: web.Request):
+            key = (request.method, request.path)
+            self.calls[key] = self.calls.get(key, 0) + 1
+            if self.calls[key] <= self.failures:
+                return web.Response(status=502, text="<html>Bad Gateway</html>")
+            return web.json_response({"success": True, "data": {}})
+        stub = web.Application()
+        stub.router.add_get("/user/webhook", flaky)
+        stub.router.add_put("/user", flaky)
+        stub.router.add_post("/groups/{group_id}/chat", flaky)
+        self.server = TestServer(stub)
+        await self.server.start_server()
+        self.policy = RetryPolicy(max_attempts=4, base_delay_seconds=0.01, max_delay_seconds=0.05, max_elapsed_seconds=5)
+        self.client = HabiticaClient(base_url=str(self.server.make_url("")).rstrip("/"), retry_policy=self.policy, metrics=MetricsRegistry())
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_get_is_retried(self):
+        await self.client.get_webhooks("api_user", "api_token")
+        self.assertEqual(self.calls[("GET", "/user/webhook")], 3)
+        self.assertEqual(self.client.retries.get(method="GET", endpoint="/user/webhook"), 2)
+
+    async def test_gold_put_is_retried(self):
+        await self.client.update_user("api_user", "api_token", {"stats.gp": 10})
+        self.assertEqual(self.calls[("PUT", "/user")], 3)
+
+    async def test_chat_post_is_not_retried(self):
+        with self.assertRaises(HabiticaAPIException) as context:
+            await self.client.post_chat("api_user", "api_token", "party", "hello")
+        self.assertEqual(context.exception.status, 502)
+        self.assertEqual(self.calls[("POST", "/groups/party/chat")], 1)
+
+    async def test_gives_up_after_max_attempts(self):
+        self.failures = 10
+        with self.assertRaises(HabiticaAPIException):
+            await self.client.get_webhooks("api_user", "api_token")
+        self.assertEqual(self.calls[("GET", "/user/webhook")], 4)
+
+    async def test_gives_up_after_max_elapsed(self):
+        self.failures = 10
+        self.client.retry_policy = RetryPolicy(max_attempts=100, base_delay_seconds=0.05, max_delay_seconds=0.05, max_elapsed_seconds=0.2)
+        start = time.monotonic()
+        with self.assertRaises(HabiticaAPIException):
+            await self.client.get_webhooks("api_user", "api_token")
+        self.assertLess(time.monotonic() - start, 0.5)
@@ -0,0 +1,47 @@
+"""
+Compares Habitica calls made for a burst of identical get_user requests with and without single-flight.
+Uses the module level fake in test/habitica_api_mock.py with a simulated network latency.
+
+Run from the repo root: python -m test.single_flight_benchmark
+"""
+import asyncio
+import json
+import time
+import test.habitica_api_mock as mock_api
+from habitica.single_flight import SingleFlight, request_key
+
+LATENCY_SECONDS = 0.1
+BURST_SIZE = 50
+USERS = 5
+
+calls = 0
+
+async def get_user(api_user, api_token):
+    "mock_api.get_user behind a simulated network round trip"
+    global calls
+    calls += 1
+    await asyncio.sleep(LATENCY_SECONDS)
+    return await mock_api.get_user(api_user, api_token)
+
+async def burst(fetch):
+    global calls
+    calls = 0
+    start = time.perf_counter()
+    await asyncio.gather(*[fetch(f"user{i % USERS}", "token") for i in range(BURST_SIZE)])
+    return calls, time.perf_counter() - start
+
+async def main():
+    with open("test/sample_data/user_model.json") as fh:
+        mock_api.persist['user'] = json.load(fh)
+
+    single_flight = SingleFlight()
+    async def coalesced_get_user(api_user, api_token):
+        return await single_flight.do(request_key("GET", "/user", api_user), lambda: get_user(api_user, api_token))
+
+    print(f"Burst of {BURST_SIZE} get_user calls across {USERS} users, {LATENCY_SECONDS * 1000:.0f}ms simulated latency")
+    for name, fetch in [("direct", get_user), ("single-flight", coalesced_get_user)]:
+        made, elapsed = await burst(fetch)
+        print(f"{name:>14}: {made:>3} Habitica calls in {elapsed * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
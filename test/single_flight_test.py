@@ -0,0 +1,98 @@
+import unittest
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from habitica.single_flight import SingleFlight, request_key
+from habitica.habitica_api import HabiticaClient
+from habitica.rate_limiter import RateLimiter
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_result(self):
+        single_flight = SingleFlight()
+        calls = []
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"data": len(calls)}
+        results = await asyncio.gather(*[single_flight.do("key", fetch) for _ in range(10)])
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(single_flight.shared, 9)
+
+        # Finished calls are not reused
+        await single_flight.do("key", fetch)
+        self.assertEqual(len(calls), 2)
+
+    async def test_exceptions_are_shared(self):
+        single_flight = SingleFlight()
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+        results = await asyncio.gather(*[single_flight.do("key", fail) for _ in range(3)], return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(single_flight.in_flight, {})
+
+    async def test_cancelled_leader_hands_over(self):
+        single_flight = SingleFlight()
+        calls = []
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return len(calls)
+        leader = asyncio.create_task(single_flight.do("key", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(single_flight.do("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        # One follower ran the call again and the others shared its result
+        self.assertEqual(results, [2, 2, 2])
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(single_flight.in_flight, {})
+
+    async def test_cancelled_follower(self):
+        single_flight = SingleFlight()
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "result"
+        leader = asyncio.create_task(single_flight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(single_flight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower.cancel()
+        self.assertEqual(await leader, "result")
+        with self.assertRaises(asyncio.CancelledError):
+            await follower
+
+    def test_request_key(self):
+        self.assertEqual(request_key("GET", "/groups", "user1", {"type": "party"}), request_key("GET", "/groups", "user1", {"type": "party"}))
+        self.assertNotEqual(request_key("GET", "/groups", "user1"), request_key("GET", "/groups", "user2"))
+
+class ClientSingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.requests = 0
+        async def handle_user(request: web.Request):
+            self.requests += 1
+            await asyncio.sleep(0.05)
+            return web.json_response({"success": True, "data": {"stats": {"class": "warrior"}}})
+        stub = web.Application()
+        stub.router.add_get("/user", handle_user)
+        stub.router.add_get("/groups", handle_user)
+        self.server = TestServer(stub)
+        await self.server.start_server()
+        self.client = HabiticaClient(base_url=str(self.server.make_url("")).rstrip("/"), rate_limiter=RateLimiter(user_limit=100))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_burst_of_get_user(self):
+        users = await asyncio.gather(*[self.client.get_user("api_user", "api_token") for _ in range(10)])
+        self.assertEqual(self.requests, 1)
+        self.assertTrue(all(user['data']['stats']['character_class'] == "warrior" for user in users))
+
+    async def test_burst_of_gets(self):
+        await asyncio.gather(*[self.client.get_party("api_user", "api_token") for _ in range(5)])
+        await asyncio.gather(*[self.client.get_party(f"api_user{i}", "api_token") for i in range(5)])
+        self.assertEqual(self.requests, 6)
@@ -0,0 +1,120 @@
+import unittest
+import copy
+import json
+from habitica.model.task import HabiticaTasks, HabiticaDaily
+from habitica.model.webhook import Webhook, decode_webhook
+from habitica.task_index import TaskIndex, UserTaskIndex
+from habitica.habitica_service import HabiticaService
+from app.events import event_service
+from app.metrics_service import MetricsRegistry
+
+API_USER = "user1"
+
+def load_sample(name):
+    with open(f'test/sample_data/{name}') as fh:
+        return json.load(fh)
+
+def webhook(name: str, webhook_type: str, **task_changes) -> dict:
+    payload = load_sample(name)
+    payload['type'] = webhook_type
+    payload['user']['_id'] = API_USER
+    payload['task'].update(task_changes)
+    return payload
+
+def decoded(name: str, webhook_type: str, **task_changes) -> Webhook:
+    return decode_webhook(webhook(name, webhook_type, **task_changes))
+
+class TaskIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.response = load_sample('tasks_model.json')
+        self.index = TaskIndex(resync_seconds=60, metrics=MetricsRegistry())
+        self.tasks = self.index.sync(API_USER, HabiticaTasks.load(self.response))
+
+    def test_served_from_index(self):
+        self.assertIs(self.index.get(API_USER), self.tasks)
+        self.assertIsNone(self.index.get("other"))
+        self.index.resync_seconds = 0
+        self.assertIsNone(self.index.get(API_USER))
+
+    def test_created_updated_deleted(self):
+        daily_count = len(self.tasks.daily)
+        created = decoded('taskActivity-daily.json', "created", id="new", _id="new", updatedAt="2030-01-01T00:00:00.000Z")
+        self.assertTrue(self.index.apply_webhook(created))
+        tasks = self.index.get(API_USER)
+        self.assertEqual(len(tasks.daily), daily_count + 1)
+        self.assertIsInstance(tasks.daily[-1], HabiticaDaily)
+
+        updated = decoded('taskActivity-daily.json', "updated", id="new", _id="new", text="Renamed", updatedAt="2030-01-02T00:00:00.000Z")
+        self.assertTrue(self.index.apply_webhook(updated))
+        self.assertEqual(self.index.get(API_USER).daily[-1].text, "Renamed")
+
+        # A late delivery of an older change doesn't undo the newer one
+        self.assertFalse(self.index.apply_webhook(created))
+        self.assertEqual(self.index.get(API_USER).daily[-1].text, "Renamed")
+
+        self.assertTrue(self.index.apply_webhook(decoded('taskActivity-daily.json', "deleted", id="new")))
+        self.assertEqual(len(self.index.get(API_USER).daily), daily_count)
+
+    def test_scored_replaces_in_place(self):
+        habit = self.tasks.habit[0]
+        scored = decoded('taskActivity-habit.json', "scored", id=habit.id, _id=habit.id, value=42.0, updatedAt="2030-01-01T00:00:00.000Z")
+        self.index.apply_webhook(scored)
+        tasks = self.index.get(API_USER)
+        self.assertEqual(tasks.habit[0].value, 42.0)
+        self.assertEqual([task.id for task in tasks.habit], [task.id for task in self.tasks.habit])
+
+    def test_unindexed_users(self):
+        created = decoded('taskActivity-todo.json', "created")
+        created.user['_id'] = "other"
+        self.assertFalse(self.index.apply_webhook(created))
+
+    def test_checksum_resync(self):
+        index = self.index.users[API_USER]
+        checksum = index.checksum
+        todo = self.tasks.todo[0]
+        self.index.apply_webhook(decoded('taskActivity-todo.json', "updated", id=todo.id, _id=todo.id, updatedAt="2030-01-01T00:00:00.000Z"))
+        self.assertNotEqual(index.checksum, checksum)
+
+        # Habitica agrees with the index
+        fresh = copy.deepcopy(self.response)
+        next(task for task in fresh['data'] if task['id'] == todo.id)['updatedAt'] = "2030-01-01T00:00:00.000Z"
+        self.index.sync(API_USER, HabiticaTasks.load(fresh))
+        self.assertIs(self.index.users[API_USER], index)
+        self.assertEqual(self.index.resyncs.values[("match",)], 1)
+
+        # A missed webhook is caught by the checksum
+        fresh['data'].pop()
+        tasks = self.index.sync(API_USER, HabiticaTasks.load(fresh))
+        self.assertEqual(self.index.resyncs.values[("mismatch",)], 1)
+        self.assertIs(self.index.get(API_USER), tasks)
+        self.assertEqual(self.index.users[API_USER].checksum, UserTaskIndex.from_tasks(tasks).checksum)
+
+class TasksApi:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def get_tasks(self, api_user, api_token):
+        self.calls += 1
+        return load_sample('tasks_model.json')
+
+class HabiticaServiceTaskIndexTest(unittest.IsolatedAsyncioTestCase):
+    async def test_task_views_cost_no_calls(self):
+        api = TasksApi()
+        service = HabiticaService(api)
+        tasks = await service.get_tasks(API_USER, "token")
+        daily = tasks.daily[0]
+        payload = webhook('taskActivity-daily.json', "scored", id=daily.id, _id=daily.id, streak=99, updatedAt="2030-01-01T00:00:00.000Z")
+        service.handle_webhook_received(event_service.ReceiveHabiticaWebhookEvent(payload))
+        tasks = await service.get_tasks(API_USER, "token")
+        self.assertEqual(tasks.daily[0].streak, 99)
+        self.assertEqual(api.calls, 1)
+
+        await service.get_tasks(API_USER, "token", fresh=True)
+        self.assertEqual(api.calls, 2)
+
+    async def test_bad_task_drops_the_index(self):
+        service = HabiticaService(TasksApi())
+        await service.get_tasks(API_USER, "token")
+        bad = webhook('taskActivity-todo.json', "created", id="bad", checklist="not a list")
+        service.handle_webhook_received(event_service.ReceiveHabiticaWebhookEvent(bad))
+        self.assertFalse(service.task_index.indexed(API_USER))
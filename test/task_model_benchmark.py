@@ -0,0 +1,58 @@
+"""
+Memory held by the tasks in test/sample_data/tasks_model.json, loaded with the slotted models and columnar
+TaskHistory, against the same tasks loaded into plain dataclasses with a list of HistoryEntry objects.
+
+Run from the repo root: python -m test.task_model_benchmark
+"""
+import json
+import tracemalloc
+from dataclasses import fields, make_dataclass
+from habitica.model import task as Task
+from habitica.model.task import HabiticaTasks
+
+USERS = 50
+
+def plain(data_class):
+    "Dataclass with the same fields as data_class but a __dict__ and a list of HistoryEntry for history."
+    def field_type(field):
+        return list[PlainHistoryEntry] if field.type is Task.TaskHistory else field.type
+    return make_dataclass(f"Plain{data_class.__name__}", [(field.name, field_type(field)) for field in fields(data_class)])
+
+PlainHistoryEntry = make_dataclass("PlainHistoryEntry", [(field.name, field.type) for field in fields(Task.HistoryEntry)])
+
+SLOTTED_CLASSES = {"habit": Task.HabiticaHabit, "daily": Task.HabiticaDaily, "todo": Task.HabiticaTodo, "reward": Task.HabiticaReward}
+PLAIN_CLASSES = {task_type: plain(data_class) for task_type, data_class in SLOTTED_CLASSES.items()}
+
+def load_plain(response: dict) -> list:
+    tasks = []
+    for task in response['data']:
+        data_class = SLOTTED_CLASSES[task['type']]
+        values = {}
+        for field in fields(data_class):
+            value = task.get(field.name)
+            if field.name == "history":
+                value = [PlainHistoryEntry(entry['date'], entry['value'], entry.get('scoredUp'), entry.get('scoredDown'), entry.get('isDue'), entry.get('completed')) for entry in value]
+            values[field.name] = value
+        tasks.append(PLAIN_CLASSES[task['type']](**values))
+    return tasks
+
+def measure(load, response: str) -> int:
+    "Bytes still allocated once the tasks are loaded for every user and the raw JSON is dropped."
+    tracemalloc.start()
+    kept = [load(json.loads(response)) for _ in range(USERS)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size
+
+def main():
+    with open("test/sample_data/tasks_model.json") as fh:
+        response = fh.read()
+    entries = sum(len(task.get('history', [])) for task in json.loads(response)['data'])
+    print(f"{USERS} users, {entries} history entries each")
+    for name, load in [("plain dataclasses", load_plain), ("slotted + columnar", HabiticaTasks.load)]:
+        size = measure(load, response)
+        print(f"{name:>18}: {size / USERS / 1024:7.1f}KB per user")
+
+if __name__ == "__main__":
+    main()
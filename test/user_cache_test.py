@@ -0,0 +1,115 @@
+import unittest
+import json
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from habitica.user_cache import UserCache
+from habitica.habitica_api import HabiticaClient
+from habitica.habitica_service import HabiticaService
+from app.events import event_service
+
+class UserCacheTest(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = UserCache(ttl_seconds=60)
+        self.assertIsNone(cache.get("user1"))
+        response = {"data": {}}
+        cache.store("user1", response, '"etag1"')
+        self.assertIs(cache.get("user1").response, response)
+        self.assertEqual(cache.stats["hits"], 1)
+        self.assertEqual(cache.stats["misses"], 1)
+
+    def test_expire_keeps_etag(self):
+        cache = UserCache(ttl_seconds=60)
+        cache.store("user1", {"data": {}}, '"etag1"')
+        cache.expire("user1")
+        self.assertIsNone(cache.get("user1"))
+        self.assertEqual(cache.etag("user1"), '"etag1"')
+        cache.invalidate("user1")
+        self.assertIsNone(cache.etag("user1"))
+
+    def test_load_user_is_memoized(self):
+        cache = UserCache(ttl_seconds=60)
+        response = {"data": {}}
+        cache.store("user1", response)
+        loads = []
+        loader = lambda r: loads.append(r) or object()
+        user = cache.load_user("user1", response, loader)
+        self.assertIs(cache.load_user("user1", response, loader), user)
+        self.assertEqual(len(loads), 1)
+
+        # Responses that aren't cached are always parsed
+        cache.load_user("user1", {"data": {}}, loader)
+        self.assertEqual(len(loads), 2)
+
+class ConditionalGetTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        with open('test/sample_data/user_model.json') as fh:
+            self.user = json.load(fh)
+        self.version = 1
+        self.downloads = 0
+        self.not_modified = 0
+        self.during_request = None
+        async def handle_user(request: web.Request):
+            if self.during_request:
+                self.during_request()
+            etag = f'W/"{self.version}"'
+            if request.headers.get("If-None-Match") == etag:
+                self.not_modified += 1
+                return web.Response(status=304, headers={"ETag": etag})
+            self.downloads += 1
+            return web.json_response(self.user, headers={"ETag": etag})
+        async def handle_update(request: web.Request):
+            self.version += 1
+            return web.json_response(self.user)
+        stub = web.Application()
+        stub.router.add_get("/user", handle_user)
+        stub.router.add_put("/user", handle_update)
+        self.server = TestServer(stub)
+        await self.server.start_server()
+        self.client = HabiticaClient(base_url=str(self.server.make_url("")).rstrip("/"), user_cache=UserCache(ttl_seconds=60))
+        self.habitica_service = HabiticaService(self.client)
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_fresh_entries_skip_habitica(self):
+        user = await self.habitica_service.get_user("api_user", "api_token")
+        self.assertIs(await self.habitica_service.get_user("api_user", "api_token"), user)
+        self.assertEqual(self.downloads, 1)
+        self.assertEqual(self.client.user_cache.hits, 1)
+
+    async def test_stale_entries_revalidate(self):
+        user = await self.habitica_service.get_user("api_user", "api_token")
+        self.assertIs(await self.habitica_service.get_user("api_user", "api_token", fresh=True), user)
+        self.assertEqual(self.downloads, 1)
+        self.assertEqual(self.not_modified, 1)
+
+    async def test_invalidated_during_revalidation(self):
+        user_json = await self.client.get_user("api_user", "api_token")
+        self.client.user_cache.expire("api_user")
+        self.during_request = lambda: self.client.user_cache.invalidate("api_user")
+        # The 304 still answers with the entry the request was sent for, which stays out of the cache
+        self.assertIs(await self.client.get_user("api_user", "api_token"), user_json)
+        self.assertEqual(self.not_modified, 1)
+        self.assertNotIn("api_user", self.client.user_cache.entries)
+
+    async def test_invalidated_during_download(self):
+        self.during_request = lambda: self.client.user_cache.invalidate("api_user")
+        await self.client.get_user("api_user", "api_token")
+        # The response may be from before whatever invalidated the user, so it isn't cached
+        self.assertNotIn("api_user", self.client.user_cache.entries)
+        self.during_request = None
+        await self.client.get_user("api_user", "api_token")
+        self.assertIn("api_user", self.client.user_cache.entries)
+        self.assertEqual(self.downloads, 2)
+
+    async def test_update_user_invalidates(self):
+        await self.habitica_service.get_user("api_user", "api_token")
+        await self.client.update_user("api_user", "api_token", {"stats.gp": 1})
+        await self.habitica_service.get_user("api_user", "api_token")
+        self.assertEqual(self.downloads, 2)
+
+    async def test_activity_webhook_invalidates(self):
+        await self.habitica_service.get_user("api_user", "api_token")
+        self.habitica_service.handle_webhook_received(event_service.ReceiveHabiticaWebhookEvent({"webhookType": "userActivity", "user": {"_id": "api_user"}}))
+        self.assertNotIn("api_user", self.client.user_cache.entries)
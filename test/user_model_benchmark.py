@@ -0,0 +1,51 @@
+"""
+Compares the eager HabiticaUser loader with LazyHabiticaUser on test/sample_data/user_model.json,
+for parse time and peak memory, when the caller reads only `stats.gp` and when it reads every section.
+
+Run from the repo root: python -m test.user_model_benchmark
+"""
+import copy
+import json
+import time
+import tracemalloc
+from dataclasses import fields
+from habitica.model.user import HabiticaUser, LazyHabiticaUser
+
+ITERATIONS = 200
+
+def load_response() -> dict:
+    with open("test/sample_data/user_model.json") as fh:
+        response = json.load(fh)
+    response['data']['stats']['character_class'] = response['data']['stats'].pop('class')
+    return response
+
+def read_gold(user: HabiticaUser):
+    return user.stats.gp
+
+def read_all(user: HabiticaUser):
+    return [getattr(user, field.name) for field in fields(HabiticaUser)]
+
+def measure(load, read, response: dict) -> tuple[float, int]:
+    "Mean seconds per load and read, and peak bytes allocated by one."
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        read(load(response))
+    elapsed = (time.perf_counter() - start) / ITERATIONS
+
+    tracemalloc.start()
+    user = load(response)
+    read(user)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    response = load_response()
+    print(f"{len(json.dumps(response)) / 1024:.0f}KB user document, {ITERATIONS} iterations")
+    for access, read in [("stats.gp", read_gold), ("all sections", read_all)]:
+        for name, load in [("eager", HabiticaUser.load), ("lazy", LazyHabiticaUser.load)]:
+            elapsed, peak = measure(load, read, copy.deepcopy(response))
+            print(f"{name:>5} {access:>12}: {elapsed * 1000:7.3f}ms, peak {peak / 1024:7.1f}KB")
+
+if __name__ == "__main__":
+    main()
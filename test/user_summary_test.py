@@ -0,0 +1,67 @@
+import unittest
+import json
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from habitica.model import HabiticaUser, HabiticaUserSummary
+from habitica.habitica_api import HabiticaClient, USER_SUMMARY_FIELDS
+from habitica.habitica_service import HabiticaService
+import test.habitica_api_mock as mock_api
+
+def load_sample_user():
+    with open('test/sample_data/user_model.json') as fh:
+        return json.load(fh)
+
+class HabiticaUserSummaryTest(unittest.TestCase):
+    def test_matches_full_user(self):
+        response = load_sample_user()
+        summary = HabiticaUserSummary.load(response)
+        response['data']['stats']['character_class'] = response['data']['stats'].pop('class')
+        user = HabiticaUser.load(response)
+        self.assertEqual(summary.id, user.id)
+        self.assertEqual(summary.profile.name, user.profile.name)
+        self.assertEqual(summary.party._id, user.party._id)
+        self.assertEqual(summary.webhooks, user.webhooks)
+        for stat in ["hp", "mp", "exp", "gp", "lvl", "character_class", "toNextLevel", "maxHealth", "maxMP"]:
+            self.assertEqual(getattr(summary.stats, stat), getattr(user.stats, stat))
+
+    def test_projection(self):
+        response = {"data": {"_id": "api_user", "profile": {"name": "name"}, "party": {"_id": "party"}, "webhooks": [],
+                             "stats": {"hp": 50, "mp": 10, "exp": 1, "gp": 2.5, "lvl": 3, "class": "rogue"}}}
+        summary = HabiticaUserSummary.load(response)
+        self.assertEqual(summary.id, "api_user")
+        self.assertEqual(summary.stats.character_class, "rogue")
+        self.assertIsNone(summary.stats.maxMP)
+
+class UserFieldsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.user_fields = []
+        async def handle_user(request: web.Request):
+            self.user_fields.append(request.query.get("userFields"))
+            return web.json_response(load_sample_user())
+        stub = web.Application()
+        stub.router.add_get("/user", handle_user)
+        self.server = TestServer(stub)
+        await self.server.start_server()
+        self.client = HabiticaClient(base_url=str(self.server.make_url("")).rstrip("/"))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_summary_sends_user_fields(self):
+        habitica_service = HabiticaService(self.client)
+        summary = await habitica_service.get_user_summary("api_user", "api_token")
+        self.assertEqual(self.user_fields, [USER_SUMMARY_FIELDS])
+        self.assertEqual(summary.stats.character_class, "warrior")
+
+        # Summary and full user are cached separately
+        await habitica_service.get_user("api_user", "api_token")
+        self.assertEqual(self.user_fields, [USER_SUMMARY_FIELDS, None])
+
+class AddUserGoldTest(unittest.IsolatedAsyncioTestCase):
+    async def test_add_user_gold(self):
+        mock_api.persist['user'] = load_sample_user()
+        habitica_service = HabiticaService(mock_api)
+        starting_gold = (await habitica_service.get_user_summary("api_user", "api_token")).stats.gp
+        await habitica_service.add_user_gold("api_user", "api_token", 10)
+        self.assertEqual((await habitica_service.get_user_summary("api_user", "api_token")).stats.gp, starting_gold + 10)
@@ -0,0 +1,46 @@
+"""
+Decoding the recorded webhook payloads with dacite, the compiled union loader, and decode_webhook, which picks
+the task model from `task.type`. Reports webhooks decoded per second.
+
+Run from the repo root: python -m test.webhook_decoder_benchmark
+"""
+import json
+import timeit
+import dacite
+from habitica.model.task import TASK_CONFIG
+from habitica.model.webhook import Webhook, load_webhook, decode_webhook
+
+SAMPLES = ['taskActivity-daily.json', 'taskActivity-habit.json', 'taskActivity-reward.json', 'taskActivity-todo.json']
+WEBHOOKS = 10_000
+
+def load_samples() -> list[dict]:
+    payloads = []
+    for name in SAMPLES:
+        with open(f"test/sample_data/{name}") as fh:
+            payloads.append(json.load(fh))
+    # The same mix Habitica would send, most of it dailies and habits being scored
+    return [payloads[i % len(payloads)] for i in range(WEBHOOKS)]
+
+def rate(decode, payloads: list[dict]) -> float:
+    "Best of a few runs, in webhooks per second."
+    seconds = min(timeit.repeat(lambda: [decode(payload) for payload in payloads], number=1, repeat=3))
+    return len(payloads) / seconds
+
+def main():
+    payloads = load_samples()
+    decoders = [
+        ("dacite.from_dict", lambda payload: dacite.from_dict(Webhook, payload, TASK_CONFIG)),
+        ("compiled union", load_webhook),
+        ("decode_webhook", decode_webhook),
+        ("no task section", lambda payload: decode_webhook(payload, sections=())),
+    ]
+    for _, decode in decoders:
+        decode(payloads[0]) # Compile outside the timing
+    baseline = None
+    for name, decode in decoders:
+        per_second = rate(decode, payloads)
+        baseline = baseline or per_second
+        print(f"{name:>17}: {per_second:>9,.0f} webhooks/s ({per_second / baseline:.1f}x)")
+
+if __name__ == "__main__":
+    main()
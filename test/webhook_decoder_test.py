@@ -0,0 +1,68 @@
+import unittest
+import json
+import dacite
+from habitica.model.task import HabiticaDaily, HabiticaHabit, HabiticaReward, HabiticaTodo, TASK_CONFIG
+from habitica.model.webhook import (
+    Webhook, GroupChatReceivedWebhook, UserActivityWebhook, QuestActivityWebhook, ChatMessage,
+    UnknownWebhookException, decode_webhook,
+)
+
+def load_sample(name):
+    with open(f'test/sample_data/{name}') as fh:
+        return json.load(fh)
+
+class WebhookDecoderTest(unittest.TestCase):
+    def test_task_activity_matches_dacite(self):
+        expected = {
+            'taskActivity-daily.json': HabiticaDaily,
+            'taskActivity-habit.json': HabiticaHabit,
+            'taskActivity-reward.json': HabiticaReward,
+            'taskActivity-todo.json': HabiticaTodo,
+        }
+        for name, task_class in expected.items():
+            payload = load_sample(name)
+            webhook = decode_webhook(payload)
+            self.assertIs(type(webhook.task), task_class)
+            self.assertEqual(webhook, dacite.from_dict(Webhook, payload, TASK_CONFIG))
+            self.assertEqual(Webhook.load(payload), webhook)
+        # Webhook only loads taskActivity payloads
+        with self.assertRaises(dacite.DaciteError):
+            Webhook.load(load_sample('groupChatReceived-other.json'))
+
+    def test_skipped_sections(self):
+        webhook = decode_webhook(load_sample('taskActivity-daily.json'), sections=())
+        self.assertIsNone(webhook.task)
+        self.assertEqual(webhook.direction, "up")
+
+        chat = decode_webhook(load_sample('groupChatReceived-other.json'), sections={"task"})
+        self.assertIsNone(chat.chat)
+        self.assertEqual(chat.group.name, "ouoertheo_test's Party")
+
+    def test_group_chat(self):
+        for name in ['groupChatReceived-other.json', 'user_chat_webhook.json']:
+            webhook = decode_webhook(load_sample(name))
+            self.assertIsInstance(webhook, GroupChatReceivedWebhook)
+            self.assertIsInstance(webhook.chat, ChatMessage)
+            self.assertEqual(webhook.chat.groupId, webhook.group.id)
+            self.assertEqual(webhook.chat.uuid, "system")
+
+    def test_user_and_quest_activity(self):
+        leveled = decode_webhook({"type": "leveledUp", "initialLvl": 4, "finalLvl": 5, "user": {"_id": "user1"}, "webhookType": "userActivity"})
+        self.assertIsInstance(leveled, UserActivityWebhook)
+        self.assertEqual(leveled.finalLvl, 5)
+        self.assertIsNone(leveled.pet)
+
+        quest = decode_webhook({
+            "type": "questStarted", "group": {"id": "party", "name": "Party"}, "quest": {"key": "dustbunnies"},
+            "user": {"_id": "user1"}, "webhookType": "questActivity",
+        })
+        self.assertIsInstance(quest, QuestActivityWebhook)
+        self.assertEqual(quest.quest["key"], "dustbunnies")
+
+    def test_errors(self):
+        with self.assertRaises(UnknownWebhookException):
+            decode_webhook({"webhookType": "somethingElse"})
+        payload = load_sample('taskActivity-todo.json')
+        del payload['direction']
+        with self.assertRaises(dacite.MissingValueError):
+            decode_webhook(payload)
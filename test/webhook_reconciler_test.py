@@ -0,0 +1,119 @@
+import unittest
+from habitica.habitica_api import HabiticaClient
+from habitica.habitica_service import HabiticaService
+from habitica.rate_limiter import RateLimiter
+from habitica.webhook_reconciler import (
+    DesiredWebhook, WebhookReconciler, WebhookReconcileException, desired_webhooks, plan_webhooks,
+)
+from app.model.app_user import HabiticaUserLink
+from test.habitica_stub_server import HabiticaStubServer
+
+URL = "https://bot.example/habitica"
+
+def webhook(id, type, url=URL, options=None, label="Discord Habitica Webhook", enabled=True) -> dict:
+    return {"id": id, "type": type, "url": url, "options": options or {}, "label": label, "enabled": enabled}
+
+class PlanWebhooksTest(unittest.TestCase):
+    def test_diff(self):
+        desired = [
+            DesiredWebhook("taskActivity", URL, {"scored": True, "created": True}),
+            DesiredWebhook("userActivity", URL, {"leveledUp": True}),
+            DesiredWebhook("questActivity", URL, {"questStarted": True}),
+            DesiredWebhook("groupChatReceived", URL, {"groupId": "party"}),
+        ]
+        existing = [
+            # Up to date, Habitica's extra default options don't count
+            webhook("task", "taskActivity", options={"scored": True, "created": True, "deleted": False}),
+            # Stale URL, a duplicate and a disabled one
+            webhook("user", "userActivity", url="https://old.example/habitica", options={"leveledUp": True}),
+            webhook("user2", "userActivity", options={"leveledUp": True}),
+            webhook("quest", "questActivity", options={"questStarted": True}, enabled=False),
+            # Not the bot's
+            webhook("mine", "groupChatReceived", label="My own webhook"),
+        ]
+        plan = plan_webhooks(existing, desired)
+        self.assertEqual([want.type for want in plan.create], ["groupChatReceived"])
+        self.assertEqual([id for id, _ in plan.update], ["user", "quest"])
+        self.assertEqual(plan.delete, ["user2"])
+
+        self.assertEqual(plan_webhooks(existing, []).delete, ["task", "user", "user2", "quest"])
+        self.assertFalse(plan_webhooks([webhook("task", "taskActivity", options={"scored": True, "created": True})], desired[:1]))
+
+    def test_desired_webhooks(self):
+        types = [want.type for want in desired_webhooks(URL, "party")]
+        self.assertEqual(sorted(types), ["groupChatReceived", "questActivity", "taskActivity", "userActivity"])
+        self.assertNotIn("groupChatReceived", [want.type for want in desired_webhooks(URL)])
+        task = next(want for want in desired_webhooks(URL) if want.type == "taskActivity")
+        self.assertTrue(task.options["deleted"])
+
+class WebhookReconcilerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.server = HabiticaStubServer(latency_seconds=0.01, rate_limit=100000)
+        base_url = await self.server.start()
+        self.client = HabiticaClient(base_url=base_url, rate_limiter=RateLimiter(user_limit=100000, global_limit=100000))
+        self.service = HabiticaService(self.client)
+        self.reconciler = WebhookReconciler(self.client, self.service.get_user_summary, URL, max_concurrency=2, sweep_concurrency=3)
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def webhooks(self, api_user) -> list[dict]:
+        return (await self.client.get_webhooks(api_user, "token"))['data']
+
+    async def test_reconcile_is_idempotent(self):
+        # The sample user has a chat webhook for another party and a disabled task webhook, at another URL
+        plan = await self.reconciler.reconcile("user1", "token")
+        self.assertEqual(len(plan.create), 2)
+        self.assertEqual(len(plan.update), 2)
+        webhooks = await self.webhooks("user1")
+        self.assertTrue(all(hook['url'] == URL and hook['enabled'] for hook in webhooks))
+        self.assertEqual(sorted(hook['type'] for hook in webhooks), ["groupChatReceived", "questActivity", "taskActivity", "userActivity"])
+
+        calls = self.server.calls
+        self.assertFalse(await self.reconciler.reconcile("user1", "token"))
+        self.assertEqual(self.server.calls, calls + 1)
+
+        await self.reconciler.remove_all("user1", "token")
+        self.assertEqual(await self.webhooks("user1"), [])
+
+    async def test_calls_are_bounded_and_concurrent(self):
+        for i in range(6):
+            await self.client.create_webhook("user1", "token", {"url": URL, "label": f"Discord Habitica {i}", "type": "taskActivity"})
+        in_flight = peak = 0
+        delete_webhook = self.client.delete_webhook
+        async def counting_delete(*args):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            try:
+                return await delete_webhook(*args)
+            finally:
+                in_flight -= 1
+        self.client.delete_webhook = counting_delete
+        plan = await self.reconciler.remove_all("user1", "token")
+        self.assertEqual(len(plan.delete), 8)
+        self.assertEqual(peak, 2)
+
+    async def test_failures_are_reported(self):
+        update_webhook = self.client.update_webhook
+        async def failing_update(api_user, api_token, id, payload):
+            if api_user == "user1":
+                raise RuntimeError("update failed")
+            return await update_webhook(api_user, api_token, id, payload)
+        self.client.update_webhook = failing_update
+        with self.assertRaises(WebhookReconcileException):
+            await self.reconciler.reconcile("user1", "token")
+        # The sweep carries on with other users
+        results = await self.reconciler.sweep([HabiticaUserLink("app", "user1", "token"), HabiticaUserLink("app", "user2", "token")])
+        self.assertIsInstance(results["user1"], WebhookReconcileException)
+        self.assertTrue(results["user2"])
+
+    async def test_sweep(self):
+        links = [HabiticaUserLink(f"app{i}", f"user{i}", "token") for i in range(5)]
+        results = await self.reconciler.sweep(links)
+        self.assertEqual(set(results), {f"user{i}" for i in range(5)})
+        self.assertTrue(all(results.values()))
+        # Already up to date on the second sweep
+        results = await self.reconciler.sweep(links)
+        self.assertFalse(any(results.values()))